@@ -0,0 +1,146 @@
+# analytics.py
+import numpy as np
+import pandas as pd
+
+UNKNOWN = "Nežinoma"
+
+# Kubo matavimai: visos analitikos sekcijos grupuoja tik pagal šiuos stulpelius.
+CUBE_DIMS = ["month_ts", "month", "year", "tipas", "kategorija", "prekybos_centras"]
+
+
+def cat_norm(series: pd.Series) -> pd.Series:
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return _cat_norm_categorical(series)
+    return series.fillna("").replace("", UNKNOWN).astype(str).str.strip()
+
+
+def _cat_norm_categorical(series: pd.Series) -> pd.Series:
+    """
+    Normalizuoja tik kategorijų reikšmes (jų – dešimtys), o eilutėms
+    perskaičiuoja kodus – jokių eilutinių string operacijų.
+    """
+    norm = cat_norm(pd.Series(series.cat.categories, dtype=object)).to_numpy(dtype=object)
+    # Paskutinis elementas – NaN (kodas -1) reikšmei
+    uniques, inverse = np.unique(np.append(norm, UNKNOWN), return_inverse=True)
+    codes = inverse[series.cat.codes.to_numpy()]
+    return pd.Series(
+        pd.Categorical.from_codes(codes, categories=uniques),
+        index=series.index,
+        name=series.name,
+    )
+
+
+def norm_category(frame: pd.DataFrame) -> pd.Series:
+    """Normalizuota kategorija: įkėlimo metu paskaičiuotas kat stulpelis arba cat_norm."""
+    if "kat" in frame.columns:
+        return frame["kat"]
+    return cat_norm(frame["kategorija"])
+
+
+def build_cube(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Agreguotas kubas: (mėnuo, tipas, normalizuota kategorija, prekybos vieta)
+    → suma, kiekis, pirma ir paskutinė data.
+
+    Kubas turi tuos pačius stulpelius kaip ir žalias df (tipas, kategorija,
+    suma_eur, month ...), todėl personal_metrics ir kiti helperiai veikia
+    su juo be pakeitimų, tik eilučių yra tiek, kiek mėnesių × kategorijų.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=CUBE_DIMS + ["suma_eur", "cnt", "data_min", "data_max"])
+
+    merchant = df["prekybos_centras"] if "prekybos_centras" in df.columns else pd.Series("", index=df.index)
+    base = pd.DataFrame(
+        {
+            "month_ts": df["month_ts"],
+            "month": df["month"],
+            "year": df["year"],
+            "tipas": df["tipas"],
+            "kategorija": norm_category(df),
+            "prekybos_centras": merchant,
+            "suma_eur": df["suma_eur"],
+            "data": df["data"],
+        }
+    )
+
+    cube = (
+        base.groupby(CUBE_DIMS, as_index=False, sort=True, observed=True, dropna=False)
+        .agg(
+            suma_eur=("suma_eur", "sum"),
+            cnt=("suma_eur", "size"),
+            data_min=("data", "min"),
+            data_max=("data", "max"),
+        )
+    )
+    # Kubas mažas – paprasti stulpeliai, kad tolesni groupby nekurtų nematytų kombinacijų
+    for col in CUBE_DIMS:
+        if isinstance(cube[col].dtype, pd.CategoricalDtype):
+            cube[col] = cube[col].astype(object)
+    return cube
+
+
+def sum_by(cube: pd.DataFrame, keys, value: str = "suma_eur") -> pd.Series:
+    """Sumuoja kubą pagal pateiktus raktus (pvz. "kategorija" arba ["month", "tipas"])."""
+    return cube.groupby(keys, sort=False)[value].sum()
+
+
+def personal_monthly_series(frame: pd.DataFrame, income_categories, food_support_category: str) -> pd.DataFrame:
+    """
+    Asmeninės pajamos / išlaidos / balansas kiekvienam mėnesiui vienu
+    grupavimu – ta pati logika kaip personal_metrics, tik visiems mėnesiams
+    iškart, su kaupiamuoju balansu (cum_balance).
+
+    Tinka ir žaliam df, ir kubui (abu turi month_ts, month, tipas, kategorija, suma_eur).
+    """
+    columns = [
+        "month_ts",
+        "month",
+        "personal_income",
+        "food_support",
+        "total_expense",
+        "personal_expense",
+        "personal_balance",
+        "cum_balance",
+    ]
+    if frame.empty:
+        return pd.DataFrame(columns=columns)
+
+    kat = norm_category(frame)
+    is_income = frame["tipas"] == "Pajamos"
+    amount = frame["suma_eur"].astype(float)
+
+    parts = pd.DataFrame(
+        {
+            "month_ts": frame["month_ts"],
+            "month": frame["month"],
+            "personal_income": amount.where(is_income & kat.isin(income_categories), 0.0),
+            "food_support": amount.where(is_income & (kat == food_support_category), 0.0),
+            "total_expense": amount.where(frame["tipas"] == "Išlaidos", 0.0),
+        }
+    )
+
+    monthly = parts.groupby(["month_ts", "month"], as_index=False, sort=True, observed=True).sum()
+    monthly["personal_expense"] = (monthly["total_expense"] - monthly["food_support"]).clip(lower=0.0)
+    monthly["personal_balance"] = monthly["personal_income"] - monthly["personal_expense"]
+    monthly["cum_balance"] = monthly["personal_balance"].cumsum()
+
+    return monthly[columns]
+
+
+def daily_balance(df: pd.DataFrame) -> pd.DataFrame:
+    """Dienos pinigų srautas (pajamos +, išlaidos −) ir kaupiamasis balansas visai istorijai."""
+    signed = df["suma_eur"].where(df["tipas"] == "Pajamos", -df["suma_eur"])
+    daily = (
+        pd.DataFrame({"data": df["data"], "signed": signed})
+        .groupby("data", as_index=False, sort=True)["signed"]
+        .sum()
+    )
+    daily["balansas"] = daily["signed"].cumsum()
+    return daily
+
+
+def small_expenses(df: pd.DataFrame, month: str, cap: float):
+    """Mėnesio išlaidos, ne didesnės už cap: (kiekis, suma)."""
+    rows = df.loc[(df["month"] == month) & (df["tipas"] == "Išlaidos"), "suma_eur"]
+    small = rows[rows <= float(cap)]
+    return int(len(small)), float(small.sum())
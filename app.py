@@ -1,18 +1,70 @@
-import io
+import collections
+import functools
+import math
+import time
+import uuid
 from datetime import date, timedelta
 
+import numpy as np
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
 import streamlit as st
-from supabase import create_client
+from supabase import ClientOptions, create_client
 from supabase.client import Client
 
+from analytics import build_cube, daily_balance, norm_category, personal_monthly_series, small_expenses, sum_by
+from auth_session import TokenRefresher, TokenState
+from batch_writes import WriteBatch, commit_batch
+from categorizer import RULE_KINDS, Rule, categorize_frame, compile_rules
+from client_pool import ClientPool
+from concurrent_fetch import fetch_concurrently
+from charts import line_figure, top_n_with_other
+from data_store import SYNC_TTL_SECONDS, get_user_store
+from exports import EXCEL_MAX_ROWS, EXPORT_FORMATS, export_bytes
+from http_transport import HttpLayer, HttpSettings
+from filter_index import SEARCH_MODES, build_filter_index, build_text_index, filtered_view
+from import_pipeline import (
+    CHUNK_ROWS,
+    SCHEMA_FIELDS,
+    guess_mapping,
+    iter_csv_chunks,
+    iter_xlsx_chunks,
+    map_chunk,
+    run_import,
+    xlsx_row_count,
+)
+from projection import (
+    GRID_MAX_COMBOS,
+    GRID_PARAMS,
+    MC_PATHS,
+    TARGET_HORIZON,
+    months_to_many,
+    project,
+    project_many,
+    scenario_net,
+    simulate,
+)
+from server_aggregates import fetch_cube, fetch_daily_balance, fetch_small_expenses
+
 st.set_page_config(page_title="💶 Asmeninis biudžetas", layout="wide")
 
+# Viso rerun trukmė ir CPU laikas rodomi „Diagnostika“ skiltyje. CPU – tik šio
+# skripto gijos: process_time skaičiuotų ir kitų tuo metu veikiančių sesijų darbą
+RUN_STARTED = time.perf_counter()
+RUN_CPU_STARTED = time.thread_time()
+# Pilno rerun žyma: sekcija, paleista antrą kartą su ta pačia žyma, buvo fragmento rerun
+st.session_state["run_token"] = RUN_STARTED
+
 # ======================================================
 # KONFIGŪRACIJA
 # ======================================================
 TABLE = "biudzetas"
+RULES_TABLE = "biudzetas_rules"
+SCENARIOS_TABLE = "biudzetas_scenarios"
+# sql/005_batch_update.sql – skirtingi redaktoriaus pakeitimai vienu kvietimu
+UPDATE_ROWS_RPC = "biudzetas_update_rows"
 CURRENCY = "€"
 
 # Tikros tavo pajamos asmeniniams KPI / pagalvei / prediction
@@ -55,45 +107,117 @@ EXPENSE_ONLY_CATEGORIES = [
 # ======================================================
 # SUPABASE
 # ======================================================
+# Vienas keep-alive ryšių telkinys visiems klientams (PostgREST ir GoTrue)
 @st.cache_resource(show_spinner=False)
-def get_supabase() -> Client:
-    return create_client(
+def get_http_layer() -> HttpLayer:
+    return HttpLayer(HttpSettings.from_secrets(st.secrets.get("http")))
+
+
+def _new_client() -> Client:
+    # Token'us valdo auth_session, todėl kliento gotrue automatinis atnaujinimas išjungtas
+    layer = get_http_layer()
+    client = create_client(
         st.secrets["supabase"]["url"],
         st.secrets["supabase"]["anon_key"],
+        options=ClientOptions(
+            auto_refresh_token=False,
+            persist_session=False,
+            postgrest_client_timeout=layer.settings.timeout(),
+        ),
     )
+    return layer.attach(client)
 
 
+@st.cache_resource(show_spinner=False)
+def get_supabase() -> Client:
+    return _new_client()
+
+
+# Bendras klientas – tik prisijungimui / registracijai; duomenims – sesijos klientas iš telkinio
 supabase = get_supabase()
 
+
+@st.cache_resource(show_spinner=False)
+def get_client_pool() -> ClientPool:
+    return ClientPool(_new_client)
+
+
+@st.cache_resource(show_spinner=False)
+def get_token_refresher() -> TokenRefresher:
+    return TokenRefresher(
+        st.secrets["supabase"]["url"],
+        st.secrets["supabase"]["anon_key"],
+        http_client=get_http_layer().client(),
+    )
+
+
+# Analitika iš serverio agregatų (sql/003_aggregates.sql) – žalios eilutės
+# tada įkeliamos tik redaktoriui / eksportui. Įjungiama secrets.toml:
+# [analytics]
+# server_aggregates = true
+SERVER_AGGREGATES = bool(st.secrets.get("analytics", {}).get("server_aggregates", False))
+
 # ======================================================
 # AUTH
 # ======================================================
+def _record_auth(op: str, ms: float) -> None:
+    """Auth trukmė rodoma „Diagnostika“ atskirai nuo viso rerun."""
+    st.session_state.setdefault("auth_timings", {})[op] = {"ms": ms, "at": time.time()}
+
+
 def _store_session(session) -> None:
     if session is None:
         st.session_state.pop("sb_session", None)
         return
-    st.session_state["sb_session"] = {
-        "access_token": session.access_token,
-        "refresh_token": session.refresh_token,
-    }
+    st.session_state["sb_session"] = TokenState.from_session(session)
 
 
 def _restore_session() -> bool:
-    s = st.session_state.get("sb_session")
-    if not s:
-        return False
-    try:
-        supabase.auth.set_session(s["access_token"], s["refresh_token"])
-        supabase.auth.get_user()
-        return True
-    except Exception:
-        st.session_state.pop("sb_session", None)
+    """
+    Token tikrinamas vietoje pagal exp – tinklas naudojamas tik atnaujinimui.
+    Likus REFRESH_AHEAD_SECONDS iki exp, atnaujinama fone; nebegaliojantis
+    token atnaujinamas iškart. PostgREST klientui jis pritaikomas per ClientPool.
+    """
+    state = st.session_state.get("sb_session")
+    if not isinstance(state, TokenState):
         return False
 
+    started = time.perf_counter()
+    refresher = get_token_refresher()
+
+    pending = st.session_state.get("auth_refresh")
+    if pending is not None and pending.done():
+        st.session_state.pop("auth_refresh", None)
+        try:
+            state, ms = pending.result()
+            _record_auth("Atnaujinimas fone", ms)
+        except Exception:
+            pass
+
+    if not state.is_valid():
+        try:
+            state, ms = refresher.refresh(state)
+            _record_auth("Atnaujinimas", ms)
+        except Exception:
+            st.session_state.pop("sb_session", None)
+            st.session_state.pop("authenticated", None)
+            return False
+    elif state.should_refresh() and "auth_refresh" not in st.session_state:
+        st.session_state["auth_refresh"] = refresher.submit(state)
+
+    st.session_state["sb_session"] = state
+    if "authenticated" not in st.session_state and state.email:
+        st.session_state["authenticated"] = True
+        st.session_state["email"] = state.email
+    _record_auth("Vietinis patikrinimas", (time.perf_counter() - started) * 1000)
+    return True
+
 
 def login(email: str, password: str):
     try:
+        started = time.perf_counter()
         res = supabase.auth.sign_in_with_password({"email": email, "password": password})
+        _record_auth("Prisijungimas", (time.perf_counter() - started) * 1000)
         _store_session(res.session)
         return True, ""
     except Exception as e:
@@ -122,25 +246,21 @@ def send_magic_link(email: str):
 
 
 def logout():
+    state = st.session_state.get("sb_session")
     try:
-        supabase.auth.sign_out()
+        if isinstance(state, TokenState):
+            get_token_refresher().sign_out(state)
+        else:
+            supabase.auth.sign_out()
     except Exception:
         pass
+    get_client_pool().discard(st.session_state.get("client_session_id", ""))
     st.session_state.clear()
     st.rerun()
 
 
 _restore_session()
 
-if "authenticated" not in st.session_state:
-    try:
-        u = supabase.auth.get_user()
-        if u and getattr(u, "user", None) and getattr(u.user, "email", None):
-            st.session_state["authenticated"] = True
-            st.session_state["email"] = u.user.email
-    except Exception:
-        pass
-
 if "authenticated" not in st.session_state:
     st.title("🔐 Prisijungimas")
 
@@ -186,6 +306,14 @@ if "authenticated" not in st.session_state:
     st.stop()
 
 USER_EMAIL = st.session_state["email"]
+
+# Toliau visos užklausos – per šios naršyklės sesijos klientą su jos token'u
+SESSION_ID = st.session_state.setdefault("client_session_id", uuid.uuid4().hex)
+_token = st.session_state.get("sb_session")
+supabase = get_client_pool().acquire(
+    SESSION_ID, USER_EMAIL, _token.access_token if isinstance(_token, TokenState) else None
+)
+
 st.sidebar.success(f"👤 {USER_EMAIL}")
 if st.sidebar.button("🚪 Atsijungti"):
     logout()
@@ -200,18 +328,15 @@ def money(x: float) -> str:
         return f"0.00 {CURRENCY}"
 
 
-def add_month_start(dt: pd.Timestamp, n: int) -> pd.Timestamp:
-    return (pd.Timestamp(dt).to_period("M") + n).to_timestamp()
-
-
-def cat_norm(series: pd.Series) -> pd.Series:
-    return series.fillna("").replace("", "Nežinoma").astype(str).str.strip()
-
-
 def norm_text(x: str) -> str:
     return str(x or "").strip().casefold()
 
 
+# Normalizuotos aibės skaičiuojamos vieną kartą, ne kiekvienam validacijos kvietimui
+INCOME_ONLY_NORM = frozenset(norm_text(x) for x in INCOME_ONLY_CATEGORIES)
+EXPENSE_ONLY_NORM = frozenset(norm_text(x) for x in EXPENSE_ONLY_CATEGORIES)
+
+
 def validate_category_type(tipas: str, kategorija: str):
     """
     Grąžina:
@@ -221,19 +346,16 @@ def validate_category_type(tipas: str, kategorija: str):
     k = norm_text(kategorija)
     t = norm_text(tipas)
 
-    income_only = {norm_text(x) for x in INCOME_ONLY_CATEGORIES}
-    expense_only = {norm_text(x) for x in EXPENSE_ONLY_CATEGORIES}
-
     if not k or k == norm_text("Nežinoma"):
         return "ok", ""
 
-    if k in income_only and t == norm_text("išlaidos"):
+    if k in INCOME_ONLY_NORM and t == norm_text("išlaidos"):
         return (
             "error",
             f"Kategorija „{kategorija}“ paprastai turi būti priskirta prie pajamų, ne išlaidų.",
         )
 
-    if k in expense_only and t == norm_text("pajamos"):
+    if k in EXPENSE_ONLY_NORM and t == norm_text("pajamos"):
         return (
             "error",
             f"Kategorija „{kategorija}“ paprastai turi būti priskirta prie išlaidų, ne pajamų.",
@@ -249,17 +371,41 @@ def validate_category_type(tipas: str, kategorija: str):
     return "ok", ""
 
 
+def validate_category_types(tipas: pd.Series, kategorija: pd.Series) -> pd.Series:
+    """
+    Vektorinė validate_category_type versija visam stulpeliui (importui).
+    Grąžina "ok" / "warning" / "error" kiekvienai eilutei.
+    """
+    k = kategorija.astype(object).fillna("").astype(str).str.strip().str.casefold()
+    t = tipas.astype(object).fillna("").astype(str).str.strip().str.casefold()
+
+    known = (k != "") & (k != norm_text("Nežinoma"))
+    error = known & (
+        (k.isin(INCOME_ONLY_NORM) & (t == norm_text("išlaidos")))
+        | (k.isin(EXPENSE_ONLY_NORM) & (t == norm_text("pajamos")))
+    )
+    warning = (
+        known
+        & ~error
+        & k.str.contains("maist", regex=False)
+        & (t == norm_text("pajamos"))
+        & (k != norm_text(FOOD_SUPPORT_CATEGORY))
+    )
+
+    return pd.Series("ok", index=k.index).mask(warning, "warning").mask(error, "error")
+
+
 def personal_income_mask(df_in: pd.DataFrame) -> pd.Series:
     return (
         (df_in["tipas"] == "Pajamos")
-        & (cat_norm(df_in["kategorija"]).isin(PERSONAL_INCOME_CATEGORIES))
+        & (norm_category(df_in).isin(PERSONAL_INCOME_CATEGORIES))
     )
 
 
 def food_support_mask(df_in: pd.DataFrame) -> pd.Series:
     return (
         (df_in["tipas"] == "Pajamos")
-        & (cat_norm(df_in["kategorija"]) == FOOD_SUPPORT_CATEGORY)
+        & (norm_category(df_in) == FOOD_SUPPORT_CATEGORY)
     )
 
 
@@ -288,6 +434,40 @@ def personal_metrics(df_in: pd.DataFrame):
     )
 
 
+def scenario_base(cube: pd.DataFrame, lookback: int, reduce_category: str = None) -> dict:
+    """
+    Prediction bazė pagal paskutinių lookback mėn. vidurkį. Ta pati funkcija
+    naudojama ir aktyviam scenarijui, ir išsaugotiems scenarijams perskaičiuoti.
+    """
+    month_base = (
+        cube.groupby(["month_ts", "month"], as_index=False)
+        .agg(dummy=("cnt", "sum"))
+        .sort_values("month_ts")
+    )
+    recent_months = month_base.tail(lookback)["month"].tolist()
+    recent_df = cube[cube["month"].isin(recent_months)]
+    income, food_support, total_expense, personal_expense, _ = personal_metrics(recent_df)
+    n = max(1, lookback)
+
+    cat_recent = recent_df[recent_df["tipas"] == "Išlaidos"]
+
+    return {
+        "cat_recent": cat_recent,
+        "income": income / n,
+        "food_support": food_support / n,
+        "total_expense": total_expense / n,
+        "personal_expense": personal_expense / n,
+        "category_avg": category_avg(cat_recent, reduce_category, lookback),
+    }
+
+
+def category_avg(cat_recent: pd.DataFrame, reduce_category: str, lookback: int) -> float:
+    """Vid. mėnesio išlaidos kategorijai, kurią scenarijus mažina (0 – jei nemažinama)."""
+    if not reduce_category or reduce_category == "Jokių pakeitimų" or cat_recent.empty:
+        return 0.0
+    return float(cat_recent.loc[cat_recent["kategorija"] == reduce_category, "suma_eur"].sum() / max(1, lookback))
+
+
 def tone_by_value(x: float) -> str:
     if x > 0:
         return "positive"
@@ -322,6 +502,63 @@ def clamp_int_session_value(key: str, min_value: int, max_value: int, default_va
     return current
 
 
+def _py(value):
+    """numpy skaliarus paverčia Python tipais (JSON / Supabase užklausoms)."""
+    return value.item() if hasattr(value, "item") else value
+
+
+def collect_editor_changes(page_df: pd.DataFrame, editor_state: dict):
+    """
+    st.data_editor būseną (edited_rows / added_rows / deleted_rows) paverčia
+    pilnomis eilutėmis. Grąžina (nauji, pakeisti, ištrintų id).
+    """
+    deleted_pos = {int(i) for i in editor_state.get("deleted_rows", [])}
+    deleted_ids = [_py(page_df.iloc[i]["id"]) for i in sorted(deleted_pos)]
+
+    updates = []
+    for pos, patch in editor_state.get("edited_rows", {}).items():
+        pos = int(pos)
+        if pos in deleted_pos:
+            continue
+        row = {k: _py(v) for k, v in page_df.iloc[pos].to_dict().items()}
+        row.update(patch)
+        updates.append(row)
+
+    inserts = [
+        dict(r)
+        for r in editor_state.get("added_rows", [])
+        if any(v not in (None, "") for v in r.values())
+    ]
+    return inserts, updates, deleted_ids
+
+
+def timed_fragment(name: str):
+    """
+    st.fragment su laiko matavimu: sekcija perskaičiuojama atskirai, kai keičiasi
+    tik jos valdikliai, o trukmė (pilnas rerun ar fragmentas) rodoma „Diagnostika“.
+    """
+
+    def wrap(fn):
+        @st.fragment
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            t0 = time.perf_counter()
+            fn(*args, **kwargs)
+            ms = (time.perf_counter() - t0) * 1000
+
+            timings = st.session_state.setdefault("section_timings", {})
+            previous = timings.get(name, {})
+            token = st.session_state.get("run_token")
+            kind = "fragmentas" if previous.get("token") == token else "pilnas rerun"
+            timings[name] = {"token": token, "kind": kind, "ms": ms}
+            if st.session_state.get("show_section_timings"):
+                st.caption(f"⏱️ {name}: {ms:.0f} ms ({kind})")
+
+        return run
+
+    return wrap
+
+
 # ======================================================
 # KPI UI
 # ======================================================
@@ -414,72 +651,315 @@ st.markdown(
 # ======================================================
 # DATA
 # ======================================================
-@st.cache_data(ttl=60, show_spinner=False)
-def fetch_user_data(email: str) -> pd.DataFrame:
-    data = (
-        supabase.table(TABLE)
-        .select("*")
-        .eq("user_email", email)
-        .order("data", desc=False)
-        .execute()
-        .data
-        or []
+def fetch_user_data(email: str):
+    """Grąžina (df, duomenų versija) – versija naudojama išvestinių kešų raktuose."""
+    return get_user_store(TABLE).get_versioned(supabase, email)
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def get_cube(email: str, version: int, _df: pd.DataFrame) -> pd.DataFrame:
+    return build_cube(_df)
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def get_personal_series(email: str, version, _cube: pd.DataFrame) -> pd.DataFrame:
+    return personal_monthly_series(_cube, PERSONAL_INCOME_CATEGORIES, FOOD_SUPPORT_CATEGORY)
+
+
+# Monte Carlo kešuojamas pagal duomenų versiją ir visą scenarijaus parametrų rinkinį
+@st.cache_data(show_spinner=False, max_entries=32)
+def get_monte_carlo(
+    email: str,
+    version,
+    start_balance: float,
+    monthly_net: float,
+    release_amount: float,
+    release_month: int,
+    horizon: int,
+    targets: tuple,
+    n_paths: int,
+    _history,
+):
+    return simulate(
+        start_balance,
+        monthly_net,
+        _history,
+        release_amount,
+        release_month,
+        horizon,
+        targets,
+        n_paths=n_paths,
+    )
+
+
+# Tinklelis ir išsaugoti scenarijai memoizuojami pagal parametrų rinkinį (tuple)
+@st.cache_data(show_spinner=False, max_entries=32)
+def get_scenario_grid(
+    email: str,
+    version,
+    start_balance: float,
+    base_income: float,
+    base_expense: float,
+    category_avg_monthly: float,
+    release_amount: float,
+    horizon: int,
+    grid: tuple,
+) -> pd.DataFrame:
+    """Visi GRID_PARAMS reikšmių deriniai vienu vektoriniu skaičiavimu."""
+    mesh = np.meshgrid(*[np.asarray(values, dtype=float) for values in grid], indexing="ij")
+    params = dict(zip(GRID_PARAMS, (m.ravel() for m in mesh)))
+
+    _, expense, net = scenario_net(
+        base_income,
+        base_expense,
+        category_avg_monthly,
+        params["monthly_income_change"],
+        params["reduce_pct"],
+        params["recurring_extra_saving"],
+    )
+    balance = project_many(
+        start_balance, net, release_amount, params["release_start_month"], max(horizon, TARGET_HORIZON)
+    )
+
+    out = pd.DataFrame(params)
+    out["final_balance"] = balance[:, horizon - 1]
+    for k in (3, 6, 12):
+        out[f"months_to_{k}"] = months_to_many(balance, expense * k)
+    return out
+
+
+# Išsaugoto scenarijaus parametrų tvarka (tuple – memoizacijos raktas)
+SCENARIO_FIELDS = (
+    "lookback",
+    "reduce_category",
+    "reduce_pct",
+    "monthly_income_change",
+    "recurring_extra_saving",
+    "released_monthly_after",
+    "release_start_month",
+    "one_time_boost",
+)
+
+
+# Kaip ir taisyklėms – proceso lygio versija vartotojui, kad scenarijai matytųsi visose sesijose
+@st.cache_resource(show_spinner=False)
+def get_scenario_versions() -> collections.Counter:
+    return collections.Counter()
+
+
+@st.cache_data(show_spinner=False, ttl=600, max_entries=64)
+def fetch_scenarios(email: str, scenarios_version: int) -> dict:
+    """Išsaugoti scenarijai (sql/004_saved_scenarios.sql): pavadinimas → parametrų tuple."""
+    res = supabase.table(SCENARIOS_TABLE).select("name, params").eq("user_email", email).order("id").execute()
+    return {r["name"]: tuple(r["params"].get(f) for f in SCENARIO_FIELDS) for r in res.data or []}
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def get_saved_projection(email: str, version, params: tuple, horizon: int, _cube: pd.DataFrame):
+    """Išsaugotas scenarijus perskaičiuojamas su dabartiniais duomenimis: (mėn. išlaidos, Projection)."""
+    p = dict(zip(SCENARIO_FIELDS, params))
+    base = scenario_base(_cube, p["lookback"], p["reduce_category"])
+    _, expense, net = scenario_net(
+        base["income"],
+        base["personal_expense"],
+        base["category_avg"],
+        p["monthly_income_change"],
+        p["reduce_pct"],
+        p["recurring_extra_saving"],
+    )
+    projection = project(
+        personal_metrics(_cube)[4] + p["one_time_boost"],
+        float(net),
+        p["released_monthly_after"],
+        p["release_start_month"],
+        horizon=max(horizon, TARGET_HORIZON),
+    )
+    return float(expense), projection
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def get_daily_balance(email: str, version, _df: pd.DataFrame) -> pd.DataFrame:
+    return daily_balance(_df)
+
+
+# Serverio agregatai kešuojami pagal versiją; TTL – kad matytųsi ir kitų įrenginių pakeitimai
+@st.cache_data(show_spinner=False, ttl=SYNC_TTL_SECONDS, max_entries=64)
+def get_server_cube(email: str, version: int) -> pd.DataFrame:
+    return fetch_cube(supabase, email)
+
+
+@st.cache_data(show_spinner=False, ttl=SYNC_TTL_SECONDS, max_entries=64)
+def get_server_daily_balance(email: str, version: int) -> pd.DataFrame:
+    return fetch_daily_balance(supabase, email)
+
+
+@st.cache_data(show_spinner=False, ttl=SYNC_TTL_SECONDS, max_entries=256)
+def get_server_small_expenses(email: str, version: int, month: str, cap: float):
+    return fetch_small_expenses(supabase, email, month, cap)
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def get_filter_index(email: str, version: int, _df: pd.DataFrame):
+    """Filtrų indeksas kuriamas vieną kartą kiekvienai duomenų versijai (kešuojamas be kopijavimo)."""
+    return build_filter_index(_df)
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def get_search_index(email: str, version, _cube: pd.DataFrame) -> dict:
+    """Unikalių kategorijų ir prekybos vietų paieškos indeksai (iš kubo – veikia ir serverio režime)."""
+    return {col: build_text_index(_cube[col]) for col in ["kategorija", "prekybos_centras"]}
+
+
+# Failai kešuojami pagal (vartotojas, versija, filtrai, formatas); keli įrašai, kad atmintis būtų ribota
+@st.cache_data(show_spinner=False, ttl=600, max_entries=8)
+def build_export(email: str, version: int, filter_key: tuple, fmt: str, _rows: pd.DataFrame) -> bytes:
+    return export_bytes(_rows, fmt)
+
+
+# Grafikai kuriami vieną kartą versijai (ir filtrams); kešuojamas jau sumažinto
+# figure JSON (ne gyvas objektas, kurį plotly_chart galėtų pakeisti)
+@st.cache_data(show_spinner=False, max_entries=32)
+def get_balance_figure(email: str, version, _daily: pd.DataFrame) -> str:
+    return line_figure(_daily, "data", "balansas", "Kaupiamasis bendras balansas (visa istorija)").to_json()
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def get_monthly_figure(email: str, version, filter_key: tuple, _cube_f: pd.DataFrame):
+    monthly = (
+        _cube_f.groupby(["month_ts", "month", "tipas"], as_index=False)["suma_eur"]
+        .sum()
+        .rename(columns={"month_ts": "ym_sort", "month": "ym"})
+        .sort_values("ym_sort")
     )
 
-    df_local = pd.DataFrame(data)
-    if df_local.empty:
-        return df_local
+    fig_bar = px.bar(
+        monthly,
+        x="ym",
+        y="suma_eur",
+        color="tipas",
+        barmode="group",
+        title="Pajamos vs Išlaidos (pagal filtrą)",
+    )
+    fig_bar.update_xaxes(type="category")
+    return fig_bar.to_json()
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def get_category_chart(email: str, version, filter_key: tuple, _exp_f: pd.DataFrame):
+    """(figure JSON, lentelė) – grafike tik didžiausios kategorijos, lentelėje visos."""
+    cat_sum = (
+        _exp_f.groupby("kategorija", as_index=False)["suma_eur"]
+        .sum()
+        .sort_values("suma_eur", ascending=True)
+    )
+
+    fig_cat = px.bar(
+        top_n_with_other(cat_sum, "kategorija", "suma_eur").sort_values("suma_eur", ascending=True),
+        x="suma_eur",
+        y="kategorija",
+        orientation="h",
+        title="Išlaidos pagal kategorijas",
+    )
+    return fig_cat.to_json(), cat_sum.sort_values("suma_eur", ascending=False)
+
+
+def raw_rows(loaded: pd.DataFrame, version: int):
+    """
+    (eilutės, jų versija); serverio agregatų režime (loaded=None) įkeliamos tik
+    jų prireikus – abu imami kartu iš saugyklos, nes įkėlimas gali pakeisti versiją.
+    """
+    if loaded is not None:
+        return loaded, version
+    return fetch_user_data(USER_EMAIL)
+
+
+# Taisyklių versija – proceso lygio skaitiklis kiekvienam vartotojui, kad išsaugojus
+# taisykles kituose skirtukuose, sesijose ir po perkrovimo nebūtų rodomos senos
+@st.cache_resource(show_spinner=False)
+def get_rules_versions() -> collections.Counter:
+    return collections.Counter()
+
 
-    df_local["data"] = pd.to_datetime(df_local["data"], errors="coerce")
-    df_local = df_local.dropna(subset=["data"])
-    df_local["suma_eur"] = pd.to_numeric(df_local["suma_eur"], errors="coerce").fillna(0.0)
+@st.cache_data(show_spinner=False, ttl=600, max_entries=64)
+def fetch_rules(email: str, rules_version: int) -> list:
+    """Vartotojo kategorizavimo taisyklės; rules_version keičiamas jas išsaugojus."""
+    res = supabase.table(RULES_TABLE).select("*").eq("user_email", email).order("id").execute()
+    return res.data or []
 
-    for col in ["kategorija", "prekybos_centras", "aprasymas", "tipas"]:
-        if col in df_local.columns:
-            df_local[col] = df_local[col].fillna("").astype(str)
 
-    df_local["year"] = df_local["data"].dt.year
-    df_local["month"] = df_local["data"].dt.to_period("M").astype(str)
-    df_local["month_ts"] = df_local["data"].dt.to_period("M").dt.to_timestamp()
+@st.cache_resource(show_spinner=False, ttl=600, max_entries=64)
+def get_rule_index(email: str, rules_version: int):
+    """Taisyklės sukompiliuojamos į indeksą vieną kartą kiekvienai jų versijai."""
+    try:
+        rows = fetch_rules(email, rules_version)
+    except Exception:
+        # Lentelė dar nesukurta (sql/002_category_rules.sql) – veikiame be taisyklių
+        rows = []
+    return compile_rules(Rule.from_row(r) for r in rows)
+
 
-    return df_local
+def auto_categorize(frame: pd.DataFrame, only_unknown: bool = True) -> pd.Series:
+    """
+    Kategorijos pagal taisykles visam frame vienu kartu. Jei taisyklės
+    kategorija prieštarauja tipui (validacijos "error"), paliekama sena.
+    """
+    index = get_rule_index(USER_EMAIL, get_rules_versions()[USER_EMAIL])
+    current = frame["kategorija"].astype(object).fillna("").astype(str)
+    if len(index) == 0 or frame.empty:
+        return current
+    found = categorize_frame(frame, index, only_unknown=only_unknown)
+    return found.mask(validate_category_types(frame["tipas"], found) == "error", current)
+
+
+def _row_payload(d, tipas, kategorija, prekyba, aprasymas, suma) -> dict:
+    return {
+        "data": d.isoformat(),
+        "tipas": tipas,
+        "kategorija": (kategorija or "").strip() or "Nežinoma",
+        "prekybos_centras": (prekyba or "").strip(),
+        "aprasymas": (aprasymas or "").strip(),
+        "suma_eur": float(suma),
+    }
+
+
+def _user_row(d, tipas, kategorija, prekyba, aprasymas, suma) -> dict:
+    return {"user_email": USER_EMAIL, **_row_payload(d, tipas, kategorija, prekyba, aprasymas, suma)}
+
+
+def apply_batch(batch: WriteBatch) -> None:
+    """
+    Visas batch pritaikomas kešui vienu kartu ir išsiunčiamas vienu fono
+    commit'u (update in_ / RPC / delete in_ / insert), o ne po užklausą
+    kiekvienai eilutei. batch.updates – tik pakeisti stulpeliai.
+    """
+    if batch.is_empty():
+        return
+
+    store = get_user_store(TABLE)
+    store.optimistic_write(
+        USER_EMAIL,
+        lambda: commit_batch(supabase, TABLE, batch, update_rpc=UPDATE_ROWS_RPC),
+        upserts=[{**r, "id": store.temp_id()} for r in batch.inserts],
+        patches=batch.updates,
+        deleted_ids=batch.deletes,
+    )
+
+
+def _changed_fields(row: dict, original: dict) -> dict:
+    """Tik pakeisti stulpeliai – į serverį nesiunčiama visa eilutė."""
+    return {k: v for k, v in row.items() if original.get(k) != v}
 
 
 def insert_row(d, tipas, kategorija, prekyba, aprasymas, suma):
-    supabase.table(TABLE).insert(
-        {
-            "user_email": USER_EMAIL,
-            "data": d.isoformat(),
-            "tipas": tipas,
-            "kategorija": (kategorija or "").strip() or "Nežinoma",
-            "prekybos_centras": (prekyba or "").strip(),
-            "aprasymas": (aprasymas or "").strip(),
-            "suma_eur": float(suma),
-        }
-    ).execute()
-    st.cache_data.clear()
-    st.rerun()
+    apply_batch(WriteBatch(inserts=[_user_row(d, tipas, kategorija, prekyba, aprasymas, suma)]))
 
 
 def delete_row(row_id):
-    supabase.table(TABLE).delete().eq("id", row_id).execute()
-    st.cache_data.clear()
-    st.rerun()
+    apply_batch(WriteBatch(deletes=[row_id]))
 
 
 def update_row(row_id, d, tipas, kategorija, prekyba, aprasymas, suma):
-    supabase.table(TABLE).update(
-        {
-            "data": d.isoformat(),
-            "tipas": tipas,
-            "kategorija": (kategorija or "").strip() or "Nežinoma",
-            "prekybos_centras": (prekyba or "").strip(),
-            "aprasymas": (aprasymas or "").strip(),
-            "suma_eur": float(suma),
-        }
-    ).eq("id", row_id).execute()
-    st.cache_data.clear()
-    st.rerun()
+    apply_batch(WriteBatch(updates=[{"id": row_id, **_user_row(d, tipas, kategorija, prekyba, aprasymas, suma)}]))
 
 
 # ======================================================
@@ -487,6 +967,23 @@ def update_row(row_id, d, tipas, kategorija, prekyba, aprasymas, suma):
 # ======================================================
 st.title("💶 Asmeninis biudžetas")
 
+for write_error in get_user_store(TABLE).pop_errors(USER_EMAIL):
+    st.error("❌ Serveris atmetė pakeitimą – rodoma serverio būsena.")
+    st.caption(f"Techninė klaida: {write_error}")
+
+
+@st.fragment(run_every=1)
+def render_pending_writes():
+    """Kol pakeitimai saugomi fone – rodoma būsena; jiems baigus, puslapis perpiešiamas (ir atmetimai parodomi iškart)."""
+    if get_user_store(TABLE).pending(USER_EMAIL):
+        st.caption("⏳ Pakeitimai saugomi serveryje... Jei serveris juos atmes, jie bus atšaukti ir apie tai pranešta čia.")
+    else:
+        st.rerun()
+
+
+if get_user_store(TABLE).pending(USER_EMAIL):
+    render_pending_writes()
+
 with st.expander("➕ Naujas įrašas", expanded=True):
     with st.form("entry"):
         c1, c2, c3 = st.columns(3)
@@ -516,22 +1013,337 @@ with st.expander("➕ Naujas įrašas", expanded=True):
                 if status == "warning":
                     st.warning(message)
                 insert_row(d, tipas, kategorija, prekyba, aprasymas, suma)
+                st.rerun()
+
+with st.expander("📥 Importas iš banko išrašo (CSV / XLSX)", expanded=False):
+    upload = st.file_uploader("Išrašo failas", type=["csv", "xlsx"], key="import_file")
+
+    if upload is not None:
+        is_xlsx = upload.name.lower().endswith(".xlsx")
+        i1, i2, i3, i4 = st.columns(4)
+        with i1:
+            csv_sep = st.selectbox(
+                "Skirtukas",
+                [";", ",", "\t"],
+                format_func=lambda x: "TAB" if x == "\t" else x,
+                disabled=is_xlsx,
+                key="import_sep",
+            )
+        with i2:
+            csv_encoding = st.selectbox("Koduotė", ["utf-8", "cp1257", "utf-16"], disabled=is_xlsx, key="import_enc")
+        with i3:
+            decimal_sep = st.selectbox("Dešimtainis skirtukas", [",", "."], key="import_decimal")
+        with i4:
+            dayfirst = st.checkbox("Diena pirma (31.12.2024)", value=False, key="import_dayfirst")
+
+        def open_chunks(chunk_rows: int = CHUNK_ROWS):
+            upload.seek(0)
+            if is_xlsx:
+                return iter_xlsx_chunks(upload, chunk_rows=chunk_rows)
+            return iter_csv_chunks(upload, sep=csv_sep, encoding=csv_encoding, chunk_rows=chunk_rows)
+
+        try:
+            preview = next(open_chunks(chunk_rows=5), pd.DataFrame())
+        except Exception as e:
+            preview = pd.DataFrame()
+            st.error("❌ Nepavyko perskaityti failo.")
+            st.caption(f"Techninė klaida: {e}")
+
+        if not preview.empty:
+            st.dataframe(preview, use_container_width=True, hide_index=True)
+
+            guessed = guess_mapping(preview.columns.tolist())
+            source_options = ["—"] + preview.columns.tolist()
+            field_labels = {
+                "data": "Data",
+                "suma_eur": "Suma",
+                "tipas": "Tipas (nebūtina – pagal sumos ženklą)",
+                "kategorija": "Kategorija",
+                "prekybos_centras": "Prekybos vieta / gavėjas",
+                "aprasymas": "Aprašymas",
+            }
+            mapping = {}
+            map_cols = st.columns(3)
+            for i, fld in enumerate(SCHEMA_FIELDS):
+                with map_cols[i % 3]:
+                    choice = st.selectbox(
+                        field_labels[fld],
+                        source_options,
+                        index=source_options.index(guessed[fld]) if guessed.get(fld) else 0,
+                        key=f"import_map_{fld}",
+                    )
+                mapping[fld] = None if choice == "—" else choice
+
+            if not mapping["data"] or not mapping["suma_eur"]:
+                st.info("Susiek bent datos ir sumos stulpelius.")
+            elif st.button("📥 Importuoti"):
+                progress = st.progress(0.0, text="Importuojama...")
+                file_size = max(1, upload.size)
+                if is_xlsx:
+                    upload.seek(0)
+                    xlsx_rows = xlsx_row_count(upload)
+
+                def report(res):
+                    if is_xlsx:
+                        done = min(1.0, res.total_rows / xlsx_rows) if xlsx_rows else 0.0
+                    else:
+                        done = min(1.0, upload.tell() / file_size)
+                    progress.progress(done, text=f"Apdorota {res.total_rows} eil., importuota {res.imported}")
+
+                def to_rows(chunk):
+                    rows = map_chunk(chunk, mapping, USER_EMAIL, decimal=decimal_sep, dayfirst=dayfirst)
+                    # Tuščios / „Nežinoma“ kategorijos užpildomos taisyklėmis visam gabalui iškart
+                    return rows.assign(kategorija=auto_categorize(rows))
+
+                try:
+                    import_result = run_import(
+                        open_chunks(),
+                        to_rows=to_rows,
+                        validate=validate_category_types,
+                        write=lambda records: commit_batch(supabase, TABLE, WriteBatch(inserts=records)),
+                        on_progress=report,
+                    )
+                finally:
+                    # Ir po klaidos – dalis batch'ų jau galėjo būti įrašyta
+                    get_user_store(TABLE).invalidate(USER_EMAIL)
+
+                if import_result.error:
+                    progress.progress(1.0, text="Nutraukta")
+                    st.error(
+                        f"❌ Importas nutrūko: importuota {import_result.imported} iš {import_result.total_rows} "
+                        "apdorotų eil. – jos jau išsaugotos, likusios ne."
+                    )
+                    st.caption(f"Techninė klaida: {import_result.error}")
+                else:
+                    progress.progress(1.0, text="Baigta")
+                    st.success(
+                        f"✅ Importuota {import_result.imported} iš {import_result.total_rows} eil. "
+                        f"per {import_result.seconds:.1f} s ({import_result.requests} užklausos)."
+                    )
+                if import_result.warnings:
+                    st.warning(f"{import_result.warnings} eil. importuota su įspėjimu dėl kategorijos ir tipo.")
+                if import_result.rejected:
+                    st.error(f"{import_result.rejected} eil. praleista (be datos / sumos arba netinka kategorija ir tipas).")
+                    if import_result.rejected_sample:
+                        st.dataframe(pd.DataFrame(import_result.rejected_sample), use_container_width=True, hide_index=True)
 
 # ======================================================
 # LOAD
 # ======================================================
-df = fetch_user_data(USER_EMAIL)
-if df.empty:
+use_server = SERVER_AGGREGATES
+
+# Nepriklausomos užklausos paleidžiamos kartu; serverio agregatai ir taisyklės
+# taip tik sušildo kešus – toliau tie patys kešuoti kvietimai grąžina jau gautą rezultatą.
+# Auth čia nedalyvauja: token tikrinamas vietoje (_restore_session)
+prefetch_calls = {"Taisyklės": lambda: fetch_rules(USER_EMAIL, get_rules_versions()[USER_EMAIL])}
+if use_server:
+    server_version = get_user_store(TABLE).version(USER_EMAIL)
+    prefetch_calls["Kubas"] = lambda: get_server_cube(USER_EMAIL, server_version)
+    prefetch_calls["Dienos balansas"] = lambda: get_server_daily_balance(USER_EMAIL, server_version)
+else:
+    prefetch_calls["Įrašai"] = lambda: fetch_user_data(USER_EMAIL)
+prefetched, fetch_report = fetch_concurrently(prefetch_calls)
+
+if use_server:
+    df, data_version = None, server_version
+else:
+    # Nepavykus – kartojame čia, kad klaida būtų parodyta kaip anksčiau
+    df, data_version = prefetched["Įrašai"] if "Įrašai" in prefetched else fetch_user_data(USER_EMAIL)
+
+with st.sidebar.expander("⏱️ Diagnostika", expanded=False):
+    cache_stats = get_user_store(TABLE).stats(USER_EMAIL)
+    st.caption(
+        f"Kešas: versija {cache_stats['version']} • pataikymai {cache_stats['hits']} • "
+        f"praleidimai {cache_stats['misses']} • {cache_stats['rows']} eil. "
+        f"({cache_stats['memory_bytes'] / 1024:.0f} KB) • vartotojų kešuota {cache_stats['cached_users']}"
+        + (" • įkelta iš disko" if cache_stats["from_disk"] else "")
+    )
+    disk = get_user_store(TABLE).disk
+    if disk is not None:
+        disk_stats = disk.stats()
+        st.caption(
+            f"Disko kešas: {disk_stats['users']} vart. • {disk_stats['bytes'] / 1024 / 1024:.1f} / "
+            f"{disk_stats['max_bytes'] / 1024 / 1024:.0f} MB • išmesta {disk_stats['evicted']}"
+        )
+    rerun_stats = st.empty()
+    st.caption(fetch_report.summary())
+    pool_stats = get_client_pool().stats()
+    st.caption(
+        f"Klientų telkinys: {pool_stats['size']}/{pool_stats['max_size']} • pataikymai {pool_stats['hits']} • "
+        f"nauji {pool_stats['misses']} • išmesta LRU {pool_stats['evicted_lru']} • "
+        f"išmesta dėl neveikimo {pool_stats['evicted_idle']}"
+    )
+    auth_timings = st.session_state.get("auth_timings", {})
+    if auth_timings:
+        token = st.session_state.get("sb_session")
+        st.caption(
+            "Auth: "
+            + " • ".join(f"{op} {v['ms']:.1f} ms" for op, v in auth_timings.items())
+            + (f" • token galioja dar {token.seconds_left() / 60:.0f} min." if isinstance(token, TokenState) else "")
+        )
+    st.checkbox("Rodyti sekcijų trukmę", value=False, key="show_section_timings")
+    http_latency = get_http_layer().histogram.table()
+    if not http_latency.empty:
+        st.caption("HTTP užklausų trukmė (iki atsakymo antraščių), pagal endpoint'ą")
+        st.dataframe(http_latency, use_container_width=True, hide_index=True)
+    section_timings = st.session_state.get("section_timings", {})
+    if section_timings:
+        st.dataframe(
+            pd.DataFrame(
+                [{"Sekcija": k, "Paskutinis (ms)": round(v["ms"], 1), "Kaip": v["kind"]} for k, v in section_timings.items()]
+            ),
+            use_container_width=True,
+            hide_index=True,
+        )
+    last_load = get_user_store(TABLE).last_load(USER_EMAIL)
+    if last_load is not None:
+        st.caption(
+            f"Pilnas įkėlimas: {last_load.total} eil. per {last_load.seconds * 1000:.0f} ms "
+            f"(skaičiavimas {last_load.count_seconds * 1000:.0f} ms, {len(last_load.pages)} psl.)"
+        )
+        if last_load.pages:
+            st.dataframe(last_load.timings_table(), use_container_width=True, hide_index=True)
+
+# ======================================================
+# AUTO-KATEGORIZAVIMAS
+# ======================================================
+RULE_COLUMNS = ["id", "kind", "pattern", "min_amount", "max_amount", "kategorija"]
+RULE_KIND_BY_LABEL = {label: kind for kind, label in RULE_KINDS.items()}
+
+
+def _amount_or_none(value):
+    return None if value is None or pd.isna(value) else float(value)
+
+
+def _text_column(frame: pd.DataFrame, col: str) -> pd.Series:
+    return frame[col].astype(object).where(frame[col].notna(), "").astype(str)
+
+
+with st.expander("🏷️ Automatinis kategorizavimas", expanded=False):
+    rules_version = get_rules_versions()[USER_EMAIL]
+    try:
+        rules_rows = fetch_rules(USER_EMAIL, rules_version)
+        rules_ready = True
+    except Exception as e:
+        rules_rows, rules_ready = [], False
+        st.info("Taisyklių lentelė nepasiekiama – paleisk sql/002_category_rules.sql.")
+        st.caption(f"Techninė klaida: {e}")
+
+    if rules_ready:
+        st.caption(
+            "Taisyklės tikrinamos tokia tvarka: tiksli prekybos vieta → ilgiausias prefiksas → "
+            "raktažodis prekybos vietoje ar aprašyme → sumos intervalas. "
+            "Importuojant jos užpildo tuščias ir „Nežinoma“ kategorijas."
+        )
+        rules_df = pd.DataFrame(rules_rows, columns=RULE_COLUMNS)
+        rules_df["kind"] = rules_df["kind"].map(RULE_KINDS)
+        rules_key = f"rules_editor_{rules_version}"
+
+        st.data_editor(
+            rules_df,
+            key=rules_key,
+            hide_index=True,
+            num_rows="dynamic",
+            use_container_width=True,
+            column_config={
+                "id": None,
+                "kind": st.column_config.SelectboxColumn("Taisyklė", options=list(RULE_KINDS.values()), required=True),
+                "pattern": st.column_config.TextColumn("Prekybos vieta / prefiksas / raktažodis"),
+                "min_amount": st.column_config.NumberColumn(f"Suma nuo ({CURRENCY})", min_value=0.0, format="%.2f"),
+                "max_amount": st.column_config.NumberColumn(f"Suma iki ({CURRENCY})", min_value=0.0, format="%.2f"),
+                "kategorija": st.column_config.TextColumn("Kategorija", required=True),
+            },
+        )
+
+        new_rules, changed_rules, deleted_rules = collect_editor_changes(rules_df, st.session_state.get(rules_key, {}))
+        if new_rules or changed_rules or deleted_rules:
+
+            def rule_row(r):
+                return {
+                    "user_email": USER_EMAIL,
+                    "kind": RULE_KIND_BY_LABEL.get(r.get("kind"), ""),
+                    "pattern": (r.get("pattern") or "").strip(),
+                    "min_amount": _amount_or_none(r.get("min_amount")),
+                    "max_amount": _amount_or_none(r.get("max_amount")),
+                    "kategorija": (r.get("kategorija") or "").strip(),
+                }
+
+            rule_errors = [r for r in new_rules + changed_rules if not rule_row(r)["kind"] or not rule_row(r)["kategorija"]]
+            if rule_errors:
+                st.error("Kiekvienai taisyklei reikia nurodyti tipą ir kategoriją.")
+
+            if st.button("💾 Išsaugoti taisykles", disabled=bool(rule_errors)):
+                try:
+                    commit_batch(
+                        supabase,
+                        RULES_TABLE,
+                        WriteBatch(
+                            inserts=[rule_row(r) for r in new_rules],
+                            updates=[{"id": r["id"], **rule_row(r)} for r in changed_rules],
+                            deletes=deleted_rules,
+                        ),
+                    )
+                    get_rules_versions()[USER_EMAIL] += 1
+                    st.rerun()
+                except Exception as e:
+                    st.error("❌ Nepavyko išsaugoti taisyklių.")
+                    st.caption(f"Techninė klaida: {e}")
+
+        if rules_rows and st.toggle("Pritaikyti taisykles esamiems įrašams", key="rules_preview"):
+            only_unknown = st.checkbox("Tik įrašams be kategorijos („Nežinoma“)", value=True, key="rules_only_unknown")
+
+            history, _ = raw_rows(df, data_version)
+            current_kat = _text_column(history, "kategorija")
+            proposed_kat = auto_categorize(history, only_unknown=only_unknown)
+            recat = proposed_kat.ne(current_kat)
+
+            if not recat.any():
+                st.info("Taisyklės nieko nekeistų.")
+            else:
+                preview_cols = ["data", "tipas", "prekybos_centras", "aprasymas", "suma_eur"]
+                recat_df = history.loc[recat, ["id"] + preview_cols].assign(
+                    sena=current_kat[recat],
+                    kategorija=proposed_kat[recat],
+                )
+                st.caption(f"Bus pakeista {int(recat.sum())} įrašų kategorija.")
+                st.dataframe(recat_df.drop(columns="id").head(100), use_container_width=True, hide_index=True)
+
+                if st.button("✅ Pakeisti kategorijas"):
+                    # Siunčiama tik kategorija – po vieną update ... in_(id) kiekvienai naujai kategorijai
+                    apply_batch(WriteBatch(updates=recat_df[["id", "kategorija"]].to_dict("records")))
+                    st.rerun()
+
+# Vienas agregatų kubas visoms analitikos sekcijoms (perskaičiuojamas tik pasikeitus versijai)
+cube = None
+if use_server:
+    try:
+        cube = get_server_cube(USER_EMAIL, data_version)
+    except Exception as e:
+        use_server = False
+        st.sidebar.caption(f"Serverio agregatai nepasiekiami – skaičiuojama lokaliai ({e}).")
+if cube is None:
+    if df is None:
+        df, data_version = fetch_user_data(USER_EMAIL)
+    cube = get_cube(USER_EMAIL, data_version, df)
+
+if cube.empty:
     st.info("Kol kas nėra įrašų. Įvesk pirmą operaciją ir viskas pradės gyventi.")
     st.stop()
 
+# Serverio kubas per TTL gali pasikeisti nepakitus versijai – išvestiniams kešams raktas su jo turiniu
+cube_version = (
+    f"{data_version}:{pd.util.hash_pandas_object(cube, index=False).sum()}" if use_server else data_version
+)
+# Asmeninis pajamų / išlaidų / balanso srautas kiekvienam mėnesiui (eilutės atitinka all_months)
+personal_series = get_personal_series(USER_EMAIL, cube_version, cube)
+
 # ======================================================
 # FILTERS SIDEBAR
 # ======================================================
 st.sidebar.markdown("## 🔎 Filtrai")
 
-years = ["Visi"] + sorted(df["year"].unique().tolist())
-months = ["Visi"] + sorted(df["month"].unique().tolist())
+years = ["Visi"] + sorted(cube["year"].unique().tolist())
+months = ["Visi"] + cube["month"].unique().tolist()
 
 if "year_filter" not in st.session_state:
     st.session_state["year_filter"] = "Visi"
@@ -546,764 +1358,1069 @@ year_filter = st.sidebar.selectbox("Metai", years, key="year_filter")
 month_filter = st.sidebar.selectbox("Mėnuo", months, key="month_filter")
 type_filter = st.sidebar.selectbox("Tipas", ["Visi", "Pajamos", "Išlaidos"], key="type_filter")
 cat_filter = st.sidebar.text_input("Kategorija (paieška)", placeholder="pvz. maist", key="cat_filter")
+search_mode = st.sidebar.radio(
+    "Paieškos būdas",
+    list(SEARCH_MODES),
+    format_func=SEARCH_MODES.get,
+    horizontal=True,
+    key="search_mode",
+)
+search_merchants = st.sidebar.checkbox("Ieškoti ir prekybos vietose", value=False, key="search_merchants")
 
 st.sidebar.button("🧹 Išvalyti filtrus", on_click=clear_filters)
 
-df_f = df.copy()
-if year_filter != "Visi":
-    df_f = df_f[df_f["year"] == year_filter]
-if month_filter != "Visi":
-    df_f = df_f[df_f["month"] == month_filter]
-if type_filter != "Visi":
-    df_f = df_f[df_f["tipas"] == type_filter]
+# Paieška vykdoma unikalioms reikšmėms; rastos reikšmės filtruoja ir kubą, ir eilutes
+matched_categories = matched_merchants = None
 if cat_filter.strip():
-    df_f = df_f[cat_norm(df_f["kategorija"]).str.contains(cat_filter.strip(), case=False, na=False)]
-
-# ======================================================
-# KPI
-# ======================================================
-st.subheader("📊 KPI")
+    search_index = get_search_index(USER_EMAIL, cube_version, cube)
+    matched_categories = search_index["kategorija"].match(cat_filter, search_mode)
+    matched_merchants = search_index["prekybos_centras"].match(cat_filter, search_mode) if search_merchants else []
 
-# Bendras vaizdas
-total_income = df_f[df_f["tipas"] == "Pajamos"]["suma_eur"].sum()
-total_expense = df_f[df_f["tipas"] == "Išlaidos"]["suma_eur"].sum()
-total_balance = total_income - total_expense
 
-# Asmeninis vaizdas
-personal_income, food_support, _, personal_expense, personal_balance = personal_metrics(df_f)
+def filter_rows(frame: pd.DataFrame, version: int) -> pd.DataFrame:
+    """
+    Filtruota peržiūra iš versijos indekso: pozicijų sankirta vietoje kopijos ir keturių kaukių.
+    version – būtent šio frame versija (indeksas kešuojamas pagal ją, ne pagal frame turinį).
+    """
+    index = get_filter_index(USER_EMAIL, version, frame)
+    pos = index.positions(
+        year=year_filter if year_filter != "Visi" else None,
+        month=month_filter if month_filter != "Visi" else None,
+        tipas=type_filter if type_filter != "Visi" else None,
+        categories=matched_categories,
+        merchants=matched_merchants,
+    )
+    return filtered_view(frame, pos)
 
-personal_savings_rate = None
-if personal_income > 0:
-    personal_savings_rate = personal_balance / personal_income
 
-# Finansinė pagalvė – tik asmeninei logikai
-calendar_days = None
-if month_filter != "Visi":
-    p = pd.Period(month_filter, freq="M")
-    min_day = p.start_time.date()
-    max_day = df_f["data"].max().date() if not df_f.empty else min_day
-    calendar_days = (max_day - min_day).days + 1
-elif year_filter != "Visi":
-    y = int(year_filter)
-    min_day = date(y, 1, 1)
-    max_day = date(y, 12, 31)
-    calendar_days = (max_day - min_day).days + 1
-else:
-    min_day = df_f["data"].min().date() if not df_f.empty else date.today()
-    max_day = df_f["data"].max().date() if not df_f.empty else date.today()
-    calendar_days = (max_day - min_day).days + 1
-
-avg_daily_personal_expense = None
-days_available = None
-end_date = None
-
-if calendar_days and calendar_days > 0:
-    avg_daily_personal_expense = personal_expense / calendar_days
-    if avg_daily_personal_expense > 0 and personal_balance > 0:
-        days_available = personal_balance / avg_daily_personal_expense
-        end_date = date.today() + timedelta(days=int(days_available))
-
-rate_tone = "neutral"
-if personal_savings_rate is not None:
-    if personal_savings_rate < 0:
-        rate_tone = "negative"
-    elif personal_savings_rate < 0.15:
-        rate_tone = "warning"
-    else:
-        rate_tone = "positive"
-
-# 1 eilutė – bendram pinigų srautui
-c1, c2, c3 = st.columns(3)
-with c1:
-    render_kpi_card(
-        "💰 Bendros pajamos",
-        money(total_income),
-        "Visos įplaukos pagal pasirinktą filtrą",
-        tone_by_value(total_income),
-    )
-with c2:
-    render_kpi_card(
-        "💸 Bendros išlaidos",
-        money(total_expense),
-        "Visos išlaidos pagal pasirinktą filtrą",
-        "negative" if total_expense > 0 else "neutral",
-    )
-with c3:
-    render_kpi_card(
-        "📦 Bendras balansas",
-        money(total_balance),
-        "Visų pinigų srautui kontroliuoti",
-        tone_by_value(total_balance),
-    )
+# Filtrų būsena – išvestinių kešų (grafikai, eksportas) rakto dalis
+filter_key = (year_filter, month_filter, type_filter, cat_filter.strip(), search_mode, search_merchants)
 
-# 2 eilutė – asmeninei finansinei logikai
-c4, c5, c6 = st.columns(3)
-with c4:
-    render_kpi_card(
-        "👤 Tikros pajamos",
-        money(personal_income),
-        "Skaičiuojama tik iš: Alga, Avansas, Priedas",
-        tone_by_value(personal_income),
-    )
-with c5:
-    render_kpi_card(
-        "🧾 Tikros išlaidos",
-        money(personal_expense),
-        f"Visos išlaidos minus maisto kompensacija ({money(food_support)})",
-        "negative" if personal_expense > 0 else "neutral",
-    )
-with c6:
-    render_kpi_card(
-        "🏦 Asmeninis balansas",
-        money(personal_balance),
-        "Tikros tavo pajamos minus tikros tavo išlaidos",
-        tone_by_value(personal_balance),
-    )
+# Serverio režime žalios eilutės filtruojamos tik kai jos įkeltos (redaktorius / eksportas)
+df_f = filter_rows(df, data_version) if df is not None else None
+rows_version = data_version
 
-# 3 eilutė – asmeniniai rodikliai
-c7, c8, c9 = st.columns(3)
-with c7:
-    render_kpi_card(
-        "🎯 Sutaupymo norma",
-        f"{(personal_savings_rate * 100):.1f} %" if personal_savings_rate is not None else "—",
-        "Skaičiuojama pagal asmeninę logiką",
-        rate_tone,
-    )
+cube_f = cube
+if year_filter != "Visi":
+    cube_f = cube_f[cube_f["year"] == year_filter]
+if month_filter != "Visi":
+    cube_f = cube_f[cube_f["month"] == month_filter]
+if type_filter != "Visi":
+    cube_f = cube_f[cube_f["tipas"] == type_filter]
+if matched_categories is not None:
+    cube_f = cube_f[cube_f["kategorija"].isin(matched_categories) | cube_f["prekybos_centras"].isin(matched_merchants)]
 
-with c8:
-    if days_available is not None and end_date is not None:
+# ======================================================
+# KPI
+# ======================================================
+@timed_fragment("KPI")
+def render_kpi_section(cube_f: pd.DataFrame, year_filter, month_filter):
+    st.subheader("📊 KPI")
+
+    # Bendras vaizdas
+    total_income = cube_f.loc[cube_f["tipas"] == "Pajamos", "suma_eur"].sum()
+    total_expense = cube_f.loc[cube_f["tipas"] == "Išlaidos", "suma_eur"].sum()
+    total_balance = total_income - total_expense
+
+    # Asmeninis vaizdas
+    personal_income, food_support, _, personal_expense, personal_balance = personal_metrics(cube_f)
+
+    personal_savings_rate = None
+    if personal_income > 0:
+        personal_savings_rate = personal_balance / personal_income
+
+    # Finansinė pagalvė – tik asmeninei logikai
+    calendar_days = None
+    if month_filter != "Visi":
+        p = pd.Period(month_filter, freq="M")
+        min_day = p.start_time.date()
+        max_day = cube_f["data_max"].max().date() if not cube_f.empty else min_day
+        calendar_days = (max_day - min_day).days + 1
+    elif year_filter != "Visi":
+        y = int(year_filter)
+        min_day = date(y, 1, 1)
+        max_day = date(y, 12, 31)
+        calendar_days = (max_day - min_day).days + 1
+    else:
+        min_day = cube_f["data_min"].min().date() if not cube_f.empty else date.today()
+        max_day = cube_f["data_max"].max().date() if not cube_f.empty else date.today()
+        calendar_days = (max_day - min_day).days + 1
+
+    avg_daily_personal_expense = None
+    days_available = None
+    end_date = None
+
+    if calendar_days and calendar_days > 0:
+        avg_daily_personal_expense = personal_expense / calendar_days
+        if avg_daily_personal_expense > 0 and personal_balance > 0:
+            days_available = personal_balance / avg_daily_personal_expense
+            end_date = date.today() + timedelta(days=int(days_available))
+
+    rate_tone = "neutral"
+    if personal_savings_rate is not None:
+        if personal_savings_rate < 0:
+            rate_tone = "negative"
+        elif personal_savings_rate < 0.15:
+            rate_tone = "warning"
+        else:
+            rate_tone = "positive"
+
+    # 1 eilutė – bendram pinigų srautui
+    c1, c2, c3 = st.columns(3)
+    with c1:
         render_kpi_card(
-            "🛟 Finansinė pagalvė",
-            f"{days_available:.0f} d.",
-            f"iki {end_date.isoformat()} • ~{money(avg_daily_personal_expense)}/d.",
-            "positive" if days_available >= 30 else "warning",
+            "💰 Bendros pajamos",
+            money(total_income),
+            "Visos įplaukos pagal pasirinktą filtrą",
+            tone_by_value(total_income),
         )
-    else:
+    with c2:
         render_kpi_card(
-            "🛟 Finansinė pagalvė",
-            "—",
-            "Nepakanka duomenų skaičiavimui",
-            "neutral",
+            "💸 Bendros išlaidos",
+            money(total_expense),
+            "Visos išlaidos pagal pasirinktą filtrą",
+            "negative" if total_expense > 0 else "neutral",
+        )
+    with c3:
+        render_kpi_card(
+            "📦 Bendras balansas",
+            money(total_balance),
+            "Visų pinigų srautui kontroliuoti",
+            tone_by_value(total_balance),
         )
 
-with c9:
-    render_kpi_card(
-        "📅 Vid. dienos išlaidos",
-        money(avg_daily_personal_expense) if avg_daily_personal_expense is not None else "—",
-        "Skaičiuojama pagal tikras tavo išlaidas",
-        "warning" if avg_daily_personal_expense is not None else "neutral",
-    )
+    # 2 eilutė – asmeninei finansinei logikai
+    c4, c5, c6 = st.columns(3)
+    with c4:
+        render_kpi_card(
+            "👤 Tikros pajamos",
+            money(personal_income),
+            "Skaičiuojama tik iš: Alga, Avansas, Priedas",
+            tone_by_value(personal_income),
+        )
+    with c5:
+        render_kpi_card(
+            "🧾 Tikros išlaidos",
+            money(personal_expense),
+            f"Visos išlaidos minus maisto kompensacija ({money(food_support)})",
+            "negative" if personal_expense > 0 else "neutral",
+        )
+    with c6:
+        render_kpi_card(
+            "🏦 Asmeninis balansas",
+            money(personal_balance),
+            "Tikros tavo pajamos minus tikros tavo išlaidos",
+            tone_by_value(personal_balance),
+        )
 
-# ======================================================
-# SMART INSIGHTS
-# ======================================================
-st.subheader("🔍 Smart insight: kur bėga pinigai (be DI)")
+    # 3 eilutė – asmeniniai rodikliai
+    c7, c8, c9 = st.columns(3)
+    with c7:
+        render_kpi_card(
+            "🎯 Sutaupymo norma",
+            f"{(personal_savings_rate * 100):.1f} %" if personal_savings_rate is not None else "—",
+            "Skaičiuojama pagal asmeninę logiką",
+            rate_tone,
+        )
 
-with st.expander("⚙️ Insight nustatymai", expanded=False):
-    small_cap = st.slider("„Smulkios išlaidos“ riba (€)", 1, 50, 10, 1)
-    spike_pct = st.slider("„Šuolio“ riba vs praeitas mėnuo (%)", 5, 80, 20, 5)
-    lookback_months = st.slider("Vidurkio laikotarpis (mėn.)", 2, 12, 6, 1)
+    with c8:
+        if days_available is not None and end_date is not None:
+            render_kpi_card(
+                "🛟 Finansinė pagalvė",
+                f"{days_available:.0f} d.",
+                f"iki {end_date.isoformat()} • ~{money(avg_daily_personal_expense)}/d.",
+                "positive" if days_available >= 30 else "warning",
+            )
+        else:
+            render_kpi_card(
+                "🛟 Finansinė pagalvė",
+                "—",
+                "Nepakanka duomenų skaičiavimui",
+                "neutral",
+            )
 
-current_month = month_filter if month_filter != "Visi" else sorted(df["month"].unique().tolist())[-1]
+    with c9:
+        render_kpi_card(
+            "📅 Vid. dienos išlaidos",
+            money(avg_daily_personal_expense) if avg_daily_personal_expense is not None else "—",
+            "Skaičiuojama pagal tikras tavo išlaidas",
+            "warning" if avg_daily_personal_expense is not None else "neutral",
+        )
 
-cur = df[df["month"] == current_month].copy()
-cur_exp = cur[cur["tipas"] == "Išlaidos"].copy()
 
-cur_period = pd.Period(current_month, freq="M")
-prev_month = str(cur_period - 1)
-prev = df[df["month"] == prev_month].copy()
-prev_exp = prev[prev["tipas"] == "Išlaidos"].copy()
+render_kpi_section(cube_f, year_filter, month_filter)
 
-insights = []
+# ======================================================
+# SMART INSIGHTS
+# ======================================================
+@timed_fragment("Insights")
+def render_insights_section(cube: pd.DataFrame, personal_series: pd.DataFrame, month_filter, df, use_server: bool, data_version: int):
+    st.subheader("🔍 Smart insight: kur bėga pinigai (be DI)")
+
+    with st.expander("⚙️ Insight nustatymai", expanded=False):
+        small_cap = st.slider("„Smulkios išlaidos“ riba (€)", 1, 50, 10, 1)
+        spike_pct = st.slider("„Šuolio“ riba vs praeitas mėnuo (%)", 5, 80, 20, 5)
+        lookback_months = st.slider("Vidurkio laikotarpis (mėn.)", 2, 12, 6, 1)
+
+    all_months = cube["month"].unique().tolist()
+    current_month = month_filter if month_filter != "Visi" else all_months[-1]
+
+    cur = cube[cube["month"] == current_month]
+    cur_exp = cur[cur["tipas"] == "Išlaidos"]
+
+    cur_period = pd.Period(current_month, freq="M")
+    prev_month = str(cur_period - 1)
+    prev_exp = cube[(cube["month"] == prev_month) & (cube["tipas"] == "Išlaidos")]
+
+    insights = []
+
+    if not cur_exp.empty:
+        top_cat = sum_by(cur_exp, "kategorija").sort_values(ascending=False).head(5)
+        top_cat_str = ", ".join([f"{k}: {money(v)}" for k, v in top_cat.items()])
+        insights.append(f"**Top kategorijos ({current_month})**: {top_cat_str}")
+
+    if not cur_exp.empty:
+        # Vienintelis insight, kuriam reikia pavienių sumų – skaičiuoja serveris arba tik šio mėnesio eilutės
+        if use_server:
+            small_cnt, small_sum = get_server_small_expenses(USER_EMAIL, data_version, current_month, float(small_cap))
+        else:
+            small_cnt, small_sum = small_expenses(df, current_month, small_cap)
+        if small_cnt:
+            insights.append(
+                f"**Smulkios išlaidos (≤ {small_cap} €)**: {small_cnt} kartų, suma **{money(small_sum)}**."
+            )
 
-if not cur_exp.empty:
-    top_cat = (
-        cur_exp.groupby(cat_norm(cur_exp["kategorija"]))["suma_eur"]
-        .sum()
-        .sort_values(ascending=False)
-        .head(5)
-    )
-    top_cat_str = ", ".join([f"{k}: {money(v)}" for k, v in top_cat.items()])
-    insights.append(f"**Top kategorijos ({current_month})**: {top_cat_str}")
-
-if not cur_exp.empty:
-    small = cur_exp[cur_exp["suma_eur"] <= float(small_cap)]
-    if not small.empty:
-        insights.append(
-            f"**Smulkios išlaidos (≤ {small_cap} €)**: {int(len(small))} kartų, suma **{money(small['suma_eur'].sum())}**."
+    if (not cur_exp.empty) and (not prev_exp.empty):
+        cur_group = sum_by(cur_exp, "kategorija")
+        prev_group = sum_by(prev_exp, "kategorija")
+        joined = pd.concat([cur_group, prev_group], axis=1)
+        joined.columns = ["cur", "prev"]
+        joined = joined.fillna(0.0)
+
+        joined2 = joined[joined["prev"] > 0].copy()
+        if not joined2.empty:
+            joined2["pct"] = (joined2["cur"] - joined2["prev"]) / joined2["prev"]
+            spikes = joined2[joined2["pct"] >= (spike_pct / 100.0)].sort_values("pct", ascending=False).head(5)
+            if not spikes.empty:
+                parts = []
+                for k, row in spikes.iterrows():
+                    parts.append(f"{k}: {money(row['cur'])} (buvo {money(row['prev'])}, +{row['pct']*100:.0f}%)")
+                insights.append(f"**Šuoliai vs {prev_month}**: " + "; ".join(parts))
+
+    if not cur_exp.empty:
+        by_merch = (
+            cur_exp.assign(prekybos_centras=cur_exp["prekybos_centras"].replace("", "Nežinoma"))
+            .groupby("prekybos_centras")
+            .agg(cnt=("cnt", "sum"), total=("suma_eur", "sum"))
         )
+        repeat = by_merch[by_merch["cnt"] >= 3].sort_values("total", ascending=False).head(5)
+        if not repeat.empty:
+            parts = [f"{idx}: {int(r.cnt)} kart., {money(r.total)}" for idx, r in repeat.iterrows()]
+            insights.append("**Pasikartojančios vietos (3+ kartai)**: " + "; ".join(parts))
+
+    cur_personal_income, _, _, cur_personal_expense, cur_personal_balance = personal_metrics(cur)
+
+    if cur_personal_income > 0:
+        rate = cur_personal_balance / cur_personal_income
+        if rate < 0:
+            insights.append(f"⚠️ **{current_month}**: išlaidos viršija pajamas (sutaupymo norma {rate*100:.1f}%).")
+        elif rate < 0.15:
+            insights.append(f"⚠️ **{current_month}**: sutaupymo norma žema ({rate*100:.1f}%).")
+        else:
+            insights.append(f"✅ **{current_month}**: sutaupymo norma {rate*100:.1f}% – kryptis gera.")
+
+    cur_idx = all_months.index(current_month) if current_month in all_months else None
+    if cur_idx is not None:
+        start_idx = max(0, cur_idx - lookback_months)
+        lookback_list = all_months[start_idx:cur_idx]
+        if lookback_list:
+            base_exp = float(personal_series["personal_expense"].iloc[start_idx:cur_idx].mean())
+
+            if base_exp > 0:
+                diff = (cur_personal_expense - base_exp) / base_exp
+                if diff >= (spike_pct / 100.0):
+                    insights.append(
+                        f"⚠️ **Bendrai tikros išlaidos** {current_month}: {money(cur_personal_expense)}. "
+                        f"Tai ~{diff*100:.0f}% daugiau nei tavo {len(lookback_list)} mėn. vidurkis ({money(base_exp)})."
+                    )
 
-if (not cur_exp.empty) and (not prev_exp.empty):
-    cur_group = cur_exp.assign(kat=cat_norm(cur_exp["kategorija"])).groupby("kat")["suma_eur"].sum()
-    prev_group = prev_exp.assign(kat=cat_norm(prev_exp["kategorija"])).groupby("kat")["suma_eur"].sum()
-    joined = pd.concat([cur_group, prev_group], axis=1)
-    joined.columns = ["cur", "prev"]
-    joined = joined.fillna(0.0)
-
-    joined2 = joined[joined["prev"] > 0].copy()
-    if not joined2.empty:
-        joined2["pct"] = (joined2["cur"] - joined2["prev"]) / joined2["prev"]
-        spikes = joined2[joined2["pct"] >= (spike_pct / 100.0)].sort_values("pct", ascending=False).head(5)
-        if not spikes.empty:
-            parts = []
-            for k, row in spikes.iterrows():
-                parts.append(f"{k}: {money(row['cur'])} (buvo {money(row['prev'])}, +{row['pct']*100:.0f}%)")
-            insights.append(f"**Šuoliai vs {prev_month}**: " + "; ".join(parts))
-
-if not cur_exp.empty and "prekybos_centras" in cur_exp.columns:
-    cur_exp["prekybos_centras"] = cur_exp["prekybos_centras"].replace("", "Nežinoma")
-    by_merch = cur_exp.groupby("prekybos_centras").agg(cnt=("suma_eur", "size"), total=("suma_eur", "sum"))
-    repeat = by_merch[by_merch["cnt"] >= 3].sort_values("total", ascending=False).head(5)
-    if not repeat.empty:
-        parts = [f"{idx}: {int(r.cnt)} kart., {money(r.total)}" for idx, r in repeat.iterrows()]
-        insights.append("**Pasikartojančios vietos (3+ kartai)**: " + "; ".join(parts))
-
-cur_personal_income, _, _, cur_personal_expense, cur_personal_balance = personal_metrics(cur)
-
-if cur_personal_income > 0:
-    rate = cur_personal_balance / cur_personal_income
-    if rate < 0:
-        insights.append(f"⚠️ **{current_month}**: išlaidos viršija pajamas (sutaupymo norma {rate*100:.1f}%).")
-    elif rate < 0.15:
-        insights.append(f"⚠️ **{current_month}**: sutaupymo norma žema ({rate*100:.1f}%).")
+    if insights:
+        for s in insights:
+            st.markdown(f"- {s}")
     else:
-        insights.append(f"✅ **{current_month}**: sutaupymo norma {rate*100:.1f}% – kryptis gera.")
-
-all_months = sorted(df["month"].unique().tolist())
-cur_idx = all_months.index(current_month) if current_month in all_months else None
-if cur_idx is not None:
-    start_idx = max(0, cur_idx - lookback_months)
-    lookback_list = all_months[start_idx:cur_idx]
-    if lookback_list:
-        base_exp = 0.0
-        for m in lookback_list:
-            m_df = df[df["month"] == m].copy()
-            _, _, _, m_personal_expense, _ = personal_metrics(m_df)
-            base_exp += m_personal_expense
-        base_exp = base_exp / len(lookback_list)
-
-        if base_exp > 0:
-            diff = (cur_personal_expense - base_exp) / base_exp
-            if diff >= (spike_pct / 100.0):
-                insights.append(
-                    f"⚠️ **Bendrai tikros išlaidos** {current_month}: {money(cur_personal_expense)}. "
-                    f"Tai ~{diff*100:.0f}% daugiau nei tavo {len(lookback_list)} mėn. vidurkis ({money(base_exp)})."
-                )
+        st.info("Dar per mažai duomenų insightams.")
 
-if insights:
-    for s in insights:
-        st.markdown(f"- {s}")
-else:
-    st.info("Dar per mažai duomenų insightams.")
+
+render_insights_section(cube, personal_series, month_filter, df, use_server, data_version)
 
 # ======================================================
 # TABLE: EDIT / DELETE
 # ======================================================
+EDITOR_COLUMNS = ["id", "data", "tipas", "kategorija", "prekybos_centras", "aprasymas", "suma_eur"]
+EDITOR_SORT_OPTIONS = {
+    "Data": "data",
+    "Suma": "suma_eur",
+    "Kategorija": "kategorija",
+    "Tipas": "tipas",
+    "Prekybos vieta": "prekybos_centras",
+}
+
 st.subheader("📋 Įrašai (redagavimas / trynimas)")
 
-if df_f.empty:
-    st.info("Pagal pasirinktus filtrus įrašų nėra.")
-else:
-    with st.container(height=420, border=True):
-        for _, r in df_f.sort_values("data", ascending=False).iterrows():
-            title = f"{r['data'].date()} | {r['tipas']} | {r['kategorija']} | {money(r['suma_eur'])}"
-            with st.expander(title, expanded=False):
-                colA, colB, colC, colD = st.columns([1.1, 1.1, 1.2, 1.2])
-
-                with colA:
-                    new_d = st.date_input("Data", value=r["data"].date(), key=f"d_{r['id']}")
-                with colB:
-                    new_t = st.selectbox(
-                        "Tipas",
-                        ["Pajamos", "Išlaidos"],
-                        index=0 if r["tipas"] == "Pajamos" else 1,
-                        key=f"t_{r['id']}",
+# Įrašų įkėlimo jungiklis – už fragmentų, kad įjungus jį eilutes gautų ir redaktorius, ir eksportas
+if df_f is None and st.toggle("Rodyti įrašus (įkelia visas eilutes)", key="show_raw_rows"):
+    raw_df, rows_version = raw_rows(df, data_version)
+    df_f = filter_rows(raw_df, rows_version)
+
+
+@timed_fragment("Įrašai")
+def render_editor_section(df_f):
+    if df_f is None:
+        st.caption("Analitika rodoma iš serverio agregatų; įrašai įkeliami tik juos atidarius.")
+    elif df_f.empty:
+        st.info("Pagal pasirinktus filtrus įrašų nėra.")
+    else:
+        e1, e2, e3, e4 = st.columns([1.3, 1, 1, 1])
+        with e1:
+            sort_label = st.selectbox("Rikiuoti pagal", list(EDITOR_SORT_OPTIONS), key="editor_sort")
+        with e2:
+            sort_desc = st.toggle("Mažėjančiai", value=True, key="editor_desc")
+        with e3:
+            page_size = st.selectbox("Eilučių puslapyje", [25, 50, 100, 200], index=1, key="editor_page_size")
+
+        total_pages = max(1, math.ceil(len(df_f) / page_size))
+        safe_page = clamp_int_session_value("editor_page_safe", 1, total_pages, 1)
+        with e4:
+            editor_page = st.number_input(
+                f"Puslapis (iš {total_pages})",
+                min_value=1,
+                max_value=total_pages,
+                value=safe_page,
+                step=1,
+            )
+        st.session_state["editor_page_safe"] = int(editor_page)
+
+        # Rikiuojami tik raktai, o į naršyklę keliauja tik matomas puslapis
+        sort_col = EDITOR_SORT_OPTIONS[sort_label]
+        page_start = (int(editor_page) - 1) * page_size
+        page_index = (
+            df_f[[sort_col, "id"]]
+            .sort_values([sort_col, "id"], ascending=not sort_desc, kind="stable")
+            .index[page_start:page_start + page_size]
+        )
+        page_df = df_f.loc[page_index, [c for c in EDITOR_COLUMNS if c in df_f.columns]]
+        page_df = page_df.assign(
+            data=page_df["data"].dt.date,
+            **{c: page_df[c].astype(str) for c in ["tipas", "kategorija", "prekybos_centras", "aprasymas"] if c in page_df.columns},
+        ).reset_index(drop=True)
+
+        # Raktas priklauso nuo matomų id, kad pasikeitus puslapiui ar filtrams
+        # neišsaugoti pakeitimai nebūtų pritaikyti kitoms eilutėms.
+        editor_key = f"editor_{st.session_state.get('editor_nonce', 0)}_{hash(tuple(page_df['id'].tolist()))}"
+
+        st.data_editor(
+            page_df,
+            key=editor_key,
+            hide_index=True,
+            num_rows="dynamic",
+            use_container_width=True,
+            column_config={
+                "id": None,
+                "data": st.column_config.DateColumn("Data", required=True, format="YYYY-MM-DD"),
+                "tipas": st.column_config.SelectboxColumn("Tipas", options=["Pajamos", "Išlaidos"], required=True),
+                "kategorija": st.column_config.TextColumn("Kategorija"),
+                "prekybos_centras": st.column_config.TextColumn("Prekybos vieta"),
+                "aprasymas": st.column_config.TextColumn("Aprašymas"),
+                "suma_eur": st.column_config.NumberColumn(
+                    f"Suma ({CURRENCY})", min_value=0.0, step=0.01, format="%.2f", required=True
+                ),
+            },
+        )
+        st.caption(f"Rodoma {page_start + 1}–{page_start + len(page_df)} iš {len(df_f)} įrašų.")
+
+        new_rows, changed_rows, deleted_ids = collect_editor_changes(page_df, st.session_state.get(editor_key, {}))
+
+        if new_rows or changed_rows or deleted_ids:
+            editor_errors = []
+            for r in new_rows + changed_rows:
+                if not r.get("data") or not r.get("tipas"):
+                    editor_errors.append("Naujoje eilutėje trūksta datos arba tipo.")
+                    continue
+                status_edit, message_edit = validate_category_type(r["tipas"], r.get("kategorija"))
+                if status_edit == "error":
+                    editor_errors.append(message_edit)
+                elif status_edit == "warning":
+                    st.warning(message_edit)
+
+            for message_edit in editor_errors:
+                st.error(message_edit)
+
+            st.caption(
+                f"Neišsaugota: {len(changed_rows)} pakeista, {len(new_rows)} nauja, {len(deleted_ids)} ištrinta."
+            )
+            if st.button("💾 Išsaugoti pakeitimus", disabled=bool(editor_errors)):
+
+                def editor_row(r):
+                    return _user_row(
+                        pd.Timestamp(r["data"]).date(),
+                        r["tipas"],
+                        r.get("kategorija"),
+                        r.get("prekybos_centras"),
+                        r.get("aprasymas"),
+                        r.get("suma_eur") or 0.0,
                     )
-                with colC:
-                    new_s = st.number_input(
-                        f"Suma ({CURRENCY})",
-                        min_value=0.0,
-                        step=1.0,
-                        value=float(r["suma_eur"]),
-                        format="%.2f",
-                        key=f"s_{r['id']}",
+
+                originals = {r["id"]: editor_row(r) for r in page_df.to_dict("records")}
+                patches = [
+                    {"id": r["id"], **_changed_fields(editor_row(r), originals[r["id"]])} for r in changed_rows
+                ]
+                apply_batch(
+                    WriteBatch(
+                        inserts=[editor_row(r) for r in new_rows],
+                        updates=[p for p in patches if len(p) > 1],
+                        deletes=deleted_ids,
                     )
-                with colD:
-                    new_k = st.text_input("Kategorija", value=r["kategorija"], key=f"k_{r['id']}")
+                )
+                st.session_state["editor_nonce"] = st.session_state.get("editor_nonce", 0) + 1
+                st.rerun()
 
-                new_p = st.text_input("Prekybos vieta", value=r.get("prekybos_centras", ""), key=f"p_{r['id']}")
-                new_a = st.text_input("Aprašymas", value=r.get("aprasymas", ""), key=f"a_{r['id']}")
 
-                status_edit, message_edit = validate_category_type(new_t, new_k)
-                if status_edit == "warning":
-                    st.warning(message_edit)
-                elif status_edit == "error":
-                    st.error(message_edit)
-
-                b1, b2 = st.columns([1, 1])
-                with b1:
-                    if st.button("💾 Išsaugoti pakeitimus", key=f"save_{r['id']}"):
-                        status_save, message_save = validate_category_type(new_t, new_k)
-                        if status_save == "error":
-                            st.error(message_save)
-                        else:
-                            if status_save == "warning":
-                                st.warning(message_save)
-                            update_row(r["id"], new_d, new_t, new_k, new_p, new_a, new_s)
-
-                with b2:
-                    if st.button("🗑️ Ištrinti įrašą", key=f"del_{r['id']}"):
-                        delete_row(r["id"])
+render_editor_section(df_f)
 
 # ======================================================
 # CHARTS
 # ======================================================
-st.subheader("📈 Analitika")
+@timed_fragment("Analitika")
+def render_analytics_section(cube_f: pd.DataFrame, df, use_server: bool, data_version: int, cube_version, filter_key: tuple):
+    st.subheader("📈 Analitika")
 
-# Bendras kaupiamasis balansas
-df_all = df.sort_values("data").copy()
-df_all["signed"] = df_all["suma_eur"].where(df_all["tipas"] == "Pajamos", -df_all["suma_eur"])
+    # Bendras kaupiamasis balansas
+    if use_server:
+        daily = get_server_daily_balance(USER_EMAIL, data_version)
+    else:
+        daily = get_daily_balance(USER_EMAIL, data_version, df)
 
-daily = df_all.groupby("data", as_index=False)["signed"].sum().sort_values("data")
-daily["balansas"] = daily["signed"].cumsum()
+    st.plotly_chart(pio.from_json(get_balance_figure(USER_EMAIL, cube_version, daily)), use_container_width=True)
 
-fig_bal = px.line(daily, x="data", y="balansas", title="Kaupiamasis bendras balansas (visa istorija)")
-st.plotly_chart(fig_bal, use_container_width=True)
+    # Pajamos vs išlaidos
+    if not cube_f.empty:
+        st.plotly_chart(pio.from_json(get_monthly_figure(USER_EMAIL, cube_version, filter_key, cube_f)), use_container_width=True)
 
-# Pajamos vs išlaidos
-if not df_f.empty:
-    tmp = df_f.copy()
-    tmp["ym_sort"] = tmp["data"].dt.to_period("M").dt.to_timestamp()
-    tmp["ym"] = tmp["data"].dt.to_period("M").astype(str)
+    # Išlaidos pagal kategorijas
+    exp_f = cube_f[cube_f["tipas"] == "Išlaidos"]
+    if not exp_f.empty:
+        cat_json, cat_table = get_category_chart(USER_EMAIL, cube_version, filter_key, exp_f)
+        st.plotly_chart(pio.from_json(cat_json), use_container_width=True)
+        st.dataframe(cat_table, use_container_width=True, hide_index=True)
 
-    monthly = (
-        tmp.groupby(["ym_sort", "ym", "tipas"], as_index=False)["suma_eur"]
-        .sum()
-        .sort_values("ym_sort")
-    )
 
-    fig_bar = px.bar(
-        monthly,
-        x="ym",
-        y="suma_eur",
-        color="tipas",
-        barmode="group",
-        title="Pajamos vs Išlaidos (pagal filtrą)",
-    )
-    fig_bar.update_xaxes(type="category")
-    st.plotly_chart(fig_bar, use_container_width=True)
-
-# Išlaidos pagal kategorijas
-exp_f = df_f[df_f["tipas"] == "Išlaidos"].copy()
-if not exp_f.empty:
-    cat_sum = (
-        exp_f.assign(kategorija=cat_norm(exp_f["kategorija"]))
-        .groupby("kategorija", as_index=False)["suma_eur"]
-        .sum()
-        .sort_values("suma_eur", ascending=True)
-    )
-
-    fig_cat = px.bar(
-        cat_sum,
-        x="suma_eur",
-        y="kategorija",
-        orientation="h",
-        title="Išlaidos pagal kategorijas",
-    )
-    st.plotly_chart(fig_cat, use_container_width=True)
-    st.dataframe(cat_sum.sort_values("suma_eur", ascending=False), use_container_width=True, hide_index=True)
+render_analytics_section(cube_f, df, use_server, data_version, cube_version, filter_key)
 
 # ======================================================
 # PREDICTION / WHAT-IF
 # ======================================================
-st.subheader("🔮 Ateities scenarijus / Prediction")
-
-month_base = (
-    df.groupby(["month_ts", "month"], as_index=False)
-    .agg(dummy=("suma_eur", "size"))
-    .sort_values("month_ts")
-    .reset_index(drop=True)
-)
-
-if month_base.empty:
-    st.info("Prediction blokui kol kas per mažai duomenų.")
-else:
-    lookback_min = 1
-    lookback_max = min(12, max(1, len(month_base)))
-    lookback_default = min(6, len(month_base))
-
-    scenario_horizon_min = 3
-    scenario_horizon_max = 60
-    scenario_horizon_default = 12
-
-    reduce_pct_min = 0
-    reduce_pct_max = 100
-    reduce_pct_default = 0
-
-    release_start_month_min = 1
-    release_start_month_max = 60
-    release_start_month_default = 12
-
-    safe_lookback = clamp_int_session_value(
-        key="scenario_lookback_safe",
-        min_value=lookback_min,
-        max_value=lookback_max,
-        default_value=lookback_default,
-    )
-    safe_horizon = clamp_int_session_value(
-        key="scenario_horizon_safe",
-        min_value=scenario_horizon_min,
-        max_value=scenario_horizon_max,
-        default_value=scenario_horizon_default,
-    )
-    safe_reduce_pct = clamp_int_session_value(
-        key="reduce_pct_safe",
-        min_value=reduce_pct_min,
-        max_value=reduce_pct_max,
-        default_value=reduce_pct_default,
-    )
-    safe_release_start_month = clamp_int_session_value(
-        key="release_start_month_safe",
-        min_value=release_start_month_min,
-        max_value=release_start_month_max,
-        default_value=release_start_month_default,
+# Jautrumo tinklelio parametrai: pavadinimas, galimos reikšmės, numatytosios reikšmės
+GRID_OPTIONS = {
+    "reduce_pct": ("Mažinimas (%)", list(range(0, 101, 5)), [0, 10, 20, 30, 50]),
+    "monthly_income_change": ("Pajamų pokytis (€)", list(range(-1000, 1001, 50)), [-200, 0, 200, 500]),
+    "recurring_extra_saving": ("Papildomas taupymas (€)", list(range(0, 1001, 50)), [0, 100, 200, 500]),
+    "release_start_month": ("Laisva suma nuo mėn.", list(range(1, 61)), [3, 6, 12, 24]),
+}
+GRID_METRICS = {
+    "final_balance": "Balansas horizonto pabaigoje",
+    "months_to_3": "Mėn. iki 3 mėn. pagalvės",
+    "months_to_6": "Mėn. iki 6 mėn. pagalvės",
+    "months_to_12": "Mėn. iki 12 mėn. pagalvės",
+}
+
+
+@timed_fragment("Prediction")
+def render_prediction_section(cube: pd.DataFrame, personal_series: pd.DataFrame, cube_version):
+    st.subheader("🔮 Ateities scenarijus / Prediction")
+
+    month_base = (
+        cube.groupby(["month_ts", "month"], as_index=False)
+        .agg(dummy=("cnt", "sum"))
+        .sort_values("month_ts")
+        .reset_index(drop=True)
     )
 
-    with st.expander("⚙️ Scenarijaus nustatymai", expanded=True):
-        c1, c2, c3 = st.columns(3)
-        with c1:
-            if lookback_max == 1:
-                scenario_lookback = 1
-                st.number_input(
-                    "Bazės laikotarpis (mėn.)",
-                    min_value=1,
-                    max_value=1,
-                    value=1,
+    if month_base.empty:
+        st.info("Prediction blokui kol kas per mažai duomenų.")
+    else:
+        lookback_min = 1
+        lookback_max = min(12, max(1, len(month_base)))
+        lookback_default = min(6, len(month_base))
+
+        scenario_horizon_min = 3
+        scenario_horizon_max = 60
+        scenario_horizon_default = 12
+
+        reduce_pct_min = 0
+        reduce_pct_max = 100
+        reduce_pct_default = 0
+
+        release_start_month_min = 1
+        release_start_month_max = 60
+        release_start_month_default = 12
+
+        safe_lookback = clamp_int_session_value(
+            key="scenario_lookback_safe",
+            min_value=lookback_min,
+            max_value=lookback_max,
+            default_value=lookback_default,
+        )
+        safe_horizon = clamp_int_session_value(
+            key="scenario_horizon_safe",
+            min_value=scenario_horizon_min,
+            max_value=scenario_horizon_max,
+            default_value=scenario_horizon_default,
+        )
+        safe_reduce_pct = clamp_int_session_value(
+            key="reduce_pct_safe",
+            min_value=reduce_pct_min,
+            max_value=reduce_pct_max,
+            default_value=reduce_pct_default,
+        )
+        safe_release_start_month = clamp_int_session_value(
+            key="release_start_month_safe",
+            min_value=release_start_month_min,
+            max_value=release_start_month_max,
+            default_value=release_start_month_default,
+        )
+
+        with st.expander("⚙️ Scenarijaus nustatymai", expanded=True):
+            c1, c2, c3 = st.columns(3)
+            with c1:
+                if lookback_max == 1:
+                    scenario_lookback = 1
+                    st.number_input(
+                        "Bazės laikotarpis (mėn.)",
+                        min_value=1,
+                        max_value=1,
+                        value=1,
+                        step=1,
+                        disabled=True,
+                        help="Kai istorijoje yra tik vienas mėnuo, bazės laikotarpis fiksuojamas į 1 mėn.",
+                    )
+                else:
+                    scenario_lookback = st.slider(
+                        "Bazės laikotarpis (mėn.)",
+                        min_value=lookback_min,
+                        max_value=lookback_max,
+                        value=safe_lookback,
+                        step=1,
+                    )
+            with c2:
+                scenario_horizon = st.slider(
+                    "Prognozės horizontas (mėn.)",
+                    min_value=scenario_horizon_min,
+                    max_value=scenario_horizon_max,
+                    value=safe_horizon,
                     step=1,
-                    disabled=True,
-                    help="Kai istorijoje yra tik vienas mėnuo, bazės laikotarpis fiksuojamas į 1 mėn.",
                 )
-            else:
-                scenario_lookback = st.slider(
-                    "Bazės laikotarpis (mėn.)",
-                    min_value=lookback_min,
-                    max_value=lookback_max,
-                    value=safe_lookback,
-                    step=1,
+            with c3:
+                one_time_boost = st.number_input(
+                    "Vienkartinė suma pradžioje (€)",
+                    min_value=0.0,
+                    value=0.0,
+                    step=100.0,
+                    format="%.2f",
                 )
-        with c2:
-            scenario_horizon = st.slider(
-                "Prognozės horizontas (mėn.)",
-                min_value=scenario_horizon_min,
-                max_value=scenario_horizon_max,
-                value=safe_horizon,
-                step=1,
-            )
-        with c3:
-            one_time_boost = st.number_input(
-                "Vienkartinė suma pradžioje (€)",
-                min_value=0.0,
-                value=0.0,
-                step=100.0,
-                format="%.2f",
-            )
-
-        recent_months = month_base.tail(scenario_lookback)["month"].tolist()
-        recent_df = df[df["month"].isin(recent_months)].copy()
 
-        (
-            recent_personal_income_total,
-            recent_food_support_total,
-            recent_total_expense_total,
-            recent_personal_expense_total,
-            _,
-        ) = personal_metrics(recent_df)
-
-        base_personal_income = recent_personal_income_total / max(1, scenario_lookback)
-        base_food_support = recent_food_support_total / max(1, scenario_lookback)
-        base_total_expense = recent_total_expense_total / max(1, scenario_lookback)
-        base_personal_expense = recent_personal_expense_total / max(1, scenario_lookback)
-        base_monthly_net = base_personal_income - base_personal_expense
+            base = scenario_base(cube, scenario_lookback)
+            base_personal_income = base["income"]
+            base_food_support = base["food_support"]
+            base_total_expense = base["total_expense"]
+            base_personal_expense = base["personal_expense"]
+            base_monthly_net = base_personal_income - base_personal_expense
+
+            st.markdown(
+                f"""
+                <div class="scenario-box">
+                    <b>Bazinė asmeninė prognozė pagal paskutinių {scenario_lookback} mėn. vidurkį:</b><br>
+                    Tikros asmeninės pajamos: <b>{money(base_personal_income)}</b><br>
+                    Maisto kompensacija iš namų ūkio: <b>{money(base_food_support)}</b><br>
+                    Visos išlaidos: <b>{money(base_total_expense)}</b><br>
+                    Grynos tavo išlaidos: <b>{money(base_personal_expense)}</b><br>
+                    Vid. mėnesio likutis: <b>{money(base_monthly_net)}</b>
+                </div>
+                """,
+                unsafe_allow_html=True,
+            )
 
-        st.markdown(
-            f"""
-            <div class="scenario-box">
-                <b>Bazinė asmeninė prognozė pagal paskutinių {scenario_lookback} mėn. vidurkį:</b><br>
-                Tikros asmeninės pajamos: <b>{money(base_personal_income)}</b><br>
-                Maisto kompensacija iš namų ūkio: <b>{money(base_food_support)}</b><br>
-                Visos išlaidos: <b>{money(base_total_expense)}</b><br>
-                Grynos tavo išlaidos: <b>{money(base_personal_expense)}</b><br>
-                Vid. mėnesio likutis: <b>{money(base_monthly_net)}</b>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
+            c4, c5 = st.columns(2)
+            with c4:
+                monthly_income_change = st.number_input(
+                    "Papildomos / mažesnės mėnesio pajamos (€)",
+                    value=0.0,
+                    step=50.0,
+                    format="%.2f",
+                    help="Čia rašyk tik tas pajamas, kurias realiai gausi kiekvieną mėnesį.",
+                )
+            with c5:
+                recurring_extra_saving = st.number_input(
+                    "Papildomas taupymas kas mėn. (€)",
+                    min_value=0.0,
+                    value=0.0,
+                    step=50.0,
+                    format="%.2f",
+                )
 
-        c4, c5 = st.columns(2)
-        with c4:
-            monthly_income_change = st.number_input(
-                "Papildomos / mažesnės mėnesio pajamos (€)",
-                value=0.0,
-                step=50.0,
-                format="%.2f",
-                help="Čia rašyk tik tas pajamas, kurias realiai gausi kiekvieną mėnesį.",
-            )
-        with c5:
-            recurring_extra_saving = st.number_input(
-                "Papildomas taupymas kas mėn. (€)",
-                min_value=0.0,
-                value=0.0,
-                step=50.0,
-                format="%.2f",
+            expense_categories = ["Jokių pakeitimų"] + sorted(
+                cube.loc[cube["tipas"] == "Išlaidos", "kategorija"].unique().tolist()
             )
 
-        expense_categories = ["Jokių pakeitimų"] + sorted(
-            cat_norm(df[df["tipas"] == "Išlaidos"]["kategorija"]).unique().tolist()
-        )
+            c6, c7, c8 = st.columns([1.5, 1, 1.2])
+            with c6:
+                reduce_category = st.selectbox("Kurią kategoriją mažinti scenarijuje", expense_categories)
+            with c7:
+                reduce_pct = st.slider(
+                    "Mažinimas (%)",
+                    min_value=reduce_pct_min,
+                    max_value=reduce_pct_max,
+                    value=safe_reduce_pct,
+                    step=5,
+                )
+            with c8:
+                released_monthly_after = st.number_input(
+                    "Papildoma laisva suma po X mėn. (€)",
+                    min_value=0.0,
+                    value=0.0,
+                    step=50.0,
+                    format="%.2f",
+                )
 
-        c6, c7, c8 = st.columns([1.5, 1, 1.2])
-        with c6:
-            reduce_category = st.selectbox("Kurią kategoriją mažinti scenarijuje", expense_categories)
-        with c7:
-            reduce_pct = st.slider(
-                "Mažinimas (%)",
-                min_value=reduce_pct_min,
-                max_value=reduce_pct_max,
-                value=safe_reduce_pct,
-                step=5,
-            )
-        with c8:
-            released_monthly_after = st.number_input(
-                "Papildoma laisva suma po X mėn. (€)",
-                min_value=0.0,
-                value=0.0,
-                step=50.0,
-                format="%.2f",
+            release_start_month = st.slider(
+                "Po kiek mėn. ta suma atsiras",
+                min_value=release_start_month_min,
+                max_value=release_start_month_max,
+                value=safe_release_start_month,
+                step=1,
             )
 
-        release_start_month = st.slider(
-            "Po kiek mėn. ta suma atsiras",
-            min_value=release_start_month_min,
-            max_value=release_start_month_max,
-            value=safe_release_start_month,
-            step=1,
-        )
-
-        st.session_state["scenario_lookback_safe"] = int(scenario_lookback)
-        st.session_state["scenario_horizon_safe"] = int(scenario_horizon)
-        st.session_state["reduce_pct_safe"] = int(reduce_pct)
-        st.session_state["release_start_month_safe"] = int(release_start_month)
+            c9, c10 = st.columns([1.5, 1])
+            with c9:
+                mc_mode = st.toggle(
+                    "🎲 Monte Carlo režimas",
+                    key="mc_mode",
+                    help="Mėnesio likučiai imami atsitiktinai pagal istorinę jų sklaidą – "
+                    "grafike rodomas P10–P90 intervalas, o pagalvėms – pasiekimo tikimybė.",
+                )
+            with c10:
+                mc_paths = st.selectbox(
+                    "Simuliacijų skaičius",
+                    [MC_PATHS, 20_000, 50_000],
+                    format_func=lambda n: f"{n:,}".replace(",", " "),
+                    key="mc_paths",
+                    disabled=not mc_mode,
+                )
 
-    cat_recent = df[(df["tipas"] == "Išlaidos") & (df["month"].isin(recent_months))].copy()
-    category_cut_monthly = 0.0
+            st.session_state["scenario_lookback_safe"] = int(scenario_lookback)
+            st.session_state["scenario_horizon_safe"] = int(scenario_horizon)
+            st.session_state["reduce_pct_safe"] = int(reduce_pct)
+            st.session_state["release_start_month_safe"] = int(release_start_month)
 
-    if reduce_category != "Jokių pakeitimų" and not cat_recent.empty:
-        cat_recent["kategorija"] = cat_norm(cat_recent["kategorija"])
-        cat_total = cat_recent.loc[cat_recent["kategorija"] == reduce_category, "suma_eur"].sum()
-        category_avg_monthly = cat_total / max(1, scenario_lookback)
+        cat_recent = base["cat_recent"]
+        category_avg_monthly = category_avg(cat_recent, reduce_category, scenario_lookback)
         category_cut_monthly = category_avg_monthly * (reduce_pct / 100.0)
 
-    scenario_income = max(0.0, base_personal_income + monthly_income_change)
-    scenario_expense = max(0.0, base_personal_expense - category_cut_monthly)
-    scenario_net_after_extra = scenario_income - scenario_expense + recurring_extra_saving
+        scenario_income, scenario_expense, scenario_net_after_extra = (
+            float(v)
+            for v in scenario_net(
+                base_personal_income,
+                base_personal_expense,
+                category_avg_monthly,
+                monthly_income_change,
+                reduce_pct,
+                recurring_extra_saving,
+            )
+        )
 
-    current_personal_balance_all = personal_metrics(df)[4]
-    scenario_start_balance = current_personal_balance_all + one_time_boost
+        current_personal_balance_all = personal_metrics(cube)[4]
+        scenario_start_balance = current_personal_balance_all + one_time_boost
 
-    last_hist_month = df["month_ts"].max()
-    proj_rows = []
-    running_balance = scenario_start_balance
+        last_hist_month = cube["month_ts"].max()
 
-    for i in range(1, scenario_horizon + 1):
-        proj_month_ts = add_month_start(last_hist_month, i)
-        extra_release = released_monthly_after if i >= release_start_month else 0.0
-        proj_net = scenario_net_after_extra + extra_release
-        running_balance += proj_net
+        # Viena vektorinė prognozė ir lentelei, ir pagalvės terminams (iki TARGET_HORIZON mėn.)
+        projection = project(
+            scenario_start_balance,
+            scenario_net_after_extra,
+            released_monthly_after,
+            release_start_month,
+            horizon=max(scenario_horizon, TARGET_HORIZON),
+        )
 
-        proj_rows.append(
+        proj_df = pd.DataFrame(
             {
-                "Mėnuo": proj_month_ts.strftime("%Y-%m"),
+                "Mėnuo": pd.period_range(
+                    pd.Period(last_hist_month, freq="M") + 1, periods=scenario_horizon, freq="M"
+                ).strftime("%Y-%m"),
                 "Prognozuojamos tikros pajamos": scenario_income,
                 "Prognozuojamos tikros išlaidos": scenario_expense,
                 "Papildomas taupymas": recurring_extra_saving,
-                "Atsilaisvinusi suma": extra_release,
-                "Mėnesio likutis": proj_net,
-                "Prognozuojamas balansas": running_balance,
+                "Atsilaisvinusi suma": projection.release[:scenario_horizon],
+                "Mėnesio likutis": projection.net[:scenario_horizon],
+                "Prognozuojamas balansas": projection.balance[:scenario_horizon],
             }
         )
 
-    proj_df = pd.DataFrame(proj_rows)
-
-    reserve_3m = scenario_expense * 3
-    reserve_6m = scenario_expense * 6
-    reserve_12m = scenario_expense * 12
-
-    def months_to_target(target: float, start_balance: float, monthly_gain: float, release_amt: float, release_month: int, horizon: int = 240):
-        bal = start_balance
-        for m in range(1, horizon + 1):
-            bal += monthly_gain + (release_amt if m >= release_month else 0.0)
-            if bal >= target:
-                return m
-        return None
-
-    m_to_3 = months_to_target(reserve_3m, scenario_start_balance, scenario_net_after_extra, released_monthly_after, release_start_month)
-    m_to_6 = months_to_target(reserve_6m, scenario_start_balance, scenario_net_after_extra, released_monthly_after, release_start_month)
-    m_to_12 = months_to_target(reserve_12m, scenario_start_balance, scenario_net_after_extra, released_monthly_after, release_start_month)
+        reserve_3m = scenario_expense * 3
+        reserve_6m = scenario_expense * 6
+        reserve_12m = scenario_expense * 12
+
+        # Tikslai ieškomi TARGET_HORIZON ribose, nepriklausomai nuo pasirinkto horizonto
+        m_to_3, m_to_6, m_to_12 = projection.months_to([reserve_3m, reserve_6m, reserve_12m], within=TARGET_HORIZON)
+
+        # Tikimybė pasiekti pagalvę per pasirinktą horizontą (sklaida – iš istorinių mėnesio likučių)
+        mc = None
+        if mc_mode:
+            mc = get_monte_carlo(
+                USER_EMAIL,
+                cube_version,
+                float(scenario_start_balance),
+                float(scenario_net_after_extra),
+                float(released_monthly_after),
+                int(release_start_month),
+                int(scenario_horizon),
+                (reserve_3m, reserve_6m, reserve_12m),
+                int(mc_paths),
+                personal_series["personal_balance"].to_numpy(dtype=float),
+            )
 
-    final_12 = None
-    final_24 = None
+        def reserve_hint(months, idx):
+            hint = f"Pasieksi per {months} mėn." if months is not None else "Per prognozės ribas nepasiekiama"
+            if mc is not None:
+                hint += f" • tikimybė per {scenario_horizon} mėn.: {mc.target_probability[idx]:.0%}"
+            return hint
 
-    if len(proj_df) >= 12:
-        final_12 = proj_df.iloc[11]["Prognozuojamas balansas"]
+        final_12, final_24 = (
+            b if m <= scenario_horizon else None for m, b in zip((12, 24), projection.balance_at([12, 24]))
+        )
+        final_last = float(projection.balance[scenario_horizon - 1]) if scenario_horizon > 0 else scenario_start_balance
 
-    if len(proj_df) >= 24:
-        final_24 = proj_df.iloc[23]["Prognozuojamas balansas"]
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            render_kpi_card(
+                "📦 Startinis balansas",
+                money(scenario_start_balance),
+                "Dabartinis asmeninis balansas + vienkartinė suma",
+                tone_by_value(scenario_start_balance),
+            )
+        with c2:
+            render_kpi_card(
+                "📈 Prognozuojamas mėn. likutis",
+                money(scenario_net_after_extra),
+                "Po tikrų pajamų / tikrų išlaidų / kategorijos mažinimo / papildomo taupymo",
+                tone_by_value(scenario_net_after_extra),
+            )
+        with c3:
+            render_kpi_card(
+                f"🎯 Po {scenario_horizon} mėn.",
+                money(final_last),
+                "Prognozuojamas balansas horizonto pabaigoje",
+                "positive" if final_last >= scenario_start_balance else "warning",
+            )
 
-    final_last = proj_df.iloc[-1]["Prognozuojamas balansas"] if not proj_df.empty else scenario_start_balance
+        c4, c5, c6 = st.columns(3)
+        with c4:
+            render_kpi_card(
+                "🛟 3 mėn. pagalvė",
+                money(reserve_3m),
+                reserve_hint(m_to_3, 0),
+                "positive" if m_to_3 is not None else "warning",
+            )
+        with c5:
+            render_kpi_card(
+                "🛟 6 mėn. pagalvė",
+                money(reserve_6m),
+                reserve_hint(m_to_6, 1),
+                "positive" if m_to_6 is not None else "warning",
+            )
+        with c6:
+            render_kpi_card(
+                "🛟 12 mėn. pagalvė",
+                money(reserve_12m),
+                reserve_hint(m_to_12, 2),
+                "positive" if m_to_12 is not None else "warning",
+            )
 
-    c1, c2, c3 = st.columns(3)
-    with c1:
-        render_kpi_card(
-            "📦 Startinis balansas",
-            money(scenario_start_balance),
-            "Dabartinis asmeninis balansas + vienkartinė suma",
-            tone_by_value(scenario_start_balance),
-        )
-    with c2:
-        render_kpi_card(
-            "📈 Prognozuojamas mėn. likutis",
-            money(scenario_net_after_extra),
-            "Po tikrų pajamų / tikrų išlaidų / kategorijos mažinimo / papildomo taupymo",
-            tone_by_value(scenario_net_after_extra),
-        )
-    with c3:
-        render_kpi_card(
-            f"🎯 Po {scenario_horizon} mėn.",
-            money(final_last),
-            "Prognozuojamas balansas horizonto pabaigoje",
-            "positive" if final_last >= scenario_start_balance else "warning",
+        st.markdown(
+            f"""
+            <div class="scenario-box">
+                <b>Scenarijaus santrauka</b><br>
+                • Po 12 mėn. prognozuojamas balansas: <b>{money(final_12) if final_12 is not None else "neapskaičiuota"}</b><br>
+                • Po 24 mėn. prognozuojamas balansas: <b>{money(final_24) if final_24 is not None else "neapskaičiuota"}</b><br>
+                • Kategorijos mažinimo efektas: <b>{money(category_cut_monthly)}/mėn.</b><br>
+                • Papildomas taupymas: <b>{money(recurring_extra_saving)}/mėn.</b><br>
+                • Papildoma laisva suma nuo {release_start_month}-o mėn.: <b>{money(released_monthly_after)}/mėn.</b>
+            </div>
+            """,
+            unsafe_allow_html=True,
         )
 
-    c4, c5, c6 = st.columns(3)
-    with c4:
-        render_kpi_card(
-            "🛟 3 mėn. pagalvė",
-            money(reserve_3m),
-            f"Pasieksi per {m_to_3} mėn." if m_to_3 is not None else "Per prognozės ribas nepasiekiama",
-            "positive" if m_to_3 is not None else "warning",
-        )
-    with c5:
-        render_kpi_card(
-            "🛟 6 mėn. pagalvė",
-            money(reserve_6m),
-            f"Pasieksi per {m_to_6} mėn." if m_to_6 is not None else "Per prognozės ribas nepasiekiama",
-            "positive" if m_to_6 is not None else "warning",
-        )
-    with c6:
-        render_kpi_card(
-            "🛟 12 mėn. pagalvė",
-            money(reserve_12m),
-            f"Pasieksi per {m_to_12} mėn." if m_to_12 is not None else "Per prognozės ribas nepasiekiama",
-            "positive" if m_to_12 is not None else "warning",
+        # Išsaugoti scenarijai – perskaičiuojami su dabartiniais duomenimis. Jei lentelės
+        # dar nėra (sql/004_saved_scenarios.sql), laikomi tik šios sesijos būsenoje
+        session_saved = st.session_state.setdefault("saved_scenarios", {})
+        try:
+            saved = {**fetch_scenarios(USER_EMAIL, get_scenario_versions()[USER_EMAIL]), **session_saved}
+            scenarios_persisted = True
+        except Exception:
+            saved, scenarios_persisted = session_saved, False
+        current_params = (
+            int(scenario_lookback),
+            reduce_category,
+            int(reduce_pct),
+            float(monthly_income_change),
+            float(recurring_extra_saving),
+            float(released_monthly_after),
+            int(release_start_month),
+            float(one_time_boost),
         )
-
-    st.markdown(
-        f"""
-        <div class="scenario-box">
-            <b>Scenarijaus santrauka</b><br>
-            • Po 12 mėn. prognozuojamas balansas: <b>{money(final_12) if final_12 is not None else "neapskaičiuota"}</b><br>
-            • Po 24 mėn. prognozuojamas balansas: <b>{money(final_24) if final_24 is not None else "neapskaičiuota"}</b><br>
-            • Kategorijos mažinimo efektas: <b>{money(category_cut_monthly)}/mėn.</b><br>
-            • Papildomas taupymas: <b>{money(recurring_extra_saving)}/mėn.</b><br>
-            • Papildoma laisva suma nuo {release_start_month}-o mėn.: <b>{money(released_monthly_after)}/mėn.</b>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
-
-    # Istorinis asmeninis balansas + prognozė
-    hist_months = sorted(df["month"].unique().tolist())
-    hist_rows = []
-    running_hist_balance = 0.0
-
-    for m in hist_months:
-        m_df = df[df["month"] == m].copy()
-        _, _, _, _, m_personal_balance = personal_metrics(m_df)
-        running_hist_balance += m_personal_balance
-        hist_rows.append(
+        s1, s2, s3 = st.columns([1.5, 0.8, 2], vertical_alignment="bottom")
+        with s1:
+            scenario_name = st.text_input("Scenarijaus pavadinimas", key="scenario_name", placeholder=f"Scenarijus {len(saved) + 1}")
+        with s2:
+            if st.button("💾 Išsaugoti scenarijų"):
+                name = scenario_name.strip() or f"Scenarijus {len(saved) + 1}"
+                try:
+                    supabase.table(SCENARIOS_TABLE).upsert(
+                        {"user_email": USER_EMAIL, "name": name, "params": dict(zip(SCENARIO_FIELDS, current_params))},
+                        on_conflict="user_email,name",
+                    ).execute()
+                    get_scenario_versions()[USER_EMAIL] += 1
+                    session_saved.pop(name, None)
+                except Exception as e:
+                    session_saved[name] = current_params
+                    st.info("Scenarijus išsaugotas tik šiai sesijai – paleisk sql/004_saved_scenarios.sql.")
+                    st.caption(f"Techninė klaida: {e}")
+                saved[name] = current_params
+        with s3:
+            overlay = st.multiselect("Rodyti grafike", list(saved), default=list(saved)) if saved else []
+        if not scenarios_persisted and saved:
+            st.caption("Scenarijų lentelė nepasiekiama – scenarijai dings uždarius naršyklės skirtuką.")
+
+        # Istorinis asmeninis balansas + prognozė
+        hist_plot = pd.DataFrame(
             {
-                "label": m,
-                "month_ts": pd.Timestamp(m + "-01"),
-                "balansas": running_hist_balance,
+                "label": personal_series["month"],
+                "month_ts": personal_series["month_ts"],
+                "balansas": personal_series["cum_balance"],
                 "tipas_linijos": "Istorinis asmeninis balansas",
             }
         )
 
-    hist_plot = pd.DataFrame(hist_rows)
-
-    proj_plot = proj_df.copy()
-    proj_plot["month_ts"] = pd.to_datetime(proj_plot["Mėnuo"] + "-01")
-    proj_plot["label"] = proj_plot["Mėnuo"]
-    proj_plot["balansas"] = proj_plot["Prognozuojamas balansas"]
-    proj_plot["tipas_linijos"] = "Prognozė"
-
-    combo_plot = pd.concat(
-        [
-            hist_plot[["label", "month_ts", "balansas", "tipas_linijos"]],
-            proj_plot[["label", "month_ts", "balansas", "tipas_linijos"]],
-        ],
-        ignore_index=True,
-    ).sort_values("month_ts")
-
-    fig_proj = px.line(
-        combo_plot,
-        x="label",
-        y="balansas",
-        color="tipas_linijos",
-        markers=True,
-        title="Istorinis asmeninis balansas + ateities prognozė",
-    )
-    fig_proj.update_xaxes(type="category")
-    st.plotly_chart(fig_proj, use_container_width=True)
-
-    st.markdown("#### 🧪 Kiek duotų kategorijos sumažinimas?")
-    if not cat_recent.empty:
-        cat_avg = (
-            cat_recent.assign(kategorija=cat_norm(cat_recent["kategorija"]))
-            .groupby("kategorija", as_index=False)["suma_eur"]
-            .sum()
+        proj_plot = proj_df.copy()
+        proj_plot["month_ts"] = pd.to_datetime(proj_plot["Mėnuo"] + "-01")
+        proj_plot["label"] = proj_plot["Mėnuo"]
+        proj_plot["balansas"] = proj_plot["Prognozuojamas balansas"]
+        proj_plot["tipas_linijos"] = "Prognozė"
+
+        combo_plot = pd.concat(
+            [
+                hist_plot[["label", "month_ts", "balansas", "tipas_linijos"]],
+                proj_plot[["label", "month_ts", "balansas", "tipas_linijos"]],
+            ],
+            ignore_index=True,
+        ).sort_values("month_ts")
+
+        fig_proj = px.line(
+            combo_plot,
+            x="label",
+            y="balansas",
+            color="tipas_linijos",
+            markers=True,
+            title="Istorinis asmeninis balansas + ateities prognozė",
         )
-        cat_avg["Vid. mėn. suma"] = cat_avg["suma_eur"] / max(1, scenario_lookback)
-        cat_avg["Jei mažinčiau 10%"] = cat_avg["Vid. mėn. suma"] * 0.10
-        cat_avg["Jei mažinčiau 20%"] = cat_avg["Vid. mėn. suma"] * 0.20
-        cat_avg["Jei mažinčiau 30%"] = cat_avg["Vid. mėn. suma"] * 0.30
+        if mc is not None:
+            band_x = proj_plot["label"].tolist()
+            fig_proj.add_trace(
+                go.Scatter(x=band_x, y=mc.bands[90], mode="lines", line=dict(width=0), showlegend=False, hoverinfo="skip")
+            )
+            fig_proj.add_trace(
+                go.Scatter(
+                    x=band_x,
+                    y=mc.bands[10],
+                    mode="lines",
+                    line=dict(width=0),
+                    fill="tonexty",
+                    fillcolor="rgba(99, 110, 250, 0.2)",
+                    name="Monte Carlo P10–P90",
+                )
+            )
+            fig_proj.add_trace(
+                go.Scatter(x=band_x, y=mc.bands[50], mode="lines", line=dict(dash="dash"), name="Monte Carlo P50")
+            )
+            fig_proj.update_layout(title=f"{fig_proj.layout.title.text} • {mc.paths:,} simuliacijų".replace(",", " "))
+        saved_results = {
+            name: get_saved_projection(USER_EMAIL, cube_version, saved[name], scenario_horizon, cube) for name in saved
+        }
+        for name in overlay:
+            fig_proj.add_trace(
+                go.Scatter(
+                    x=proj_plot["label"].tolist(),
+                    y=saved_results[name][1].balance[:scenario_horizon],
+                    mode="lines",
+                    line=dict(dash="dot"),
+                    name=name,
+                )
+            )
+        fig_proj.update_xaxes(type="category")
+        st.plotly_chart(fig_proj, use_container_width=True)
+
+        if saved_results:
+            rows = []
+            for name, (expense, saved_projection) in saved_results.items():
+                months = saved_projection.months_to([expense * 3, expense * 6, expense * 12], within=TARGET_HORIZON)
+                rows.append(
+                    {
+                        "Scenarijus": name,
+                        "Mėnesio likutis": float(saved_projection.net[0]),
+                        f"Balansas po {scenario_horizon} mėn.": float(saved_projection.balance[scenario_horizon - 1]),
+                        "Mėn. iki 3 mėn. pagalvės": months[0],
+                        "Mėn. iki 6 mėn. pagalvės": months[1],
+                        "Mėn. iki 12 mėn. pagalvės": months[2],
+                    }
+                )
+            st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+            if st.button("🗑️ Išvalyti išsaugotus scenarijus"):
+                session_saved.clear()
+                if scenarios_persisted:
+                    supabase.table(SCENARIOS_TABLE).delete().eq("user_email", USER_EMAIL).execute()
+                    get_scenario_versions()[USER_EMAIL] += 1
+                st.rerun(scope="fragment")
+
+        with st.expander("🧮 Jautrumo tinklelis", expanded=False):
+            st.caption(
+                "Visi pasirinktų reikšmių deriniai skaičiuojami vienu kartu; bazė, kategorija, "
+                "vienkartinė suma ir laisva suma – iš aktyvaus scenarijaus."
+            )
+            grid_cols = st.columns(len(GRID_OPTIONS))
+            grid_values = {}
+            for col, (param, (label, options, default)) in zip(grid_cols, GRID_OPTIONS.items()):
+                with col:
+                    grid_values[param] = sorted(st.multiselect(label, options, default=default, key=f"grid_{param}"))
+
+            n_combos = math.prod(len(v) for v in grid_values.values())
+            if n_combos == 0:
+                st.info("Kiekvienam parametrui pasirink bent vieną reikšmę.")
+            elif n_combos > GRID_MAX_COMBOS:
+                st.warning(f"Per daug derinių ({n_combos} > {GRID_MAX_COMBOS}) – sumažink reikšmių skaičių.")
+            else:
+                grid_df = get_scenario_grid(
+                    USER_EMAIL,
+                    cube_version,
+                    float(scenario_start_balance),
+                    float(base_personal_income),
+                    float(base_personal_expense),
+                    float(category_avg_monthly),
+                    float(released_monthly_after),
+                    int(scenario_horizon),
+                    tuple(tuple(grid_values[p]) for p in GRID_PARAMS),
+                )
 
-        display_cat_avg = cat_avg[
-            ["kategorija", "Vid. mėn. suma", "Jei mažinčiau 10%", "Jei mažinčiau 20%", "Jei mažinčiau 30%"]
-        ].sort_values("Vid. mėn. suma", ascending=False)
+                g1, g2, g3 = st.columns(3)
+                with g1:
+                    metric = st.selectbox("Rodiklis", list(GRID_METRICS), format_func=GRID_METRICS.get, key="grid_metric")
+                with g2:
+                    y_param = st.selectbox(
+                        "Eilutės", GRID_PARAMS, index=0, format_func=lambda p: GRID_OPTIONS[p][0], key="grid_y"
+                    )
+                with g3:
+                    x_param = st.selectbox(
+                        "Stulpeliai",
+                        [p for p in GRID_PARAMS if p != y_param],
+                        format_func=lambda p: GRID_OPTIONS[p][0],
+                        key="grid_x",
+                    )
+
+                # Likę du parametrai fiksuojami – tik pjūvis jau suskaičiuotame tinklelyje
+                sliced = grid_df
+                fixed_cols = st.columns(2)
+                for col, param in zip(fixed_cols, [p for p in GRID_PARAMS if p not in (x_param, y_param)]):
+                    with col:
+                        value = st.selectbox(
+                            GRID_OPTIONS[param][0], grid_values[param], key=f"grid_fixed_{param}"
+                        )
+                    sliced = sliced[sliced[param] == value]
+
+                heat = sliced.pivot(index=y_param, columns=x_param, values=metric)
+                fig_grid = px.imshow(
+                    heat,
+                    text_auto=".0f",
+                    aspect="auto",
+                    color_continuous_scale="RdYlGn" if metric == "final_balance" else "RdYlGn_r",
+                    labels=dict(x=GRID_OPTIONS[x_param][0], y=GRID_OPTIONS[y_param][0], color=GRID_METRICS[metric]),
+                    title=f"{GRID_METRICS[metric]} • {n_combos} derinių",
+                )
+                fig_grid.update_xaxes(type="category")
+                fig_grid.update_yaxes(type="category")
+                st.plotly_chart(fig_grid, use_container_width=True)
+                if metric != "final_balance":
+                    st.caption(f"Tuščias langelis – per {TARGET_HORIZON} mėn. nepasiekiama.")
+
+        st.markdown("#### 🧪 Kiek duotų kategorijos sumažinimas?")
+        if not cat_recent.empty:
+            cat_avg = (
+                cat_recent.groupby("kategorija", as_index=False)["suma_eur"]
+                .sum()
+            )
+            cat_avg["Vid. mėn. suma"] = cat_avg["suma_eur"] / max(1, scenario_lookback)
+            cat_avg["Jei mažinčiau 10%"] = cat_avg["Vid. mėn. suma"] * 0.10
+            cat_avg["Jei mažinčiau 20%"] = cat_avg["Vid. mėn. suma"] * 0.20
+            cat_avg["Jei mažinčiau 30%"] = cat_avg["Vid. mėn. suma"] * 0.30
+
+            display_cat_avg = cat_avg[
+                ["kategorija", "Vid. mėn. suma", "Jei mažinčiau 10%", "Jei mažinčiau 20%", "Jei mažinčiau 30%"]
+            ].sort_values("Vid. mėn. suma", ascending=False)
+
+            st.dataframe(display_cat_avg, use_container_width=True, hide_index=True)
 
-        st.dataframe(display_cat_avg, use_container_width=True, hide_index=True)
+        st.markdown("#### 📅 Prognozės lentelė")
+        st.dataframe(proj_df, use_container_width=True, hide_index=True)
 
-    st.markdown("#### 📅 Prognozės lentelė")
-    st.dataframe(proj_df, use_container_width=True, hide_index=True)
+
+render_prediction_section(cube, personal_series, cube_version)
 
 # ======================================================
 # EXPORT
 # ======================================================
-st.subheader("⬇️ Eksportas (pagal pasirinktus filtrus)")
-
-bio = io.BytesIO()
-with pd.ExcelWriter(bio, engine="openpyxl") as writer:
-    df_f.drop(
-        columns=[c for c in ["year", "month", "month_ts"] if c in df_f.columns],
-        errors="ignore",
-    ).to_excel(writer, index=False)
-
-bio.seek(0)
-
-st.download_button(
-    "Parsisiųsti Excel",
-    data=bio.read(),
-    file_name="biudzetas.xlsx",
-    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+@timed_fragment("Eksportas")
+def render_export_section(df_f, data_version: int, filter_key: tuple):
+    st.subheader("⬇️ Eksportas (pagal pasirinktus filtrus)")
+
+    if df_f is None:
+        st.caption("Eksportui įjunk „Rodyti įrašus“ skiltyje „Įrašai“.")
+    elif df_f.empty:
+        st.info("Pagal pasirinktus filtrus eksportuoti nėra ką.")
+    else:
+        export_fmt = st.selectbox(
+            "Formatas",
+            list(EXPORT_FORMATS),
+            format_func=lambda f: EXPORT_FORMATS[f].label,
+            key="export_format",
+        )
+        fmt_info = EXPORT_FORMATS[export_fmt]
+
+        # Failas kuriamas tik paspaudus; kol versija ir filtrai tie patys, jis imamas iš kešo
+        export_request = (data_version, filter_key, export_fmt)
+        if export_fmt == "xlsx" and len(df_f) > EXCEL_MAX_ROWS:
+            st.warning(f"Excel ribojamas iki {EXCEL_MAX_ROWS} eilučių – didesnei istorijai rinkis CSV arba Parquet.")
+        elif st.session_state.get("export_ready") == export_request or st.button("📦 Paruošti failą"):
+            st.session_state["export_ready"] = export_request
+            export_data = build_export(USER_EMAIL, data_version, filter_key, export_fmt, df_f)
+            st.download_button(
+                f"Parsisiųsti {fmt_info.label}",
+                data=export_data,
+                file_name=fmt_info.file_name,
+                mime=fmt_info.mime,
+            )
+            st.caption(f"{len(df_f)} eil. • {len(export_data) / 1024:.0f} KB")
+
+
+render_export_section(df_f, rows_version, filter_key)
+
+rerun_stats.caption(
+    f"Šis rerun: {(time.perf_counter() - RUN_STARTED) * 1000:.0f} ms, "
+    f"skripto gijos CPU {(time.thread_time() - RUN_CPU_STARTED) * 1000:.0f} ms"
 )
@@ -0,0 +1,116 @@
+# auth_session.py
+import base64
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from gotrue import SyncGoTrueClient
+from supabase import Client
+
+# Likus tiek sekundžių iki exp, token atnaujinamas fone (vartotojas nelaukia)
+REFRESH_AHEAD_SECONDS = 300
+# Mažiau nei tiek iki exp – token nebelaikomas galiojančiu (laikrodžių skirtumui),
+# atnaujinama iškart, prieš kitas užklausas
+EXPIRY_MARGIN_SECONDS = 30
+
+
+def decode_claims(access_token: str) -> Dict[str, Any]:
+    """
+    JWT payload be parašo tikrinimo. Parašą vis tiek tikrina PostgREST
+    kiekvienoje užklausoje – čia reikia tik exp ir email, kad rerun metu
+    nereikėtų klausti /auth/v1/user.
+    """
+    try:
+        payload = access_token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        return claims if isinstance(claims, dict) else {}
+    except (AttributeError, IndexError, ValueError):
+        return {}
+
+
+@dataclass(frozen=True)
+class TokenState:
+    access_token: str
+    refresh_token: str
+    expires_at: int
+    email: str
+
+    @classmethod
+    def from_session(cls, session) -> "TokenState":
+        claims = decode_claims(session.access_token)
+        user = getattr(session, "user", None)
+        return cls(
+            access_token=session.access_token,
+            refresh_token=session.refresh_token,
+            expires_at=int(getattr(session, "expires_at", None) or claims.get("exp") or 0),
+            email=getattr(user, "email", None) or claims.get("email", ""),
+        )
+
+    def seconds_left(self) -> float:
+        return self.expires_at - time.time()
+
+    def is_valid(self) -> bool:
+        return self.seconds_left() > EXPIRY_MARGIN_SECONDS
+
+    def should_refresh(self) -> bool:
+        return self.seconds_left() <= REFRESH_AHEAD_SECONDS
+
+
+def apply_token(client: Client, access_token: str) -> None:
+    """Vartotojo JWT PostgREST užklausoms – be jokio tinklo kvietimo."""
+    client.options.headers["Authorization"] = f"Bearer {access_token}"
+    client.postgrest.auth(access_token)
+
+
+class TokenRefresher:
+    """
+    Proceso lygio token atnaujintojas. Naudoja atskirą, būsenos nesaugantį
+    gotrue klientą, todėl atnaujinimas fone nekeičia bendro Supabase kliento.
+    Tas pats refresh_token vienu metu atnaujinamas tik vieną kartą –
+    Supabase refresh token'us rotuoja, antras bandymas jį atšauktų.
+    """
+
+    def __init__(self, url: str, key: str, http_client: Optional[httpx.Client] = None):
+        self._auth = SyncGoTrueClient(
+            url=f"{url}/auth/v1",
+            headers={"apikey": key, "Authorization": f"Bearer {key}"},
+            auto_refresh_token=False,
+            persist_session=False,
+            http_client=http_client,
+        )
+        self._pool = ThreadPoolExecutor(max_workers=2)
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Future] = {}
+
+    def _refresh(self, refresh_token: str) -> Tuple[TokenState, float]:
+        started = time.perf_counter()
+        try:
+            res = self._auth.refresh_session(refresh_token)
+            if res.session is None:
+                raise RuntimeError("Sesijos atnaujinti nepavyko")
+            return TokenState.from_session(res.session), (time.perf_counter() - started) * 1000
+        finally:
+            with self._lock:
+                self._pending.pop(refresh_token, None)
+
+    def submit(self, state: TokenState) -> Future:
+        """Atnaujinimas fone; rezultatas – (TokenState, ms)."""
+        with self._lock:
+            future = self._pending.get(state.refresh_token)
+            if future is None:
+                future = self._pool.submit(self._refresh, state.refresh_token)
+                self._pending[state.refresh_token] = future
+            return future
+
+    def refresh(self, state: TokenState, timeout: float = 15.0) -> Tuple[TokenState, float]:
+        """Sinchroninis atnaujinimas (jei fone jau vyksta – laukiama jo)."""
+        return self.submit(state).result(timeout=timeout)
+
+    def sign_out(self, state: TokenState) -> None:
+        """Atšaukia būtent šio vartotojo sesiją (ne tą, kuri tuo metu bendrame kliente)."""
+        self._auth.admin.sign_out(state.access_token)
@@ -0,0 +1,102 @@
+# batch_writes.py
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from postgrest.exceptions import APIError
+from supabase import Client
+
+# Kiek eilučių siunčiama vienu HTTP užklausimu
+CHUNK_SIZE = 500
+
+# PostgREST klaida, kai RPC funkcijos nėra (sql/005_batch_update.sql nepaleistas)
+RPC_NOT_FOUND = "PGRST202"
+
+
+@dataclass
+class WriteBatch:
+    """
+    Surinkti pakeitimai, siunčiami kuo mažesniu užklausų skaičiumi:
+    updates – {"id": ..., tik pakeisti stulpeliai}; vienodi pakeitimai (pvz.
+    kategorija pagal taisykles) – per vieną update() ... in_(id), skirtingi –
+    per vieną update_rpc kvietimą, deletes – per vieną delete ... in_(id),
+    inserts – per vieną insert (kiekvienam CHUNK_SIZE eilučių).
+    """
+
+    inserts: List[Dict[str, Any]] = field(default_factory=list)
+    updates: List[Dict[str, Any]] = field(default_factory=list)
+    deletes: List[Any] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.inserts) + len(self.updates) + len(self.deletes)
+
+    def is_empty(self) -> bool:
+        return len(self) == 0
+
+
+def _chunks(items: List[Any], size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _update_groups(updates: List[Dict[str, Any]]) -> Dict[str, Tuple[Dict[str, Any], List[Any]]]:
+    """Eilutės su vienodomis naujomis reikšmėmis sujungiamos į vieną update() ... in_(id)."""
+    groups: Dict[str, Tuple[Dict[str, Any], List[Any]]] = {}
+    for row in updates:
+        payload = {k: v for k, v in row.items() if k != "id"}
+        key = json.dumps(payload, sort_keys=True, default=str)
+        groups.setdefault(key, (payload, []))[1].append(row["id"])
+    return groups
+
+
+def _check_updated(requested: List[Any], data: List[Dict[str, Any]]) -> None:
+    missing = set(requested) - {r.get("id") for r in data}
+    if missing:
+        raise RuntimeError(f"Įrašas nerastas arba jo keisti neleidžiama (id: {', '.join(map(str, sorted(missing)))}).")
+
+
+def commit_batch(
+    client: Client,
+    table: str,
+    batch: WriteBatch,
+    chunk_size: int = CHUNK_SIZE,
+    update_rpc: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Išsiunčia batch į Supabase. Grąžina serverio eilutes, kurios turi likti
+    kešė (atnaujintas ir naujas); ištrintos negrąžinamos.
+    Keičiamos tik esamos eilutės (update, ne upsert) – jei kurios nors
+    serveris negrąžina (ištrinta kitur arba RLS neleidžia), iškeliama klaida.
+    Kai pakeitimų grupių daugiau nei viena ir nurodyta update_rpc, visas
+    gabalas siunčiamas vienu RPC kvietimu; jei funkcijos serveryje nėra –
+    po update() ... in_(id) kiekvienai grupei.
+    Pirma klaida nutraukia likusias užklausas ir iškeliama aukštyn; jau
+    išsiųsti pakeitimai serveryje lieka, todėl kvietėjas turi persisinchronizuoti.
+    """
+    kept: List[Dict[str, Any]] = []
+
+    groups = _update_groups(batch.updates)
+    if update_rpc is not None and len(groups) > 1:
+        try:
+            for chunk in _chunks(batch.updates, chunk_size):
+                data = client.postgrest.rpc(update_rpc, {"p_rows": chunk}).execute().data or []
+                _check_updated([r["id"] for r in chunk], data)
+                kept.extend(data)
+            groups = {}
+        except APIError as e:
+            if e.code != RPC_NOT_FOUND or kept:
+                raise
+
+    for payload, ids in groups.values():
+        for chunk in _chunks(ids, chunk_size):
+            data = client.table(table).update(payload).in_("id", chunk).execute().data or []
+            _check_updated(chunk, data)
+            kept.extend(data)
+
+    for chunk in _chunks(batch.deletes, chunk_size):
+        client.table(table).delete().in_("id", chunk).execute()
+
+    for chunk in _chunks(batch.inserts, chunk_size):
+        kept.extend(client.table(table).insert(chunk).execute().data or [])
+
+    return kept
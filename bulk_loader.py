@@ -0,0 +1,122 @@
+# bulk_loader.py
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Sequence, Tuple
+
+from supabase import Client
+
+# PostgREST numatytasis max-rows yra 1000 – didesnis puslapis vis tiek būtų nukirptas.
+PAGE_SIZE = 1000
+MAX_WORKERS = 4
+
+# (operatorius, stulpelis, reikšmė), pvz. ("eq", "user_email", email)
+Filter = Tuple[str, str, Any]
+
+
+@dataclass
+class PageTiming:
+    index: int
+    start: int
+    end: int
+    rows: int
+    seconds: float
+
+
+@dataclass
+class LoadResult:
+    rows: List[Dict[str, Any]]
+    total: int
+    seconds: float = 0.0
+    count_seconds: float = 0.0
+    pages: List[PageTiming] = field(default_factory=list)
+
+    def timings_table(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "Puslapis": p.index + 1,
+                "Eilutės": f"{p.start}–{p.end}",
+                "Gauta": p.rows,
+                "Laikas (ms)": round(p.seconds * 1000, 1),
+            }
+            for p in self.pages
+        ]
+
+
+def _apply_filters(query, filters: Sequence[Filter]):
+    for op, col, value in filters:
+        query = getattr(query, op)(col, value)
+    return query
+
+
+def count_rows(client: Client, table: str, filters: Sequence[Filter]) -> int:
+    query = client.table(table).select("id", count="exact")
+    res = _apply_filters(query, filters).limit(1).execute()
+    return int(res.count or 0)
+
+
+def _fetch_page(client: Client, table: str, filters: Sequence[Filter], start: int, end: int) -> List[Dict[str, Any]]:
+    """
+    Parsiunčia [start, end] intervalą. Jei serverio max-rows mažesnis nei
+    puslapis, likutį pasiima papildomomis užklausomis.
+    """
+    rows: List[Dict[str, Any]] = []
+    while start <= end:
+        query = _apply_filters(client.table(table).select("*"), filters)
+        chunk = query.order("data", desc=False).order("id", desc=False).range(start, end).execute().data or []
+        if not chunk:
+            break
+        rows.extend(chunk)
+        start += len(chunk)
+    return rows
+
+
+def load_all_rows(
+    client: Client,
+    table: str,
+    filters: Sequence[Filter],
+    page_size: int = PAGE_SIZE,
+    max_workers: int = MAX_WORKERS,
+) -> LoadResult:
+    """
+    Suskaičiuoja eilutes, padalina į .range() puslapius ir juos parsiunčia
+    lygiagrečiai ribotame gijų baseine. Rezultatas surikiuotas pagal data, id.
+
+    Klientas gali būti bet kuris supabase Client, taip pat sukurtas
+    lokaliam PostgREST (pvz. create_client("http://localhost:3000", key)).
+    """
+    t0 = time.perf_counter()
+    total = count_rows(client, table, filters)
+    count_seconds = time.perf_counter() - t0
+
+    if total == 0:
+        return LoadResult(rows=[], total=0, seconds=count_seconds, count_seconds=count_seconds)
+
+    ranges = [(start, min(start + page_size, total) - 1) for start in range(0, total, page_size)]
+
+    def run(index: int) -> Tuple[List[Dict[str, Any]], PageTiming]:
+        start, end = ranges[index]
+        p0 = time.perf_counter()
+        rows = _fetch_page(client, table, filters, start, end)
+        return rows, PageTiming(index, start, end, len(rows), time.perf_counter() - p0)
+
+    if len(ranges) == 1:
+        results = [run(0)]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(ranges))) as pool:
+            # map išlaiko puslapių tvarką, nors jie grįžta skirtingu metu
+            results = list(pool.map(run, range(len(ranges))))
+
+    rows: List[Dict[str, Any]] = []
+    pages: List[PageTiming] = []
+    for page_rows, timing in results:
+        rows.extend(page_rows)
+        pages.append(timing)
+
+    return LoadResult(
+        rows=rows,
+        total=total,
+        seconds=time.perf_counter() - t0,
+        count_seconds=count_seconds,
+        pages=pages,
+    )
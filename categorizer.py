@@ -0,0 +1,181 @@
+# categorizer.py
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+RULE_KINDS = {
+    "merchant": "Tiksli prekybos vieta",
+    "prefix": "Prekybos vieta prasideda",
+    "keyword": "Raktažodis (vieta / aprašymas)",
+    "amount": "Sumos intervalas",
+}
+
+
+def _norm(x: Any) -> str:
+    return str(x or "").strip().casefold()
+
+
+@dataclass
+class Rule:
+    kind: str
+    kategorija: str
+    pattern: str = ""
+    min_amount: Optional[float] = None
+    max_amount: Optional[float] = None
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "Rule":
+        def amount(v):
+            return None if v is None or pd.isna(v) else float(v)
+
+        return cls(
+            kind=str(row.get("kind") or ""),
+            kategorija=str(row.get("kategorija") or "").strip(),
+            pattern=str(row.get("pattern") or ""),
+            min_amount=amount(row.get("min_amount")),
+            max_amount=amount(row.get("max_amount")),
+        )
+
+
+@dataclass
+class RuleIndex:
+    """
+    Taisyklės, sukompiliuotos vieną kartą:
+    - merchant: hash žodynas (normalizuota vieta → kategorija);
+    - prefix: trie, ieškomas ilgiausias sutampantis prefiksas;
+    - keyword: viena regex alternatyva per visus raktažodžius;
+    - amount: intervalų masyvai, tikrinami vektoriškai.
+    Prioritetas: merchant > prefix > keyword > amount.
+    """
+
+    exact: Dict[str, str] = field(default_factory=dict)
+    trie: Dict[str, Any] = field(default_factory=dict)
+    keywords: Dict[str, str] = field(default_factory=dict)
+    keyword_re: Optional[re.Pattern] = None
+    amount_min: np.ndarray = field(default_factory=lambda: np.empty(0))
+    amount_max: np.ndarray = field(default_factory=lambda: np.empty(0))
+    amount_cat: List[str] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.exact) + self._trie_size(self.trie) + len(self.keywords) + len(self.amount_cat)
+
+    @staticmethod
+    def _trie_size(node: Dict[str, Any]) -> int:
+        return sum(1 if k == "" else RuleIndex._trie_size(v) for k, v in node.items())
+
+    def _prefix_lookup(self, text: str) -> Optional[str]:
+        node, found = self.trie, None
+        for ch in text:
+            node = node.get(ch)
+            if node is None:
+                break
+            found = node.get("", found)
+        return found
+
+    def _lookup_merchant(self, merchant: str) -> Optional[str]:
+        return self.exact.get(merchant) or self._prefix_lookup(merchant)
+
+    def _lookup_keyword(self, text: str) -> Optional[str]:
+        m = self.keyword_re.search(text) if self.keyword_re is not None else None
+        return self.keywords[m.group(0)] if m else None
+
+    def classify(self, merchant: pd.Series, description: pd.Series, amount: pd.Series) -> pd.Series:
+        """
+        Grąžina kategoriją kiekvienai eilutei (NaN – jokia taisyklė netiko).
+        Žodynas / trie / regex vykdomi tik unikalioms reikšmėms, o rezultatas
+        grąžinamas eilutėms per factorize kodus.
+        """
+        result = pd.Series(np.nan, index=merchant.index, dtype=object)
+        if len(merchant) == 0 or len(self) == 0:
+            return result
+
+        merchant_n = merchant.astype(object).fillna("").astype(str).str.strip().str.casefold()
+
+        if self.exact or self.trie:
+            codes, uniques = pd.factorize(merchant_n)
+            looked = np.array([self._lookup_merchant(u) for u in uniques], dtype=object)
+            result = pd.Series(looked[codes], index=merchant.index, dtype=object)
+
+        if self.keyword_re is not None:
+            todo = result.isna()
+            if todo.any():
+                text = merchant_n[todo] + " " + description[todo].astype(object).fillna("").astype(str).str.casefold()
+                codes, uniques = pd.factorize(text)
+                looked = np.array([self._lookup_keyword(u) for u in uniques], dtype=object)
+                result.loc[todo] = looked[codes]
+
+        if self.amount_cat:
+            todo = result.isna().to_numpy()
+            if todo.any():
+                values = amount.to_numpy(dtype=float)[todo][:, None]
+                hits = (values >= self.amount_min) & (values <= self.amount_max)
+                first = hits.argmax(axis=1)
+                matched = hits.any(axis=1)
+                cats = np.array(self.amount_cat, dtype=object)[first]
+                idx = np.flatnonzero(todo)[matched]
+                result.iloc[idx] = cats[matched]
+
+        return result
+
+
+def compile_rules(rules: Iterable[Rule]) -> RuleIndex:
+    index = RuleIndex()
+    amount_rules = []
+
+    for rule in rules:
+        if not rule.kategorija:
+            continue
+        pattern = _norm(rule.pattern)
+        if rule.kind == "merchant" and pattern:
+            index.exact.setdefault(pattern, rule.kategorija)
+        elif rule.kind == "prefix" and pattern:
+            node = index.trie
+            for ch in pattern:
+                node = node.setdefault(ch, {})
+            node.setdefault("", rule.kategorija)
+        elif rule.kind == "keyword" and pattern:
+            index.keywords.setdefault(pattern, rule.kategorija)
+        elif rule.kind == "amount" and (rule.min_amount is not None or rule.max_amount is not None):
+            lo = rule.min_amount if rule.min_amount is not None else -np.inf
+            hi = rule.max_amount if rule.max_amount is not None else np.inf
+            amount_rules.append((lo, hi, rule.kategorija))
+
+    if index.keywords:
+        # Ilgesni raktažodžiai pirmi, kad „maxima xx“ laimėtų prieš „maxima“
+        ordered = sorted(index.keywords, key=len, reverse=True)
+        index.keyword_re = re.compile("|".join(re.escape(k) for k in ordered))
+
+    if amount_rules:
+        index.amount_min = np.array([r[0] for r in amount_rules], dtype=float)
+        index.amount_max = np.array([r[1] for r in amount_rules], dtype=float)
+        index.amount_cat = [r[2] for r in amount_rules]
+
+    return index
+
+
+def categorize_frame(frame: pd.DataFrame, index: RuleIndex, only_unknown: bool = True, unknown: str = "Nežinoma") -> pd.Series:
+    """
+    Pritaiko taisykles visam DataFrame vienu kartu. Grąžina naują kategorijų
+    stulpelį; eilutės, kurioms netiko jokia taisyklė (arba only_unknown ir
+    kategorija jau žinoma), palieka esamą kategoriją.
+    """
+    current = frame["kategorija"].astype(object).fillna("").astype(str)
+    mask = current.str.strip().isin(["", unknown]) if only_unknown else pd.Series(True, index=frame.index)
+
+    if not mask.any() or len(index) == 0:
+        return current
+
+    sub = frame[mask]
+    empty = pd.Series("", index=sub.index, dtype=object)
+    found = index.classify(
+        sub["prekybos_centras"] if "prekybos_centras" in sub.columns else empty,
+        sub["aprasymas"] if "aprasymas" in sub.columns else empty,
+        sub["suma_eur"],
+    )
+    out = current.copy()
+    hit = found.notna()
+    out.loc[found.index[hit]] = found[hit]
+    return out
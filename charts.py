@@ -0,0 +1,74 @@
+# charts.py
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+# Daugiau taškų ekrano pločiui vis tiek neišryškės – likusius išmetame LTTB
+MAX_POINTS = 1500
+# Virš šios ribos linija piešiama WebGL (scattergl), ne SVG
+WEBGL_THRESHOLD = 1000
+# Horizontaliame stulpelių grafike rodomos didžiausios kategorijos, likusios sujungiamos
+MAX_BARS = 25
+OTHER_LABEL = "Kitos"
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: n_out taškų indeksai, išlaikantys kreivės
+    formą (pirmas ir paskutinis taškai visada lieka). x turi būti didėjantis.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = x.astype(float)
+    y = y.astype(float)
+    # Vidiniai taškai (be pirmo ir paskutinio) dalinami į n_out - 2 krepšelius
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+
+    out = np.empty(n_out, dtype=np.int64)
+    out[0] = 0
+    out[-1] = n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Kito krepšelio vidurkis – trikampio trečia viršūnė
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nlo:nhi].mean() if nhi > nlo else x[-1]
+        avg_y = y[nlo:nhi].mean() if nhi > nlo else y[-1]
+
+        area = np.abs(
+            (x[prev] - avg_x) * (y[lo:hi] - y[prev])
+            - (x[prev] - x[lo:hi]) * (avg_y - y[prev])
+        )
+        prev = lo + int(area.argmax())
+        out[i + 1] = prev
+    return out
+
+
+def downsample(frame: pd.DataFrame, x: str, y: str, max_points: int = MAX_POINTS) -> pd.DataFrame:
+    if len(frame) <= max_points:
+        return frame
+    xs = frame[x]
+    x_num = xs.astype("int64").to_numpy() if pd.api.types.is_datetime64_any_dtype(xs) else xs.to_numpy()
+    return frame.iloc[lttb_indices(x_num, frame[y].to_numpy(), max_points)]
+
+
+def line_figure(frame: pd.DataFrame, x: str, y: str, title: str, max_points: int = MAX_POINTS, **kwargs):
+    """px.line su LTTB sumažintais taškais ir WebGL dideliems rinkiniams."""
+    plotted = downsample(frame, x, y, max_points)
+    render_mode = "webgl" if len(plotted) > WEBGL_THRESHOLD else "svg"
+    fig = px.line(plotted, x=x, y=y, title=title, render_mode=render_mode, **kwargs)
+    if len(plotted) < len(frame):
+        fig.update_layout(title=f"{title} • {len(plotted)} iš {len(frame)} taškų")
+    return fig
+
+
+def top_n_with_other(frame: pd.DataFrame, label: str, value: str, n: int = MAX_BARS) -> pd.DataFrame:
+    """Didžiausios n reikšmių, o likusios sujungiamos į vieną „Kitos“ eilutę."""
+    if len(frame) <= n:
+        return frame
+    ordered = frame.sort_values(value, ascending=False)
+    head, tail = ordered.iloc[: n - 1], ordered.iloc[n - 1:]
+    other = pd.DataFrame({label: [f"{OTHER_LABEL} ({len(tail)})"], value: [tail[value].sum()]})
+    return pd.concat([head, other], ignore_index=True)
@@ -0,0 +1,100 @@
+# client_pool.py
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from supabase import Client
+
+from auth_session import apply_token
+
+# Daugiausiai tiek klientų laikoma vienu metu (seniausiai naudoti išmetami pirmi)
+POOL_MAX_CLIENTS = 64
+# Tiek sekundžių nenaudotas klientas išmetamas (naršyklės skirtukas uždarytas ir pan.)
+POOL_IDLE_SECONDS = 15 * 60
+
+
+@dataclass
+class PooledClient:
+    client: Client
+    access_token: Optional[str]
+    last_used: float
+
+
+class ClientPool:
+    """
+    Kiekvienai naršyklės sesijai ir vartotojui – atskiras Supabase klientas.
+    Anksčiau visos sesijos dalinosi vienu klientu ir kiekvieną rerun perrašydavo
+    jo token'ą, todėl lygiagrečios užklausos galėjo išeiti su svetimu JWT.
+    Dydis ribojamas: nenaudoti ilgiau nei idle_seconds ir seniausiai naudoti
+    (LRU) virš max_size išmetami. Išmestas klientas neuždaromas – jį dar gali
+    naudoti nebaigta foninė operacija, o httpx ryšius uždarys GC.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Client],
+        max_size: int = POOL_MAX_CLIENTS,
+        idle_seconds: float = POOL_IDLE_SECONDS,
+    ):
+        self._factory = factory
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self._clients: "OrderedDict[Tuple[str, str], PooledClient]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted_lru = 0
+        self.evicted_idle = 0
+
+    def acquire(self, session_id: str, email: str, access_token: Optional[str]) -> Client:
+        """Sesijos klientas su dabartiniu token'u (sukuriamas, jei dar nėra)."""
+        key = (session_id, email)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            pooled = self._clients.get(key)
+            if pooled is None:
+                self.misses += 1
+                pooled = PooledClient(client=self._factory(), access_token=None, last_used=now)
+                self._clients[key] = pooled
+                while len(self._clients) > self.max_size:
+                    self._clients.popitem(last=False)
+                    self.evicted_lru += 1
+            else:
+                self.hits += 1
+                self._clients.move_to_end(key)
+            pooled.last_used = now
+
+        # Token keičiamas tik šios sesijos klientui ir tik kai jis pasikeitė
+        if access_token and access_token != pooled.access_token:
+            apply_token(pooled.client, access_token)
+            pooled.access_token = access_token
+        return pooled.client
+
+    def discard(self, session_id: str) -> None:
+        """Atsijungus – išmetami visi šios sesijos klientai."""
+        with self._lock:
+            for key in [k for k in self._clients if k[0] == session_id]:
+                del self._clients[key]
+
+    def _evict_idle(self, now: float) -> None:
+        # OrderedDict surikiuotas pagal paskutinį naudojimą – seniausi priekyje
+        while self._clients:
+            key, pooled = next(iter(self._clients.items()))
+            if now - pooled.last_used < self.idle_seconds:
+                break
+            del self._clients[key]
+            self.evicted_idle += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._clients),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evicted_lru": self.evicted_lru,
+                "evicted_idle": self.evicted_idle,
+            }
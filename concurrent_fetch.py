@@ -0,0 +1,70 @@
+# concurrent_fetch.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Tuple
+
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+MAX_WORKERS = 4
+
+
+@dataclass
+class FetchReport:
+    """Kiekvieno kvietimo trukmė ir bendras laikas – šaltas įkėlimas ≈ ilgiausias kvietimas, ne suma."""
+
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+    errors: Dict[str, str] = field(default_factory=dict)
+    wall_ms: float = 0.0
+
+    @property
+    def sum_ms(self) -> float:
+        return sum(self.timings_ms.values())
+
+    def summary(self) -> str:
+        parts = " • ".join(f"{name} {ms:.0f} ms" for name, ms in self.timings_ms.items())
+        return f"Lygiagretus įkėlimas: {self.wall_ms:.0f} ms (nuosekliai būtų ~{self.sum_ms:.0f} ms) • {parts}"
+
+
+def fetch_concurrently(
+    calls: Dict[str, Callable[[], Any]],
+    max_workers: int = MAX_WORKERS,
+) -> Tuple[Dict[str, Any], FetchReport]:
+    """
+    Nepriklausomi kvietimai (eilutės, agregatai, taisyklės) paleidžiami vienu
+    metu ir sujungiami. Sinchroninis – Streamlit skriptas tiesiog gauna
+    rezultatus. Nepavykęs kvietimas rezultatuose nepateikiamas (klaida –
+    report.errors), kad skriptas jį pakartotų ir parodytų klaidą savo vietoje.
+    Darbinėms gijoms perduodamas skripto kontekstas, kad veiktų st.cache_data.
+    """
+    report = FetchReport()
+    results: Dict[str, Any] = {}
+    if not calls:
+        return results, report
+
+    ctx = get_script_run_ctx()
+    lock = threading.Lock()
+
+    def run(name: str, fn: Callable[[], Any]) -> None:
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        started = time.perf_counter()
+        try:
+            value = fn()
+        except Exception as e:
+            with lock:
+                report.errors[name] = str(e)
+        else:
+            with lock:
+                results[name] = value
+        finally:
+            with lock:
+                report.timings_ms[name] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(calls))) as pool:
+        for future in [pool.submit(run, name, fn) for name, fn in calls.items()]:
+            future.result()
+    report.wall_ms = (time.perf_counter() - started) * 1000
+    return results, report
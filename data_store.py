@@ -0,0 +1,500 @@
+# data_store.py
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+from supabase import Client
+
+from analytics import cat_norm
+from bulk_loader import LoadResult, load_all_rows
+from disk_cache import DiskCache
+
+TOMBSTONE_TABLE = "biudzetas_tombstones"
+
+# Kaip dažnai (sek.) tikrinti serverį dėl pakeitimų. Anksčiau tai buvo
+# st.cache_data TTL, po kurio visa lentelė būdavo siunčiama iš naujo.
+SYNC_TTL_SECONDS = 60
+
+# Nedidelis persidengimas, kad nepraleistume eilučių, kurių updated_at
+# užfiksuotas transakcijos pradžioje, bet matomas tapo tik po jos pabaigos.
+SYNC_OVERLAP = timedelta(seconds=5)
+
+# Bendras fono rašytojų skaičius visiems vartotojams
+WRITER_THREADS = 4
+
+TEXT_COLUMNS = ["kategorija", "prekybos_centras", "aprasymas", "tipas"]
+
+# Pasikartojančios reikšmės laikomos kaip pandas categorical (kodai + žodynas).
+# kat – normalizuota kategorija, paskaičiuojama vieną kartą įkeliant.
+CATEGORICAL_COLUMNS = TEXT_COLUMNS + ["user_email", "month", "kat"]
+# prepare_rows skaičiuojami stulpeliai (serverio eilutėse jų nėra)
+DERIVED_COLUMNS = ["kat", "year", "month_ts", "month"]
+
+
+def prepare_rows(rows: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Paverčia Supabase eilutes į DataFrame su išvestiniais stulpeliais.
+    Naudojama ir pilnam įkėlimui, ir tik pasikeitusioms eilutėms.
+    """
+    df_local = pd.DataFrame(rows)
+    if df_local.empty:
+        return df_local
+
+    df_local["data"] = pd.to_datetime(df_local["data"], errors="coerce")
+    df_local = df_local.dropna(subset=["data"])
+    df_local["suma_eur"] = pd.to_numeric(df_local["suma_eur"], errors="coerce").fillna(0.0)
+
+    for col in TEXT_COLUMNS:
+        if col in df_local.columns:
+            df_local[col] = df_local[col].fillna("").astype(str).astype("category")
+    if "user_email" in df_local.columns:
+        df_local["user_email"] = df_local["user_email"].astype("category")
+    df_local["kat"] = cat_norm(df_local["kategorija"])
+
+    if "updated_at" in df_local.columns:
+        df_local["updated_at"] = pd.to_datetime(df_local["updated_at"], errors="coerce", utc=True)
+
+    df_local["year"] = df_local["data"].dt.year
+    df_local["month_ts"] = df_local["data"].dt.to_period("M").dt.to_timestamp()
+    # "YYYY-MM" formatuojamas tik unikaliems mėnesiams, ne kiekvienai eilutei
+    month_codes, month_uniques = pd.factorize(df_local["month_ts"])
+    df_local["month"] = pd.Categorical.from_codes(month_codes, categories=month_uniques.strftime("%Y-%m"))
+
+    return df_local
+
+
+class OrderedWriter:
+    """
+    Bendras gijų baseinas fono rašymams. To paties vartotojo (key) darbai
+    vykdomi po vieną, pateikimo tvarka, kad to paties įrašo pakeitimai
+    nesusimaišytų; skirtingų vartotojų – lygiagrečiai.
+    """
+
+    def __init__(self, max_workers: int = WRITER_THREADS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="data-store-writer")
+        self._lock = threading.Lock()
+        # key → laukiantys darbai; raktas yra, kol to vartotojo darbas vykdomas
+        self._queues: Dict[str, Deque[Tuple[Future, Callable[..., Any], tuple]]] = {}
+
+    def submit(self, key: str, fn: Callable[..., Any], *args: Any) -> Future:
+        future: Future = Future()
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is not None:
+                queue.append((future, fn, args))
+                return future
+            self._queues[key] = deque()
+        self._pool.submit(self._drain, key, future, fn, args)
+        return future
+
+    def _drain(self, key: str, future: Future, fn: Callable[..., Any], args: tuple) -> None:
+        while True:
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = fn(*args)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    return
+                future, fn, args = queue.popleft()
+
+
+@dataclass
+class UserEntry:
+    df: Optional[pd.DataFrame] = None
+    # Didžiausias matytas updated_at – nuo jo prašome tik pasikeitusių eilučių.
+    watermark: Optional[pd.Timestamp] = None
+    synced_at: float = 0.0
+    stale: bool = False
+    # Didėja po kiekvieno šio vartotojo duomenų pasikeitimo – naudojamas
+    # išvestinių kešų raktuose vietoj globalaus st.cache_data.clear().
+    version: int = 0
+    hits: int = 0
+    misses: int = 0
+    last_load: Optional[LoadResult] = None
+    # Paskutinė į diską įrašyta versija; from_disk – duomenys paimti iš disko po perkrovimo
+    persisted_version: int = -1
+    from_disk: bool = False
+    # Fone atmesti optimistiniai pakeitimai – parodomi kitame rerun.
+    errors: List[str] = field(default_factory=list)
+    # Dar serverio nepatvirtinti optimistiniai pakeitimai
+    pending: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class UserDataStore:
+    """
+    Proceso lygio kiekvieno vartotojo duomenų saugykla.
+
+    Pirmą kartą vartotojo eilutės parsiunčiamos pilnai, vėliau – tik tos,
+    kurių updated_at >= watermark, o ištrintos ateina per tombstone lentelę.
+    Jei lentelėje nėra updated_at (migracija nepritaikyta) arba tombstone
+    užklausa nepavyksta, grįžtama prie pilno perkrovimo.
+
+    Su disk: po serverio perkrovimo vartotojo duomenys iškart paimami iš
+    disko, o delta sinchronizacija vyksta fone (to vartotojo rašymų eilėje).
+    """
+
+    def __init__(self, table: str, disk: Optional[DiskCache] = None):
+        self.table = table
+        self.disk = disk
+        self._entries: Dict[str, UserEntry] = {}
+        self._lock = threading.Lock()
+        self._temp_ids = itertools.count(-1, -1)
+        self._writer = OrderedWriter()
+        # Vienas bendras rašytojas į diską – Parquet rašymas neturi stabdyti rerun
+        self._disk_writer = ThreadPoolExecutor(max_workers=1)
+        if disk is not None:
+            self._disk_writer.submit(disk.evict)
+
+    def _entry(self, email: str) -> UserEntry:
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None:
+                entry = UserEntry()
+                self._entries[email] = entry
+            return entry
+
+    def get(self, client: Client, email: str) -> pd.DataFrame:
+        return self.get_versioned(client, email)[0]
+
+    def get_versioned(self, client: Client, email: str) -> Tuple[pd.DataFrame, int]:
+        """Grąžina DataFrame ir jo versiją, paimtus po vienu užraktu."""
+        entry = self._entry(email)
+        with entry.lock:
+            if entry.df is None and self._load_from_disk(client, email, entry):
+                entry.hits += 1
+            elif entry.df is None:
+                entry.misses += 1
+                self._full_load(client, email, entry)
+            elif entry.stale or time.monotonic() - entry.synced_at >= SYNC_TTL_SECONDS:
+                entry.misses += 1
+                self._delta_sync(client, email, entry)
+            else:
+                entry.hits += 1
+            return entry.df, entry.version
+
+    def _load_from_disk(self, client: Client, email: str, entry: UserEntry) -> bool:
+        """Disko kopija grąžinama iškart, o jos tikrinimas su serveriu – fone."""
+        if self.disk is None:
+            return False
+        cached = self.disk.load(self.table, email)
+        if cached is None:
+            return False
+        entry.df, entry.watermark = cached
+        entry.version += 1
+        entry.persisted_version = entry.version
+        entry.from_disk = True
+        # Kol vyksta foninis tikrinimas, kiti skaitymai jo nekartoja
+        entry.synced_at = time.monotonic()
+        self._writer.submit(email, self._revalidate, client, email, entry)
+        return True
+
+    def _revalidate(self, client: Client, email: str, entry: UserEntry) -> None:
+        with entry.lock:
+            try:
+                self._delta_sync(client, email, entry)
+            except Exception:
+                # Tinklas nepasiekiamas – kitas skaitymas bandys sinchroniškai
+                entry.stale = True
+
+    def _persist(self, email: str, entry: UserEntry) -> None:
+        """
+        Kviečiama laikant entry.lock. Rašoma fone; DataFrame nekintamas
+        (_replace_rows visada kuria naują), todėl užtenka nuorodos.
+        Su laikinais (neigiamais) id nerašome – kitaip po perkrovimo liktų dublikatai.
+        """
+        if self.disk is None or entry.df is None or entry.persisted_version == entry.version:
+            return
+        if not entry.df.empty and (entry.df["id"] < 0).any():
+            return
+        entry.persisted_version = entry.version
+        self._disk_writer.submit(self.disk.save, self.table, email, entry.df, entry.watermark)
+
+    def invalidate(self, email: str) -> None:
+        """
+        Kviečiama po šio vartotojo įrašymo: padidina tik jo versiją, o kitas
+        skaitymas atliks delta sinchronizaciją nelaukdamas TTL.
+        Kitų vartotojų kešai lieka šilti.
+        """
+        entry = self._entry(email)
+        with entry.lock:
+            entry.stale = True
+            # Su įkeltomis eilutėmis versiją padidins delta, jei kas nors tikrai pasikeitė;
+            # be jų (serverio agregatų režimas) sinchronizuoti nėra ko – didiname iškart
+            if entry.df is None:
+                entry.version += 1
+
+    def temp_id(self) -> int:
+        """Laikinas (neigiamas) id naujam įrašui, kol serveris grąžins tikrą."""
+        with self._lock:
+            return next(self._temp_ids)
+
+    def optimistic_write(
+        self,
+        email: str,
+        write_fn: Callable[[], List[Dict[str, Any]]],
+        upserts: Optional[List[Dict[str, Any]]] = None,
+        deleted_ids: Optional[List[Any]] = None,
+        patches: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        """
+        Iškart pritaiko pakeitimą kešuotam vartotojo DataFrame ir fone vykdo
+        write_fn. upserts – pilnos eilutės, patches – {"id", tik pakeisti
+        stulpeliai}, uždedami ant kešuotų eilučių. write_fn grąžina serverio
+        eilutes, kurios turi būti kešė (trynimui – tuščią sąrašą). Jei serveris atmeta pakeitimą,
+        paliestos eilutės grąžinamos į ankstesnę būseną, o įrašas pažymimas
+        pasenusiu – dalinai pavykęs batch atsinaujins per delta sinchronizaciją.
+
+        Jei eilutės dar neįkeltos (serverio agregatų režimas), taikyti nėra
+        kam – laukiama, kol write_fn baigsis, kad rerun skaitytų naują
+        versiją, o ne seną pagal versiją kešuotą serverio kubą.
+        """
+        upserts = upserts or []
+        patches = patches or []
+        touched = [r["id"] for r in upserts + patches] + list(deleted_ids or [])
+        entry = self._entry(email)
+
+        with entry.lock:
+            if entry.df is None:
+                # Dar nieko neįkelta – nėra ko taikyti, kitas skaitymas parsiųs viską.
+                previous = None
+                entry.stale = True
+            else:
+                previous = entry.df[entry.df["id"].isin(touched)] if not entry.df.empty else entry.df
+                self._replace_rows(entry, set(touched), prepare_rows(upserts + _patched_rows(entry.df, patches)))
+                entry.version += 1
+            entry.pending += 1
+
+        future = self._writer.submit(email, write_fn)
+        if previous is None:
+            wait([future])
+            self._reconcile(email, future, touched, previous)
+        else:
+            future.add_done_callback(lambda f: self._reconcile(email, f, touched, previous))
+
+    def _reconcile(self, email: str, future: Future, touched: List[Any], previous: Optional[pd.DataFrame]) -> None:
+        entry = self._entry(email)
+        with entry.lock:
+            entry.pending -= 1
+            error = future.exception()
+            if error is not None:
+                entry.errors.append(str(error))
+
+            if entry.df is None or previous is None:
+                entry.stale = True
+            elif error is not None:
+                # Batch galėjo būti įrašytas dalinai – grąžiname ankstesnę būseną
+                # ir kitu skaitymu persisinchronizuojame: delta atneš tai, kas serveryje pakeista
+                self._replace_rows(entry, set(touched), previous)
+                entry.stale = True
+            else:
+                server_part = prepare_rows(future.result() or [])
+                if _matches_cached(entry.df, server_part):
+                    # Serveris patvirtino tai, kas jau rodoma – perimamas tik updated_at,
+                    # kad delta jų nelaikytų pakeitimu; versija nekeičiama
+                    entry.df = _with_updated_at(entry.df, server_part)
+                    return
+                drop_ids = set(touched)
+                if not server_part.empty:
+                    drop_ids.update(server_part["id"].tolist())
+                self._replace_rows(entry, drop_ids, server_part)
+            entry.version += 1
+            self._persist(email, entry)
+
+    def pop_errors(self, email: str) -> List[str]:
+        entry = self._entry(email)
+        with entry.lock:
+            errors, entry.errors = entry.errors, []
+        return errors
+
+    def pending(self, email: str) -> int:
+        return self._entry(email).pending
+
+    def version(self, email: str) -> int:
+        return self._entry(email).version
+
+    def stats(self, email: str) -> Dict[str, Any]:
+        entry = self._entry(email)
+        return {
+            "version": entry.version,
+            "hits": entry.hits,
+            "misses": entry.misses,
+            "rows": 0 if entry.df is None else len(entry.df),
+            "memory_bytes": 0 if entry.df is None else int(entry.df.memory_usage(deep=True).sum()),
+            "cached_users": len(self._entries),
+            "from_disk": entry.from_disk,
+        }
+
+    def last_load(self, email: str) -> Optional[LoadResult]:
+        return self._entry(email).last_load
+
+    def _finish_sync(self, email: str, entry: UserEntry) -> None:
+        entry.synced_at = time.monotonic()
+        entry.stale = False
+        # Į diską – tik jei nuo paskutinio įrašymo duomenys tikrai pasikeitė
+        if entry.version != entry.persisted_version:
+            self._persist(email, entry)
+
+    def _full_load(self, client: Client, email: str, entry: UserEntry) -> None:
+        result = load_all_rows(client, self.table, [("eq", "user_email", email)])
+        entry.last_load = result
+        entry.df = prepare_rows(result.rows)
+        entry.version += 1
+        entry.watermark = None
+        if "updated_at" in entry.df.columns and entry.df["updated_at"].notna().any():
+            entry.watermark = entry.df["updated_at"].max()
+        self._finish_sync(email, entry)
+
+    def _delta_sync(self, client: Client, email: str, entry: UserEntry) -> None:
+        if entry.watermark is None:
+            self._full_load(client, email, entry)
+            return
+
+        since = (entry.watermark - SYNC_OVERLAP).isoformat()
+        try:
+            res = (
+                client.table(self.table)
+                .select("*", count="exact")
+                .eq("user_email", email)
+                .gte("updated_at", since)
+                .execute()
+            )
+            changed = res.data or []
+            if res.count is not None and res.count > len(changed):
+                # Didelis pakeitimų kiekis (pvz. importas) nukirptas ties serverio max-rows
+                changed = load_all_rows(
+                    client,
+                    self.table,
+                    [("eq", "user_email", email), ("gte", "updated_at", since)],
+                ).rows
+            deleted = (
+                client.table(TOMBSTONE_TABLE)
+                .select("row_id")
+                .eq("user_email", email)
+                .gte("deleted_at", since)
+                .execute()
+                .data
+                or []
+            )
+        except Exception:
+            self._full_load(client, email, entry)
+            return
+
+        self._merge(entry, changed, [d["row_id"] for d in deleted])
+        self._finish_sync(email, entry)
+
+    def _merge(self, entry: UserEntry, changed: List[Dict[str, Any]], deleted_ids: List[Any]) -> bool:
+        """
+        Pritaiko delta rezultatą. Persidengimo lange grįžta ir jau turimos
+        eilutės – jos (tas pats id ir updated_at) bei tombstone'ai jau
+        nebesamiems id praleidžiami, o versija didinama tik tikram pakeitimui.
+        """
+        new_part = prepare_rows(changed)
+        if not new_part.empty and not entry.df.empty and "updated_at" in entry.df.columns:
+            cached_at = new_part["id"].map(entry.df.drop_duplicates("id").set_index("id")["updated_at"])
+            new_part = new_part[cached_at.isna() | cached_at.ne(new_part["updated_at"])]
+        drop_ids = set(deleted_ids) & set(entry.df["id"].tolist()) if deleted_ids and not entry.df.empty else set()
+
+        if new_part.empty and not drop_ids:
+            return False
+
+        entry.version += 1
+        if not new_part.empty:
+            drop_ids.update(new_part["id"].tolist())
+
+        self._replace_rows(entry, drop_ids, new_part)
+
+        new_wm = new_part["updated_at"].max() if "updated_at" in new_part.columns else None
+        if new_wm is not None and pd.notna(new_wm) and new_wm > entry.watermark:
+            entry.watermark = new_wm
+        return True
+
+    def _replace_rows(self, entry: UserEntry, drop_ids: set, new_part: Optional[pd.DataFrame]) -> None:
+        """
+        Pašalina drop_ids eilutes ir prideda new_part, rikiuodama tik tada,
+        kai naujos eilutės nepatenka į pabaigą. Visada sukuria naują
+        DataFrame, todėl kiti rerun'ai, laikantys seną nuorodą, jo nemato.
+        """
+        base = entry.df
+        if drop_ids and not base.empty:
+            base = base[~base["id"].isin(drop_ids)]
+
+        if new_part is None or new_part.empty:
+            entry.df = base.reset_index(drop=True)
+            return
+
+        if base.empty:
+            merged = new_part.sort_values("data", kind="stable", ignore_index=True)
+        else:
+            base, new_part = _align_categories(base, new_part)
+            merged = pd.concat([base, new_part], ignore_index=True)
+            # Dažniausiai nauji įrašai būna naujausi – tada rikiuoti nereikia.
+            if new_part["data"].min() < base["data"].max():
+                merged = merged.sort_values("data", kind="stable", ignore_index=True)
+
+        entry.df = merged
+
+
+def _patched_rows(df: pd.DataFrame, patches: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Kešuotos eilutės su uždėtais pakeitimais – žalios, kaip iš Supabase (prepare_rows įvestis)."""
+    if not patches or df.empty:
+        return []
+    by_id = {p["id"]: p for p in patches}
+    current = df[df["id"].isin(list(by_id))].drop(columns=[c for c in DERIVED_COLUMNS if c in df.columns])
+    current = current.assign(data=current["data"].dt.strftime("%Y-%m-%d"))
+    return [{**row, **by_id[row["id"]]} for row in current.to_dict("records")]
+
+
+def _matches_cached(df: pd.DataFrame, server_part: pd.DataFrame) -> bool:
+    """Ar serverio grąžintos eilutės sutampa su kešuotomis (be updated_at)."""
+    if server_part.empty:
+        return True
+    current = df.drop_duplicates("id").set_index("id")
+    if not server_part["id"].isin(current.index).all():
+        return False
+    cols = [c for c in server_part.columns if c in current.columns and c not in ("id", "updated_at")]
+    mine = current.loc[server_part["id"], cols].reset_index(drop=True).astype(object)
+    return mine.equals(server_part[cols].reset_index(drop=True).astype(object))
+
+
+def _with_updated_at(df: pd.DataFrame, server_part: pd.DataFrame) -> pd.DataFrame:
+    """Nauja kopija tomis pačiomis eilutėmis ir tvarka, tik su serverio updated_at."""
+    if server_part.empty or "updated_at" not in server_part.columns or "updated_at" not in df.columns:
+        return df
+    stamps = df["id"].map(server_part.drop_duplicates("id").set_index("id")["updated_at"])
+    return df.assign(updated_at=stamps.fillna(df["updated_at"]))
+
+
+def _align_categories(base: pd.DataFrame, new_part: pd.DataFrame):
+    """
+    Suvienodina categorical žodynus prieš concat – kitaip pandas
+    sujungtus stulpelius paverstų atgal į object.
+    """
+    base_updates, new_updates = {}, {}
+    for col in CATEGORICAL_COLUMNS:
+        if col not in base.columns or col not in new_part.columns:
+            continue
+        if not isinstance(base[col].dtype, pd.CategoricalDtype) or not isinstance(new_part[col].dtype, pd.CategoricalDtype):
+            continue
+        categories = base[col].cat.categories.union(new_part[col].cat.categories)
+        base_updates[col] = base[col].cat.set_categories(categories)
+        new_updates[col] = new_part[col].cat.set_categories(categories)
+    return base.assign(**base_updates), new_part.assign(**new_updates)
+
+
+@st.cache_resource(show_spinner=False)
+def get_user_store(table: str) -> UserDataStore:
+    return UserDataStore(table, disk=DiskCache.from_secrets(st.secrets.get("cache")))
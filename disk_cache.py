@@ -0,0 +1,178 @@
+# disk_cache.py
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import pandas as pd
+
+# Keičiant prepare_rows stulpelius – padidinti, kad seni failai būtų ignoruojami
+FORMAT_VERSION = 1
+
+DEFAULT_DIR = ".cache/biudzetas"
+DEFAULT_MAX_MB = 500
+# Tiek dienų nematyto vartotojo failai ištrinami
+DEFAULT_MAX_IDLE_DAYS = 30
+# Ilgai nematyti vartotojai tikrinami (katalogas skenuojamas) ne dažniau nei kas valandą
+EVICT_INTERVAL_SECONDS = 3600
+
+
+class DiskCache:
+    """
+    Paruoštas (prepare_rows) vartotojo DataFrame Parquet faile kartu su
+    sinchronizacijos watermark – kad po perkrovimo nereikėtų viso įkėlimo iš naujo.
+
+    Failų vardai – el. pašto maiša, ne pats adresas. Rašoma į laikiną failą ir
+    pervadinama, todėl nutrūkęs įrašymas nepalieka sugadinto failo. Failo mtime –
+    paskutinis kartas, kai vartotojas matytas: pagal jį išmetami seni ir, viršijus
+    dydžio ribą, seniausiai matyti vartotojai.
+
+    Užimama vieta skaičiuojama rašant ir trinant – katalogas skenuojamas tik
+    pirmą kartą ir išmetant (viršijus ribą ar kas EVICT_INTERVAL_SECONDS), ne kiekvienam stats().
+    """
+
+    def __init__(self, root: Path, max_bytes: int, max_idle_seconds: float):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.max_idle_seconds = max_idle_seconds
+        self._lock = threading.Lock()
+        self.evicted = 0
+        # Maiša → baitai (Parquet + JSON); None – dar neskenuota
+        self._sizes: Optional[Dict[str, int]] = None
+        self._evicted_at: Optional[float] = None
+
+    @classmethod
+    def from_secrets(cls, section: Optional[dict]) -> Optional["DiskCache"]:
+        """
+        Įjungiamas tik aiškiai (bendrame serveryje diske liktų vartotojų duomenys):
+
+        [cache]
+        enabled = true
+        dir = ".cache/biudzetas"
+        max_mb = 500
+        max_idle_days = 30
+        """
+        section = dict(section or {})
+        if not section.get("enabled", False):
+            return None
+        return cls(
+            Path(section.get("dir", DEFAULT_DIR)),
+            int(float(section.get("max_mb", DEFAULT_MAX_MB)) * 1024 * 1024),
+            float(section.get("max_idle_days", DEFAULT_MAX_IDLE_DAYS)) * 86400,
+        )
+
+    def _paths(self, table: str, email: str) -> Tuple[Path, Path]:
+        key = hashlib.sha256(f"{table}:{email}".encode()).hexdigest()[:32]
+        return self.root / f"{key}.parquet", self.root / f"{key}.json"
+
+    def load(self, table: str, email: str) -> Optional[Tuple[pd.DataFrame, Optional[pd.Timestamp]]]:
+        data_path, meta_path = self._paths(table, email)
+        try:
+            meta = json.loads(meta_path.read_text())
+            if meta.get("format") != FORMAT_VERSION:
+                return None
+            frame = pd.read_parquet(data_path)
+        except (OSError, ValueError):
+            return None
+        # Vartotojas matytas – atnaujiname mtime, kad nebūtų išmestas
+        now = time.time()
+        for path in (data_path, meta_path):
+            try:
+                os.utime(path, (now, now))
+            except OSError:
+                pass
+        watermark = pd.Timestamp(meta["watermark"]) if meta.get("watermark") else None
+        return frame, watermark
+
+    def save(self, table: str, email: str, frame: pd.DataFrame, watermark: Optional[pd.Timestamp]) -> None:
+        data_path, meta_path = self._paths(table, email)
+        with self._lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp = data_path.with_suffix(".parquet.tmp")
+            frame.to_parquet(tmp, index=False)
+            os.replace(tmp, data_path)
+            meta = {
+                "format": FORMAT_VERSION,
+                "watermark": watermark.isoformat() if watermark is not None else None,
+                "rows": len(frame),
+                "saved_at": time.time(),
+            }
+            tmp = meta_path.with_suffix(".json.tmp")
+            tmp.write_text(json.dumps(meta))
+            os.replace(tmp, meta_path)
+            sizes = self._tracked()
+            sizes[data_path.stem] = data_path.stat().st_size + meta_path.stat().st_size
+            evict_due = (
+                sum(sizes.values()) > self.max_bytes
+                or self._evicted_at is None
+                or time.monotonic() - self._evicted_at >= EVICT_INTERVAL_SECONDS
+            )
+        if evict_due:
+            self.evict()
+
+    def delete(self, table: str, email: str) -> None:
+        data_path, meta_path = self._paths(table, email)
+        with self._lock:
+            for path in (data_path, meta_path):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            self._tracked().pop(data_path.stem, None)
+
+    def _tracked(self) -> Dict[str, int]:
+        """Kviečiama laikant _lock. Katalogas skenuojamas tik pirmą kartą."""
+        if self._sizes is None:
+            self._sizes = {key: item["bytes"] for key, item in self._files().items()}
+        return self._sizes
+
+    def _files(self) -> Dict[str, Dict[str, Any]]:
+        """Maiša → {mtime, bytes, paths} – vienas įrašas vartotojui (Parquet + JSON)."""
+        files: Dict[str, Dict[str, Any]] = {}
+        if not self.root.exists():
+            return files
+        for path in self.root.iterdir():
+            if path.suffix not in (".parquet", ".json"):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            item = files.setdefault(path.stem, {"mtime": 0.0, "bytes": 0, "paths": []})
+            item["mtime"] = max(item["mtime"], stat.st_mtime)
+            item["bytes"] += stat.st_size
+            item["paths"].append(path)
+        return files
+
+    def evict(self) -> None:
+        with self._lock:
+            self._evicted_at = time.monotonic()
+            files = self._files()
+            now = time.time()
+            total = sum(f["bytes"] for f in files.values())
+            # Seniausiai matyti – pirmi
+            for key, item in sorted(files.items(), key=lambda kv: kv[1]["mtime"]):
+                if now - item["mtime"] < self.max_idle_seconds and total <= self.max_bytes:
+                    break
+                for path in item["paths"]:
+                    try:
+                        path.unlink()
+                    except OSError:
+                        pass
+                total -= item["bytes"]
+                del files[key]
+                self.evicted += 1
+            self._sizes = {key: item["bytes"] for key, item in files.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sizes = self._tracked()
+            return {
+                "users": len(sizes),
+                "bytes": sum(sizes.values()),
+                "max_bytes": self.max_bytes,
+                "evicted": self.evicted,
+            }
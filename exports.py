@@ -0,0 +1,53 @@
+# exports.py
+import io
+from dataclasses import dataclass
+
+import pandas as pd
+
+# Vidiniai stulpeliai, kurių vartotojui eksportuoti nereikia
+INTERNAL_COLUMNS = ["year", "month", "month_ts", "kat", "updated_at"]
+
+# Excel rašymas per openpyxl lėtas ir imlus atminčiai – didelėms istorijoms siūlome CSV / Parquet
+EXCEL_MAX_ROWS = 100_000
+
+
+@dataclass(frozen=True)
+class ExportFormat:
+    label: str
+    file_name: str
+    mime: str
+
+
+EXPORT_FORMATS = {
+    "csv": ExportFormat("CSV", "biudzetas.csv", "text/csv"),
+    "parquet": ExportFormat("Parquet", "biudzetas.parquet", "application/vnd.apache.parquet"),
+    "xlsx": ExportFormat(
+        "Excel",
+        "biudzetas.xlsx",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ),
+}
+
+
+def export_frame(df: pd.DataFrame) -> pd.DataFrame:
+    return df.drop(columns=[c for c in INTERNAL_COLUMNS if c in df.columns])
+
+
+def export_bytes(df: pd.DataFrame, fmt: str) -> bytes:
+    """Failo turinys pasirinktu formatu (csv / parquet / xlsx)."""
+    out = export_frame(df)
+    bio = io.BytesIO()
+
+    if fmt == "csv":
+        # utf-8-sig – kad Excel teisingai atidarytų lietuviškas raides
+        out.to_csv(bio, index=False, encoding="utf-8-sig", date_format="%Y-%m-%d")
+    elif fmt == "parquet":
+        # pyarrow ateina kartu su streamlit
+        out.to_parquet(bio, index=False)
+    elif fmt == "xlsx":
+        with pd.ExcelWriter(bio, engine="openpyxl") as writer:
+            out.to_excel(writer, index=False)
+    else:
+        raise ValueError(f"Nežinomas eksporto formatas: {fmt}")
+
+    return bio.getvalue()
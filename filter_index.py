@@ -0,0 +1,179 @@
+# filter_index.py
+import unicodedata
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from analytics import norm_category
+
+
+def _positions_by_value(series: pd.Series) -> Dict[Any, np.ndarray]:
+    """Reikšmė → surikiuotos eilučių pozicijos (vienas factorize + stabilus argsort)."""
+    codes, uniques = pd.factorize(series, sort=False)
+    order = np.argsort(codes, kind="stable")
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    # NaN (kodas -1) atsiduria pradžioje – praleidžiame
+    start = int((codes < 0).sum())
+    out: Dict[Any, np.ndarray] = {}
+    for value, cnt in zip(list(uniques), counts):
+        out[value] = order[start:start + cnt]
+        start += cnt
+    return out
+
+
+@dataclass
+class FilterIndex:
+    """
+    Šoninės juostos filtrų indeksas, kuriamas vieną kartą kiekvienai duomenų
+    versijai: kiekvienai metų / mėnesio / tipo / kategorijos reikšmei –
+    surikiuotos eilučių pozicijos. Filtruota peržiūra gaunama sankirta, be df.copy().
+    """
+
+    n_rows: int
+    by_year: Dict[Any, np.ndarray] = field(default_factory=dict)
+    by_month: Dict[Any, np.ndarray] = field(default_factory=dict)
+    by_tipas: Dict[Any, np.ndarray] = field(default_factory=dict)
+    by_category: Dict[Any, np.ndarray] = field(default_factory=dict)
+    by_merchant: Dict[Any, np.ndarray] = field(default_factory=dict)
+
+    @property
+    def categories(self) -> List[str]:
+        return list(self.by_category)
+
+    def positions(
+        self,
+        year: Any = None,
+        month: Any = None,
+        tipas: Any = None,
+        categories: Optional[List[str]] = None,
+        merchants: Optional[List[str]] = None,
+    ) -> Optional[np.ndarray]:
+        """
+        Eilučių pozicijos, tenkinančios visus nurodytus filtrus (None – filtro nėra).
+        categories ir merchants jungiami per ARBA (paieška kategorijoje ar vietoje).
+        Grąžina None, jei nė vienas filtras nenurodytas (t. y. visos eilutės).
+        """
+        parts = []
+        empty = np.empty(0, dtype=np.intp)
+        if year is not None:
+            parts.append(self.by_year.get(year, empty))
+        if month is not None:
+            parts.append(self.by_month.get(month, empty))
+        if tipas is not None:
+            parts.append(self.by_tipas.get(tipas, empty))
+        if categories is not None or merchants is not None:
+            found = [self.by_category[c] for c in categories or [] if c in self.by_category]
+            found += [self.by_merchant[m] for m in merchants or [] if m in self.by_merchant]
+            parts.append(np.unique(np.concatenate(found)) if found else empty)
+
+        if not parts:
+            return None
+        # Pradedame nuo mažiausio masyvo – sankirtos kaina priklauso nuo jo
+        parts.sort(key=len)
+        pos = parts[0]
+        for other in parts[1:]:
+            if len(pos) == 0:
+                break
+            pos = np.intersect1d(pos, other, assume_unique=True)
+        return pos
+
+
+def build_filter_index(df: pd.DataFrame) -> FilterIndex:
+    return FilterIndex(
+        n_rows=len(df),
+        by_year=_positions_by_value(df["year"]),
+        by_month=_positions_by_value(df["month"]),
+        by_tipas=_positions_by_value(df["tipas"]),
+        by_category=_positions_by_value(norm_category(df)),
+        by_merchant=_positions_by_value(df["prekybos_centras"]) if "prekybos_centras" in df.columns else {},
+    )
+
+
+def filtered_view(df: pd.DataFrame, pos: Optional[np.ndarray]) -> pd.DataFrame:
+    """Be filtrų grąžina patį df (be kopijos), kitaip – tik atrinktas eilutes."""
+    return df if pos is None else df.iloc[pos]
+
+
+# ======================================================
+# PAIEŠKA PAGAL UNIKALIAS REIKŠMES
+# ======================================================
+SEARCH_MODES = {
+    "contains": "Yra tekste",
+    "prefix": "Prasideda",
+    "fuzzy": "Apytiksliai (klaidos)",
+}
+FUZZY_CUTOFF = 0.75
+
+
+def fold_text(x: Any) -> str:
+    """Mažosios raidės be diakritikos: „Išlaidos“ → „islaidos“."""
+    decomposed = unicodedata.normalize("NFKD", str(x or "").strip().casefold())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+@dataclass
+class TextIndex:
+    """
+    Unikalių reikšmių (kategorijų ar vietų – dešimtys, šimtai) paieškos indeksas.
+    Užklausos kaina priklauso tik nuo unikalių reikšmių skaičiaus, ne nuo eilučių:
+    rastos reikšmės į eilutes grąžinamos per FilterIndex pozicijas.
+    """
+
+    values: List[Any] = field(default_factory=list)
+    folded: List[str] = field(default_factory=list)
+    # surikiuoti (folded, reikšmės nr.) prefiksų paieškai per bisect
+    sorted_keys: List[str] = field(default_factory=list)
+    sorted_ids: List[int] = field(default_factory=list)
+    # žodis → reikšmių numeriai (prefiksui ir apytikslei paieškai žodžio viduje)
+    tokens: Dict[str, List[int]] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def _prefix(self, keys: List[str], q: str) -> range:
+        return range(bisect_left(keys, q), bisect_right(keys, q + "\uffff"))
+
+    def match(self, query: str, mode: str = "contains") -> List[Any]:
+        q = fold_text(query)
+        if not q:
+            return list(self.values)
+
+        if mode == "prefix":
+            hit = {self.sorted_ids[i] for i in self._prefix(self.sorted_keys, q)}
+            # ir bet kurio žodžio pradžia („kuras“ randa „Automobilis kuras“)
+            for token, ids in self.tokens.items():
+                if token.startswith(q):
+                    hit.update(ids)
+        elif mode == "fuzzy":
+            hit = {i for i, f in enumerate(self.folded) if q in f}
+            for token, ids in self.tokens.items():
+                head = token[: len(q)]
+                if max(SequenceMatcher(None, q, token).ratio(), SequenceMatcher(None, q, head).ratio()) >= FUZZY_CUTOFF:
+                    hit.update(ids)
+        else:
+            hit = {i for i, f in enumerate(self.folded) if q in f}
+
+        return [self.values[i] for i in sorted(hit)]
+
+
+def build_text_index(values: Iterable[Any]) -> TextIndex:
+    distinct = [v for v in pd.unique(pd.Series(list(values), dtype=object)) if v is not None and not pd.isna(v)]
+    folded = [fold_text(v) for v in distinct]
+    order = sorted(range(len(folded)), key=folded.__getitem__)
+
+    tokens: Dict[str, List[int]] = {}
+    for i, f in enumerate(folded):
+        for token in set(f.split()):
+            tokens.setdefault(token, []).append(i)
+
+    return TextIndex(
+        values=distinct,
+        folded=folded,
+        sorted_keys=[folded[i] for i in order],
+        sorted_ids=order,
+        tokens=tokens,
+    )
@@ -0,0 +1,180 @@
+# http_transport.py
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import httpx
+import pandas as pd
+from supabase import Client
+
+# Histogramos krepšelių viršutinės ribos (ms); paskutinis krepšelis – viskas, kas ilgiau
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+@dataclass(frozen=True)
+class HttpSettings:
+    """
+    Bendro HTTP sluoksnio nustatymai. Keičiami secrets.toml:
+    [http]
+    connect_timeout = 5
+    read_timeout = 30
+    http2 = true
+    """
+
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+    write_timeout: float = 30.0
+    pool_timeout: float = 10.0
+    http2: bool = True
+    max_connections: int = 50
+    max_keepalive: int = 20
+    # httpx numatytai laiko laisvą ryšį tik 5 s – tarp rerun jis užsidarytų ir TLS vyktų iš naujo
+    keepalive_expiry: float = 120.0
+
+    @classmethod
+    def from_secrets(cls, section: Optional[dict]) -> "HttpSettings":
+        known = cls.__dataclass_fields__
+        return cls(**{k: v for k, v in dict(section or {}).items() if k in known})
+
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout,
+        )
+
+
+def endpoint_of(request: httpx.Request) -> str:
+    """„GET rest/v1/biudzetas“, „POST rest/v1/rpc/biudzetas_cube“, „POST auth/v1/token“."""
+    parts = [p for p in request.url.path.split("/") if p]
+    depth = 4 if len(parts) > 2 and parts[2] == "rpc" else 3
+    return f"{request.method} {'/'.join(parts[:depth])}"
+
+
+@dataclass
+class EndpointStats:
+    buckets: List[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS_MS) + 1))
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    errors: int = 0
+
+
+class LatencyHistogram:
+    """Kiekvieno endpoint'o atsakymo (iki antraščių) trukmės histograma."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, EndpointStats] = {}
+
+    def observe(self, endpoint: str, ms: float, error: bool = False) -> None:
+        idx = next((i for i, b in enumerate(LATENCY_BUCKETS_MS) if ms <= b), len(LATENCY_BUCKETS_MS))
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, EndpointStats())
+            stats.buckets[idx] += 1
+            stats.count += 1
+            stats.total_ms += ms
+            stats.max_ms = max(stats.max_ms, ms)
+            stats.errors += int(error)
+
+    def table(self) -> pd.DataFrame:
+        labels = [f"≤{b} ms" for b in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]} ms"]
+        with self._lock:
+            rows = [
+                {
+                    "Endpoint": endpoint,
+                    "Užklausų": s.count,
+                    "Vid. (ms)": round(s.total_ms / s.count, 1) if s.count else 0.0,
+                    "Maks. (ms)": round(s.max_ms, 1),
+                    "Klaidų": s.errors,
+                    **dict(zip(labels, s.buckets)),
+                }
+                for endpoint, s in sorted(self._stats.items())
+            ]
+        return pd.DataFrame(rows)
+
+
+class TimedTransport(httpx.BaseTransport):
+    """
+    Vienas bendras ryšių telkinys visiems klientams, su trukmės matavimu.
+    close() nieko nedaro: atskiras httpx.Client uždarydamas neturi uždaryti
+    ryšių, kuriais naudojasi kiti klientai.
+    """
+
+    def __init__(self, inner: httpx.BaseTransport, histogram: LatencyHistogram):
+        self._inner = inner
+        self.histogram = histogram
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            response = self._inner.handle_request(request)
+        except Exception:
+            self.histogram.observe(endpoint_of(request), (time.perf_counter() - started) * 1000, error=True)
+            raise
+        self.histogram.observe(
+            endpoint_of(request), (time.perf_counter() - started) * 1000, error=response.status_code >= 500
+        )
+        return response
+
+    def close(self) -> None:
+        pass
+
+
+class HttpLayer:
+    """Proceso lygio HTTP sluoksnis: nustatymai, bendras transportas ir histograma."""
+
+    def __init__(self, settings: HttpSettings):
+        self.settings = settings
+        self.histogram = LatencyHistogram()
+        self.transport = TimedTransport(
+            httpx.HTTPTransport(
+                http2=settings.http2,
+                limits=httpx.Limits(
+                    max_connections=settings.max_connections,
+                    max_keepalive_connections=settings.max_keepalive,
+                    keepalive_expiry=settings.keepalive_expiry,
+                ),
+                # Kartojamas tik nepavykęs prisijungimas, ne pati užklausa
+                retries=1,
+            ),
+            self.histogram,
+        )
+
+    def client(self, base_url: str = "", headers: Any = None) -> httpx.Client:
+        return httpx.Client(
+            base_url=base_url,
+            headers=headers,
+            timeout=self.settings.timeout(),
+            transport=self.transport,
+            follow_redirects=True,
+        )
+
+    def attach(self, client: Client) -> Client:
+        """
+        supabase-py 2.5 neleidžia perduoti savo httpx kliento, todėl PostgREST
+        sesija ir gotrue http klientas pakeičiami iškart sukūrus klientą
+        (antraštės, įskaitant Authorization, perkeliamos). Jei kitoje
+        bibliotekos versijoje šių atributų nėra, paliekami numatytieji klientai.
+        """
+        postgrest = client.postgrest
+        previous = getattr(postgrest, "session", None)
+        if isinstance(previous, httpx.Client):
+            postgrest.session = self.client(base_url=str(previous.base_url), headers=previous.headers)
+            previous.close()
+        self.attach_auth(client.auth)
+        return client
+
+    def attach_auth(self, auth) -> None:
+        """gotrue klientas ir jo admin API dalijasi tuo pačiu http klientu."""
+        admin = getattr(auth, "admin", None)
+        previous = getattr(auth, "_http_client", None)
+        if not isinstance(previous, httpx.Client) or not hasattr(admin, "_http_client"):
+            return
+        previous.close()
+        auth._http_client = admin._http_client = self.client()
+
+    def close(self) -> None:
+        self.transport._inner.close()
@@ -0,0 +1,218 @@
+# import_pipeline.py
+import io
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, IO, Iterator, List, Optional
+
+import pandas as pd
+
+CHUNK_ROWS = 2000
+BATCH_ROWS = 500
+
+# biudzetas laukai, kuriuos galima susieti su išrašo stulpeliais
+SCHEMA_FIELDS = ["data", "suma_eur", "tipas", "kategorija", "prekybos_centras", "aprasymas"]
+
+# Stulpelių pavadinimų užuominos automatiniam susiejimui (mažosiomis raidėmis)
+FIELD_HINTS = {
+    "data": ["data", "date", "operacijos data", "booking date"],
+    "suma_eur": ["suma", "amount", "suma eur", "suma_eur"],
+    "tipas": ["tipas", "d/k", "debit/credit", "type"],
+    "kategorija": ["kategorija", "category"],
+    "prekybos_centras": ["gavėjas", "mokėtojas", "gavejas", "prekybos", "merchant", "counterparty", "payee"],
+    "aprasymas": ["paskirtis", "aprašymas", "aprasymas", "description", "details"],
+}
+
+INCOME_MARKERS = {"k", "c", "cr", "credit", "kreditas"}
+EXPENSE_MARKERS = {"d", "db", "debit", "debetas"}
+
+
+@dataclass
+class ImportResult:
+    total_rows: int = 0
+    imported: int = 0
+    rejected: int = 0
+    warnings: int = 0
+    requests: int = 0
+    seconds: float = 0.0
+    rejected_sample: List[Dict[str, Any]] = field(default_factory=list)
+    # Importas nutrauktas dėl klaidos; imported rodo, kiek eilučių jau serveryje
+    error: Optional[str] = None
+
+
+def guess_mapping(columns: List[str]) -> Dict[str, Optional[str]]:
+    mapping: Dict[str, Optional[str]] = {}
+    lowered = {c: str(c).strip().casefold() for c in columns}
+    for fld, hints in FIELD_HINTS.items():
+        mapping[fld] = next((c for c, low in lowered.items() if any(h in low for h in hints)), None)
+    return mapping
+
+
+def iter_csv_chunks(file: IO, sep: str = ";", encoding: str = "utf-8", chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    # Savas TextIOWrapper, kad pandas baigęs neuždarytų įkelto failo (jį skaitome kelis kartus)
+    text = io.TextIOWrapper(file, encoding=encoding, newline="")
+    try:
+        # dtype=str – sumas ir datas išsiparsiname patys, kad nepriklausytų nuo lokalės
+        reader = pd.read_csv(
+            text,
+            sep=sep,
+            dtype=str,
+            keep_default_na=False,
+            chunksize=chunk_rows,
+            skipinitialspace=True,
+        )
+        for chunk in reader:
+            yield chunk
+    finally:
+        text.detach()
+
+
+def iter_xlsx_chunks(file: IO, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Skaito pirmą lapą read_only režimu – atmintyje tik vienas gabalas."""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(h) if h is not None else f"col_{i}" for i, h in enumerate(header)]
+
+        buffer: List[tuple] = []
+        for row in rows:
+            if all(v is None for v in row):
+                continue
+            buffer.append(row)
+            if len(buffer) >= chunk_rows:
+                yield pd.DataFrame(buffer, columns=columns)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=columns)
+    finally:
+        wb.close()
+
+
+def xlsx_row_count(file: IO) -> Optional[int]:
+    """Duomenų eilučių skaičius pagal lapo dimensiją (be antraštės); None, jei faile jos nėra."""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(file, read_only=True, data_only=True)
+    try:
+        max_row = wb.worksheets[0].max_row
+        return max(0, max_row - 1) if max_row else None
+    finally:
+        wb.close()
+
+
+def parse_amount(col: pd.Series, decimal: str = ",") -> pd.Series:
+    if pd.api.types.is_numeric_dtype(col):
+        return col.astype(float)
+    s = col.astype(str).str.replace(r"[\s €]", "", regex=True)
+    if decimal == ",":
+        s = s.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    else:
+        s = s.str.replace(",", "", regex=False)
+    return pd.to_numeric(s, errors="coerce")
+
+
+def map_chunk(
+    chunk: pd.DataFrame,
+    mapping: Dict[str, Optional[str]],
+    user_email: str,
+    decimal: str = ",",
+    dayfirst: bool = False,
+) -> pd.DataFrame:
+    """
+    Vektoriškai paverčia išrašo gabalą į biudzetas eilutes.
+    Eilutės be datos ar sumos atmetamos. Jei tipas nesusietas (ar neatpažintas),
+    jis nustatomas pagal sumos ženklą: neigiama – išlaidos.
+    """
+
+    def source(fld: str) -> pd.Series:
+        col = mapping.get(fld)
+        if col and col in chunk.columns:
+            return chunk[col]
+        return pd.Series("", index=chunk.index, dtype=object)
+
+    def text(fld: str) -> pd.Series:
+        return source(fld).fillna("").astype(str).str.strip()
+
+    dates = pd.to_datetime(source("data"), errors="coerce", dayfirst=dayfirst)
+    amounts = parse_amount(source("suma_eur"), decimal=decimal)
+
+    marker = text("tipas").str.casefold()
+    by_sign = pd.Series(pd.NA, index=chunk.index, dtype=object).where(amounts.isna(), "Pajamos").mask(amounts < 0, "Išlaidos")
+    tipas = (
+        pd.Series(pd.NA, index=chunk.index, dtype=object)
+        .mask(marker.str.startswith("paj") | marker.isin(INCOME_MARKERS), "Pajamos")
+        .mask(marker.str.startswith("išl") | marker.str.startswith("isl") | marker.isin(EXPENSE_MARKERS), "Išlaidos")
+        .fillna(by_sign)
+    )
+
+    out = pd.DataFrame(
+        {
+            "user_email": user_email,
+            "data": dates.dt.strftime("%Y-%m-%d"),
+            "tipas": tipas,
+            "kategorija": text("kategorija").replace("", "Nežinoma"),
+            "prekybos_centras": text("prekybos_centras"),
+            "aprasymas": text("aprasymas"),
+            "suma_eur": amounts.abs(),
+        }
+    )
+    return out[dates.notna() & amounts.notna()]
+
+
+def run_import(
+    chunks: Iterator[pd.DataFrame],
+    to_rows: Callable[[pd.DataFrame], pd.DataFrame],
+    validate: Callable[[pd.Series, pd.Series], pd.Series],
+    write: Callable[[List[Dict[str, Any]]], Any],
+    batch_rows: int = BATCH_ROWS,
+    on_progress: Optional[Callable[[ImportResult], None]] = None,
+    rejected_sample_size: int = 20,
+) -> ImportResult:
+    """
+    Apdoroja išrašą gabalais: to_rows → vektorinė validacija → write po
+    batch_rows eilučių. Atmintyje vienu metu laikomas tik vienas gabalas.
+    validate grąžina "ok" / "warning" / "error" kiekvienai eilutei;
+    "error" eilutės neimportuojamos. to_rows atmestos eilutės (be datos /
+    sumos) į rejected_sample patenka su išrašo stulpeliais.
+    Klaida (skaitymo ar write) importą nutraukia ir įrašoma į result.error.
+    """
+    result = ImportResult()
+    t0 = time.perf_counter()
+
+    def sample(rows: pd.DataFrame, reason: str) -> None:
+        room = rejected_sample_size - len(result.rejected_sample)
+        if room > 0 and not rows.empty:
+            result.rejected_sample.extend(rows.head(room).assign(**{"Priežastis": reason}).to_dict("records"))
+
+    try:
+        for chunk in chunks:
+            result.total_rows += len(chunk)
+            rows = to_rows(chunk)
+            result.rejected += len(chunk) - len(rows)
+            sample(chunk.loc[chunk.index.difference(rows.index)], "Be datos arba sumos")
+
+            status = validate(rows["tipas"], rows["kategorija"])
+            bad = rows[status == "error"]
+            result.rejected += len(bad)
+            result.warnings += int((status == "warning").sum())
+            sample(bad, "Kategorija netinka tipui")
+
+            records = rows[status != "error"].to_dict("records")
+            for start in range(0, len(records), batch_rows):
+                batch = records[start:start + batch_rows]
+                write(batch)
+                result.imported += len(batch)
+                result.requests += 1
+
+            if on_progress is not None:
+                on_progress(result)
+    except Exception as e:
+        # Jau įrašyti batch'ai serveryje lieka – imported rodo, kiek jų
+        result.error = str(e)
+    finally:
+        result.seconds = time.perf_counter() - t0
+    return result
@@ -0,0 +1,161 @@
+# projection.py
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+# Kiek mėnesių į priekį ieškoma, kada bus pasiekta tikslinė suma
+TARGET_HORIZON = 240
+
+# Monte Carlo: kelių skaičius ir rodomi procentiliai
+MC_PATHS = 10_000
+MC_PERCENTILES = (10, 50, 90)
+
+
+@dataclass
+class Projection:
+    """
+    Mėnesių 1..horizon prognozė. Visi masyvai ilgio horizon:
+    release – atsilaisvinusi suma, net – mėnesio likutis, balance – balansas mėnesio pabaigoje.
+    """
+
+    start_balance: float
+    release: np.ndarray
+    net: np.ndarray
+    balance: np.ndarray
+
+    @property
+    def horizon(self) -> int:
+        return len(self.balance)
+
+    def balance_at(self, months: Iterable[int]) -> List[Optional[float]]:
+        """Balansas po nurodyto mėnesių skaičiaus (None – už horizonto)."""
+        return [float(self.balance[m - 1]) if 1 <= m <= self.horizon else None for m in months]
+
+    def months_to(self, targets: Iterable[float], within: Optional[int] = None) -> List[Optional[int]]:
+        """
+        Pirmas mėnuo (iki within), kurio pabaigoje balansas >= tikslas (None – nepasiekiama).
+        Balansas gali ir mažėti, todėl ieškoma bėgančiame maksimume, kuris monotoniškas.
+        """
+        targets = np.asarray(list(targets), dtype=float)
+        balance = self.balance[:within] if within is not None else self.balance
+        if len(balance) == 0:
+            return [None] * len(targets)
+        running_max = np.maximum.accumulate(balance)
+        idx = np.searchsorted(running_max, targets, side="left")
+        return [int(i) + 1 if i < len(balance) else None for i in idx]
+
+
+def project(
+    start_balance: float,
+    monthly_net: float,
+    release_amount: float = 0.0,
+    release_month: int = 1,
+    horizon: int = TARGET_HORIZON,
+) -> Projection:
+    """
+    Vektorinė prognozė: kiekvieno mėnesio žingsnis = monthly_net (+ release_amount
+    nuo release_month), balansas = start_balance + kaupiamoji žingsnių suma.
+    cumsum sumuoja nuosekliai, todėl rezultatas sutampa su ciklu bal += žingsnis.
+    """
+    months = np.arange(1, horizon + 1)
+    release = np.where(months >= release_month, float(release_amount), 0.0)
+    net = float(monthly_net) + release
+    balance = np.cumsum(np.concatenate(([float(start_balance)], net)))[1:]
+    return Projection(start_balance=float(start_balance), release=release, net=net, balance=balance)
+
+
+@dataclass
+class MonteCarloResult:
+    """
+    Stochastinės prognozės santrauka: procentilių juostos kiekvienam mėnesiui
+    ir tikimybė, kad balansas per horizontą bent kartą pasieks kiekvieną tikslą.
+    """
+
+    paths: int
+    bands: Dict[int, np.ndarray] = field(default_factory=dict)
+    target_probability: List[float] = field(default_factory=list)
+
+
+def simulate(
+    start_balance: float,
+    monthly_net: float,
+    history_net: Sequence[float],
+    release_amount: float = 0.0,
+    release_month: int = 1,
+    horizon: int = 12,
+    targets: Iterable[float] = (),
+    n_paths: int = MC_PATHS,
+    seed: int = 0,
+) -> MonteCarloResult:
+    """
+    Bootstrap iš istorinių mėnesio likučių: kiekvieno kelio mėnesio likutis =
+    monthly_net + atsitiktinai paimtas istorinis nuokrypis nuo vidurkio.
+    Taigi centras – tas pats scenarijus kaip project(), o sklaida – tikra
+    mėnesių sklaida. Visi keliai skaičiuojami vienu (n_paths × horizon) masyvu.
+    Fiksuotas seed – kad tas pats scenarijus kiekviename rerun rodytų tą patį.
+    """
+    targets = np.asarray(list(targets), dtype=float)
+    history = np.asarray(history_net, dtype=float)
+    history = history[np.isfinite(history)]
+    residuals = history - history.mean() if len(history) >= 2 else np.zeros(1)
+
+    rng = np.random.default_rng(seed)
+    shocks = residuals[rng.integers(0, len(residuals), size=(n_paths, horizon))]
+
+    base = project(0.0, monthly_net, release_amount, release_month, horizon).net
+    balance = float(start_balance) + np.cumsum(base + shocks, axis=1)
+
+    bands = dict(zip(MC_PERCENTILES, np.percentile(balance, MC_PERCENTILES, axis=0)))
+    peak = balance.max(axis=1)
+    probability = [float((peak >= t).mean()) for t in targets]
+    return MonteCarloResult(paths=n_paths, bands=bands, target_probability=probability)
+
+
+# ======================================================
+# SCENARIJŲ TINKLELIS
+# ======================================================
+# Daugiau derinių vienu kartu neskaičiuojame – (deriniai × horizontas) masyvas auga greitai
+GRID_MAX_COMBOS = 5_000
+GRID_PARAMS = ("reduce_pct", "monthly_income_change", "recurring_extra_saving", "release_start_month")
+
+
+def scenario_net(base_income, base_expense, category_avg, income_change, reduce_pct, extra_saving):
+    """
+    Scenarijaus pajamos, išlaidos ir mėnesio likutis. Veikia ir su skaičiais,
+    ir su NumPy masyvais (tinkleliui) – formulė viena abiem atvejams.
+    """
+    income = np.maximum(0.0, base_income + income_change)
+    expense = np.maximum(0.0, base_expense - category_avg * (np.asarray(reduce_pct) / 100.0))
+    return income, expense, income - expense + extra_saving
+
+
+def project_many(
+    start_balance: float,
+    monthly_net,
+    release_amount,
+    release_month,
+    horizon: int,
+) -> np.ndarray:
+    """
+    project() daugeliui scenarijų vienu kartu: parametrai transliuojami į (k,),
+    grąžinamas (k, horizon) balansų masyvas. Eilutės sutampa su project().balance.
+    """
+    monthly_net, release_amount, release_month = np.broadcast_arrays(
+        np.atleast_1d(np.asarray(monthly_net, dtype=float)),
+        np.atleast_1d(np.asarray(release_amount, dtype=float)),
+        np.atleast_1d(np.asarray(release_month)),
+    )
+    months = np.arange(1, horizon + 1)
+    release = np.where(months[None, :] >= release_month[:, None], release_amount[:, None], 0.0)
+    net = monthly_net[:, None] + release
+    start = np.full((len(net), 1), float(start_balance))
+    return np.cumsum(np.concatenate((start, net), axis=1), axis=1)[:, 1:]
+
+
+def months_to_many(balance: np.ndarray, targets) -> np.ndarray:
+    """Kiekvienai eilutei – pirmas mėnuo, kai balansas >= jos tikslas (NaN – nepasiekiama)."""
+    reached = balance >= np.asarray(targets, dtype=float)[:, None]
+    first = reached.argmax(axis=1).astype(float) + 1
+    first[~reached.any(axis=1)] = np.nan
+    return first
@@ -0,0 +1,69 @@
+# server_aggregates.py
+from typing import Any, Dict, List, Tuple
+
+import pandas as pd
+from supabase import Client
+
+from analytics import CUBE_DIMS
+from bulk_loader import PAGE_SIZE
+
+# Postgres funkcijos iš sql/003_aggregates.sql
+CUBE_RPC = "biudzetas_cube"
+DAILY_BALANCE_RPC = "biudzetas_daily_balance"
+SMALL_EXPENSES_RPC = "biudzetas_small_expenses"
+
+
+def _rpc_rows(client: Client, func: str, params: Dict[str, Any], page_size: int = PAGE_SIZE) -> List[Dict[str, Any]]:
+    """
+    Visos RPC eilutės puslapiais (.range), nes PostgREST max-rows taikomas
+    ir funkcijoms. Pirmas užklausimas grąžina ir bendrą kiekį.
+    Client.rpc() supabase 2.5 neturi count parametro, todėl kviečiamas
+    tiesiai postgrest klientas.
+    """
+    res = client.postgrest.rpc(func, params, count="exact").range(0, page_size - 1).execute()
+    rows = list(res.data or [])
+    total = int(res.count) if res.count is not None else len(rows)
+
+    while len(rows) < total:
+        chunk = client.postgrest.rpc(func, params).range(len(rows), len(rows) + page_size - 1).execute().data or []
+        if not chunk:
+            break
+        rows.extend(chunk)
+    return rows
+
+
+def fetch_cube(client: Client, email: str) -> pd.DataFrame:
+    """
+    Serverio kubas – tie patys stulpeliai ir tipai kaip analytics.build_cube,
+    todėl visos analitikos sekcijos jį naudoja be pakeitimų.
+    """
+    rows = _rpc_rows(client, CUBE_RPC, {"p_email": email})
+    columns = CUBE_DIMS + ["suma_eur", "cnt", "data_min", "data_max"]
+    if not rows:
+        return pd.DataFrame(columns=columns)
+
+    cube = pd.DataFrame(rows, columns=columns)
+    cube["month_ts"] = pd.to_datetime(cube["month_ts"])
+    cube["year"] = cube["year"].astype(int)
+    cube["suma_eur"] = pd.to_numeric(cube["suma_eur"], errors="coerce").fillna(0.0)
+    cube["cnt"] = cube["cnt"].astype(int)
+    cube["data_min"] = pd.to_datetime(cube["data_min"])
+    cube["data_max"] = pd.to_datetime(cube["data_max"])
+    # Ta pati eilučių tvarka kaip lokalaus groupby (nepriklauso nuo DB collation)
+    return cube.sort_values(CUBE_DIMS, kind="stable").reset_index(drop=True)
+
+
+def fetch_daily_balance(client: Client, email: str) -> pd.DataFrame:
+    """Kaip analytics.daily_balance: data, signed, balansas."""
+    rows = _rpc_rows(client, DAILY_BALANCE_RPC, {"p_email": email})
+    daily = pd.DataFrame(rows, columns=["data", "signed", "balansas"])
+    daily["data"] = pd.to_datetime(daily["data"])
+    daily[["signed", "balansas"]] = daily[["signed", "balansas"]].apply(pd.to_numeric, errors="coerce").fillna(0.0)
+    return daily
+
+
+def fetch_small_expenses(client: Client, email: str, month: str, cap: float) -> Tuple[int, float]:
+    """Kaip analytics.small_expenses: (kiekis, suma)."""
+    data = client.rpc(SMALL_EXPENSES_RPC, {"p_email": email, "p_month": month, "p_cap": float(cap)}).execute().data or []
+    row = data[0] if data else {}
+    return int(row.get("cnt") or 0), float(row.get("total") or 0.0)
@@ -0,0 +1,58 @@
+-- 001_delta_sync.sql
+-- Delta sinchronizacijai: updated_at žyma + ištrintų eilučių žurnalas (tombstones).
+-- Paleisti Supabase SQL Editor'iuje vieną kartą.
+
+alter table public.biudzetas
+    add column if not exists updated_at timestamptz not null default now();
+
+create index if not exists biudzetas_user_updated_idx
+    on public.biudzetas (user_email, updated_at);
+
+create or replace function public.biudzetas_touch_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists biudzetas_touch_updated_at on public.biudzetas;
+create trigger biudzetas_touch_updated_at
+    before insert or update on public.biudzetas
+    for each row execute function public.biudzetas_touch_updated_at();
+
+create table if not exists public.biudzetas_tombstones (
+    row_id      bigint      primary key,
+    user_email  text        not null,
+    deleted_at  timestamptz not null default now()
+);
+
+create index if not exists biudzetas_tombstones_user_deleted_idx
+    on public.biudzetas_tombstones (user_email, deleted_at);
+
+create or replace function public.biudzetas_record_tombstone()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    insert into public.biudzetas_tombstones (row_id, user_email, deleted_at)
+    values (old.id, old.user_email, now())
+    on conflict (row_id) do update set deleted_at = excluded.deleted_at;
+    return old;
+end;
+$$;
+
+drop trigger if exists biudzetas_record_tombstone on public.biudzetas;
+create trigger biudzetas_record_tombstone
+    after delete on public.biudzetas
+    for each row execute function public.biudzetas_record_tombstone();
+
+alter table public.biudzetas_tombstones enable row level security;
+
+drop policy if exists "tombstones_select_own" on public.biudzetas_tombstones;
+create policy "tombstones_select_own" on public.biudzetas_tombstones
+    for select using (user_email = auth.jwt() ->> 'email');
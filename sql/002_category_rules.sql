@@ -0,0 +1,24 @@
+-- 002_category_rules.sql
+-- Automatinio kategorizavimo taisyklės (kiekvienas vartotojas mato tik savo).
+-- Paleisti Supabase SQL Editor'iuje vieną kartą.
+
+create table if not exists public.biudzetas_rules (
+    id          bigint generated by default as identity primary key,
+    user_email  text    not null,
+    kind        text    not null check (kind in ('merchant', 'prefix', 'keyword', 'amount')),
+    pattern     text    not null default '',
+    min_amount  numeric,
+    max_amount  numeric,
+    kategorija  text    not null
+);
+
+create index if not exists biudzetas_rules_user_idx
+    on public.biudzetas_rules (user_email);
+
+alter table public.biudzetas_rules enable row level security;
+
+drop policy if exists "rules_all_own" on public.biudzetas_rules;
+create policy "rules_all_own" on public.biudzetas_rules
+    for all
+    using (user_email = auth.jwt() ->> 'email')
+    with check (user_email = auth.jwt() ->> 'email');
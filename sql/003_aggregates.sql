@@ -0,0 +1,106 @@
+-- 003_aggregates.sql
+-- Agregatai serveryje: analitikai užtenka kelių šimtų eilučių vietoje visos lentelės.
+-- Funkcijos security invoker, todėl galioja biudzetas RLS taisyklės.
+-- Paleisti Supabase SQL Editor'iuje vieną kartą.
+
+create index if not exists biudzetas_user_data_idx
+    on public.biudzetas (user_email, data);
+
+-- Tas pats kubas kaip analytics.build_cube: (mėnuo, tipas, kategorija, vieta) → suma, kiekis, datos
+create or replace function public.biudzetas_cube(p_email text)
+returns table (
+    month_ts          date,
+    month             text,
+    year              int,
+    tipas             text,
+    kategorija        text,
+    prekybos_centras  text,
+    suma_eur          double precision,
+    cnt               bigint,
+    data_min          date,
+    data_max          date
+)
+language sql
+stable
+security invoker
+as $$
+    select
+        date_trunc('month', b.data)::date,
+        to_char(b.data, 'YYYY-MM'),
+        extract(year from b.data)::int,
+        coalesce(b.tipas, ''),
+        case
+            when coalesce(b.kategorija, '') = '' then 'Nežinoma'
+            else btrim(b.kategorija, E' \t\r\n')
+        end,
+        coalesce(b.prekybos_centras, ''),
+        sum(b.suma_eur)::double precision,
+        count(*),
+        min(b.data)::date,
+        max(b.data)::date
+    from public.biudzetas b
+    where b.user_email = p_email
+    -- NULL ir '' – viena grupė, kaip prepare_rows (fillna("")) kliento pusėje
+    group by
+        date_trunc('month', b.data)::date,
+        to_char(b.data, 'YYYY-MM'),
+        extract(year from b.data)::int,
+        coalesce(b.tipas, ''),
+        case
+            when coalesce(b.kategorija, '') = '' then 'Nežinoma'
+            else btrim(b.kategorija, E' \t\r\n')
+        end,
+        coalesce(b.prekybos_centras, '')
+    order by 1, 4, 5, 6;
+$$;
+
+-- Dienos srautas ir kaupiamasis balansas (analytics.daily_balance)
+create or replace function public.biudzetas_daily_balance(p_email text)
+returns table (
+    data      date,
+    signed    double precision,
+    balansas  double precision
+)
+language sql
+stable
+security invoker
+as $$
+    select
+        d.data,
+        d.signed,
+        sum(d.signed) over (order by d.data)
+    from (
+        select
+            b.data::date as data,
+            sum(case when b.tipas = 'Pajamos' then b.suma_eur else -b.suma_eur end)::double precision as signed
+        from public.biudzetas b
+        where b.user_email = p_email
+        group by 1
+    ) d
+    order by d.data;
+$$;
+
+-- Smulkios mėnesio išlaidos (analytics.small_expenses)
+create or replace function public.biudzetas_small_expenses(p_email text, p_month text, p_cap double precision)
+returns table (
+    cnt    bigint,
+    total  double precision
+)
+language sql
+stable
+security invoker
+as $$
+    select
+        count(*),
+        coalesce(sum(b.suma_eur), 0)::double precision
+    from public.biudzetas b
+    where b.user_email = p_email
+      and b.tipas = 'Išlaidos'
+      and b.data >= to_date(p_month || '-01', 'YYYY-MM-DD')
+      and b.data < to_date(p_month || '-01', 'YYYY-MM-DD') + interval '1 month'
+      and b.suma_eur <= p_cap;
+$$;
+
+grant execute on function public.biudzetas_cube(text) to authenticated;
+grant execute on function public.biudzetas_daily_balance(text) to authenticated;
+grant execute on function public.biudzetas_small_expenses(text, text, double precision) to authenticated;
@@ -0,0 +1,21 @@
+-- 004_saved_scenarios.sql
+-- Išsaugoti prognozės scenarijai (kiekvienas vartotojas mato tik savo).
+-- params – scenarijaus parametrai pagal SCENARIO_FIELDS (app.py).
+-- Paleisti Supabase SQL Editor'iuje vieną kartą.
+
+create table if not exists public.biudzetas_scenarios (
+    id          bigint generated by default as identity primary key,
+    user_email  text        not null,
+    name        text        not null,
+    params      jsonb       not null,
+    created_at  timestamptz not null default now(),
+    unique (user_email, name)
+);
+
+alter table public.biudzetas_scenarios enable row level security;
+
+drop policy if exists "scenarios_all_own" on public.biudzetas_scenarios;
+create policy "scenarios_all_own" on public.biudzetas_scenarios
+    for all
+    using (user_email = auth.jwt() ->> 'email')
+    with check (user_email = auth.jwt() ->> 'email');
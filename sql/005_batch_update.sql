@@ -0,0 +1,24 @@
+-- 005_batch_update.sql
+-- Redaktoriaus pakeitimai vienu kvietimu: p_rows – [{"id": ..., tik pakeisti stulpeliai}].
+-- Keičiamos tik esamos eilutės (ne upsert); grąžinamos atnaujintos – kurių nėra, tų negrąžina.
+-- Funkcija security invoker, todėl galioja biudzetas RLS taisyklės.
+-- Paleisti Supabase SQL Editor'iuje vieną kartą.
+
+create or replace function public.biudzetas_update_rows(p_rows jsonb)
+returns setof public.biudzetas
+language sql
+volatile
+security invoker
+as $$
+    update public.biudzetas b
+    set
+        data             = case when r ? 'data' then (r ->> 'data')::date else b.data end,
+        tipas            = case when r ? 'tipas' then r ->> 'tipas' else b.tipas end,
+        kategorija       = case when r ? 'kategorija' then r ->> 'kategorija' else b.kategorija end,
+        prekybos_centras = case when r ? 'prekybos_centras' then r ->> 'prekybos_centras' else b.prekybos_centras end,
+        aprasymas        = case when r ? 'aprasymas' then r ->> 'aprasymas' else b.aprasymas end,
+        suma_eur         = case when r ? 'suma_eur' then (r ->> 'suma_eur')::numeric else b.suma_eur end
+    from jsonb_array_elements(p_rows) as r
+    where b.id = (r ->> 'id')::bigint
+    returning b.*;
+$$;
@@ -0,0 +1,114 @@
+# tests/conftest.py
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from supabase import create_client
+
+# Moduliai gyvena repozitorijos šaknyje (šalia app.py)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# Kaip Supabase: PostgREST grąžina ne daugiau nei max-rows eilučių ir lentelėms, ir funkcijoms
+MAX_ROWS = 300
+ANON_KEY = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.c2ln"
+
+
+class PostgrestStandIn(BaseHTTPRequestHandler):
+    """
+    POST /rest/v1/rpc/<fn> ir GET /rest/v1/<lentelė> (eq/gte filtrai, order)
+    su offset/limit, max-rows ir Prefer: count=exact.
+    Duomenis (functions, tables) nustato testų moduliai.
+    """
+
+    protocol_version = "HTTP/1.1"
+    functions = {}
+    tables = {}
+    calls = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        url = urlparse(self.path)
+        fn = url.path.rsplit("/", 1)[-1]
+        self.calls.append((fn, body, self.headers.get("Prefer")))
+
+        if fn not in self.functions:
+            self._send(404, {"message": f"function {fn} not found"})
+            return
+        self._send_page(self.functions[fn], parse_qs(url.query))
+
+    def do_GET(self):
+        # postgrest-py siunčia tuščią JSON kūną ir GET užklausoms – nuskaitome, kad nesugadintų keep-alive
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        url = urlparse(self.path)
+        table = url.path.rsplit("/", 1)[-1]
+        query = parse_qs(url.query)
+        self.calls.append((table, {k: v[0] for k, v in query.items()}, self.headers.get("Prefer")))
+
+        if table not in self.tables:
+            self._send(404, {"message": f"relation {table} does not exist"})
+            return
+
+        rows = self.tables[table]
+        for col, values in query.items():
+            if col in ("select", "order", "offset", "limit"):
+                continue
+            op, value = values[0].split(".", 1)
+            if op == "eq":
+                rows = [r for r in rows if str(r[col]) == value]
+            elif op == "gte":
+                rows = [r for r in rows if str(r[col]) >= value]
+        for term in reversed(query.get("order", [""])[0].split(",")):
+            if term:
+                col, _, direction = term.partition(".")
+                rows = sorted(rows, key=lambda r: r[col], reverse=direction == "desc")
+        self._send_page(rows, query)
+
+    def _send_page(self, rows, query):
+        offset = int(query.get("offset", ["0"])[0])
+        limit = min(int(query.get("limit", [str(MAX_ROWS)])[0]), MAX_ROWS)
+        page = rows[offset:offset + limit]
+
+        headers = {}
+        if "count=exact" in (self.headers.get("Prefer") or ""):
+            shown = f"{offset}-{offset + len(page) - 1}" if page else "*"
+            headers["Content-Range"] = f"{shown}/{len(rows)}"
+        self._send(200, page, headers)
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture(scope="session")
+def postgrest():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PostgrestStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture(scope="session")
+def client(postgrest):
+    return create_client(f"http://127.0.0.1:{postgrest.server_port}", ANON_KEY)
+
+
+@pytest.fixture
+def stand_in():
+    """Švarūs stand-in duomenys ir užklausų sąrašas kiekvienam testui."""
+    PostgrestStandIn.functions.clear()
+    PostgrestStandIn.tables.clear()
+    PostgrestStandIn.calls.clear()
+    return PostgrestStandIn
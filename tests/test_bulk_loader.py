@@ -0,0 +1,113 @@
+# tests/test_bulk_loader.py
+import random
+
+import pytest
+
+from bulk_loader import _fetch_page, load_all_rows
+from data_store import TOMBSTONE_TABLE, UserDataStore
+
+TABLE = "biudzetas"
+EMAIL = "a@b.c"
+FILTERS = [("eq", "user_email", EMAIL)]
+
+
+def make_rows(count, start_id=1, email=EMAIL, updated_at="2024-01-01T00:00:00+00:00"):
+    # Daug eilučių su ta pačia data – tvarką tarp jų lemia tik id
+    rows = [
+        {
+            "id": start_id + i,
+            "user_email": email,
+            "data": f"2024-{i % 12 + 1:02d}-{i % 5 + 1:02d}",
+            "tipas": "Išlaidos",
+            "kategorija": f"K{i % 7}",
+            "prekybos_centras": f"P{i % 11}",
+            "aprasymas": "",
+            "suma_eur": i + 0.5,
+            "updated_at": updated_at,
+        }
+        for i in range(count)
+    ]
+    random.Random(count).shuffle(rows)
+    return rows
+
+
+def table_gets(stand_in):
+    return [query for name, query, _ in stand_in.calls if name == TABLE]
+
+
+def test_load_all_rows_pages_past_max_rows(client, stand_in):
+    stand_in.tables[TABLE] = make_rows(2500) + make_rows(40, start_id=5000, email="kitas@b.c")
+
+    result = load_all_rows(client, TABLE, FILTERS)
+
+    assert result.total == 2500
+    assert len(result.rows) == 2500
+    assert {r["id"] for r in result.rows} == set(range(1, 2501))
+    assert [p.rows for p in result.pages] == [1000, 1000, 500]
+    # count + po 4, 4 ir 2 užklausas kiekvienam 1000 eil. puslapiui (max-rows 300)
+    assert len(table_gets(stand_in)) == 1 + 4 + 4 + 2
+
+
+def test_load_all_rows_keeps_data_id_order_across_pages(client, stand_in):
+    stand_in.tables[TABLE] = make_rows(1300)
+
+    result = load_all_rows(client, TABLE, FILTERS, page_size=200, max_workers=4)
+
+    keys = [(r["data"], r["id"]) for r in result.rows]
+    assert keys == sorted(keys)
+    assert len(result.pages) == 7
+    assert all(query["order"] == "data,id" for query in table_gets(stand_in)[1:])
+
+
+def test_fetch_page_fills_short_pages(client, stand_in):
+    stand_in.tables[TABLE] = make_rows(750)
+
+    rows = _fetch_page(client, TABLE, FILTERS, 0, 699)
+
+    assert len(rows) == 700
+    assert [q["offset"] for q in table_gets(stand_in)] == ["0", "300", "600"]
+    # Paskutinė užklausa prašo tik likučio
+    assert table_gets(stand_in)[-1]["limit"] == "100"
+
+
+def test_fetch_page_stops_at_end_of_table(client, stand_in):
+    stand_in.tables[TABLE] = make_rows(750)
+
+    rows = _fetch_page(client, TABLE, FILTERS, 700, 1199)
+
+    assert len(rows) == 50
+    assert [q["offset"] for q in table_gets(stand_in)] == ["700", "750"]
+
+
+def test_delta_sync_pages_truncated_result(client, stand_in):
+    stand_in.tables[TABLE] = make_rows(100)
+    stand_in.tables[TOMBSTONE_TABLE] = []
+    store = UserDataStore(TABLE)
+
+    df, version = store.get_versioned(client, EMAIL)
+    assert len(df) == 100
+
+    # Importas: pakeitimų daugiau nei serverio max-rows
+    stand_in.tables[TABLE] += make_rows(450, start_id=1000, updated_at="2024-02-01T00:00:00+00:00")
+    stand_in.calls.clear()
+    store.invalidate(EMAIL)
+    df, new_version = store.get_versioned(client, EMAIL)
+
+    assert len(df) == 550
+    assert df["id"].is_unique
+    assert new_version == version + 1
+    delta, *paged = table_gets(stand_in)
+    assert "offset" not in delta and delta["updated_at"].startswith("gte.")
+    # Nukirptas delta rezultatas persiųstas per load_all_rows su tais pačiais filtrais
+    assert paged and all(q["updated_at"] == delta["updated_at"] for q in paged)
+    assert sum(1 for q in paged if "offset" in q) == 2
+
+
+@pytest.mark.parametrize("page_size", [299, 300, 301, 600])
+def test_load_all_rows_page_size_boundaries(client, stand_in, page_size):
+    stand_in.tables[TABLE] = make_rows(601)
+
+    result = load_all_rows(client, TABLE, FILTERS, page_size=page_size, max_workers=2)
+
+    expected = sorted(stand_in.tables[TABLE], key=lambda r: (r["data"], r["id"]))
+    assert [r["id"] for r in result.rows] == [r["id"] for r in expected]
@@ -0,0 +1,52 @@
+# tests/test_server_aggregates.py
+import pytest
+
+from server_aggregates import fetch_cube, fetch_daily_balance, fetch_small_expenses
+
+CUBE_ROWS = [
+    {
+        "month_ts": f"{2020 + i // 120}-{i % 12 + 1:02d}-01",
+        "month": f"{2020 + i // 120}-{i % 12 + 1:02d}",
+        "year": 2020 + i // 120,
+        "tipas": "Išlaidos" if i % 2 else "Pajamos",
+        "kategorija": f"K{i % 7}",
+        "prekybos_centras": f"P{i}",
+        "suma_eur": f"{i}.50",
+        "cnt": 1,
+        "data_min": "2020-01-01",
+        "data_max": "2020-01-31",
+    }
+    for i in range(750)
+]
+DAILY_ROWS = [{"data": f"2021-01-{d:02d}", "signed": 10.0, "balansas": 10.0 * d} for d in range(1, 29)]
+
+
+@pytest.fixture(autouse=True)
+def functions(stand_in):
+    stand_in.functions.update(
+        biudzetas_cube=CUBE_ROWS,
+        biudzetas_daily_balance=DAILY_ROWS,
+        biudzetas_small_expenses=[{"cnt": 3, "total": "12.25"}],
+    )
+
+
+def test_fetch_cube_pages_past_max_rows(client, stand_in):
+    cube = fetch_cube(client, "a@b.c")
+
+    assert len(cube) == len(CUBE_ROWS)
+    assert cube["prekybos_centras"].nunique() == len(CUBE_ROWS)
+    assert cube["suma_eur"].dtype == float
+    assert stand_in.calls[0] == ("biudzetas_cube", {"p_email": "a@b.c"}, "count=exact")
+    assert len(stand_in.calls) == 3
+
+
+def test_fetch_daily_balance(client):
+    daily = fetch_daily_balance(client, "a@b.c")
+
+    assert list(daily.columns) == ["data", "signed", "balansas"]
+    assert len(daily) == len(DAILY_ROWS)
+    assert daily["balansas"].iloc[-1] == pytest.approx(280.0)
+
+
+def test_fetch_small_expenses(client):
+    assert fetch_small_expenses(client, "a@b.c", "2021-01", 20.0) == (3, 12.25)